@@ -0,0 +1,478 @@
+#benchmark.py
+#Benchmark seluruh pipeline laporan dengan data sintetis di MySQL/MariaDB lokal
+#  python benchmark.py generate --scale 100k
+#  python benchmark.py run --scale 100k --repeat 3
+#  python benchmark.py render --rows 10,1000   # tanpa database
+#Butuh BENCH_DB_HOST, BENCH_DB_USERNAME, BENCH_DB_PASSWORD (server lokal, bukan produksi)
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime, timedelta
+import mysql.connector
+from dotenv import load_dotenv
+from db_operations import LOCATIONS
+from index_tool import check_schema, migration_ddl
+from metrics import drain_records
+from smtp_sink import SMTPSink
+
+# Load environment variables
+load_dotenv()
+
+# Number of BASTs per dealer database for each named scale
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+# Years of history generated back from the report date, enough for YoY windows
+HISTORY_DAYS = 3 * 365
+
+# Rows per INSERT batch while loading
+BATCH_SIZE = 5000
+
+# SPKs generated per chunk; a multiple of 20 so a DO never spans two chunks
+CHUNK_SIZE = 50_000
+
+RESULTS_FILE = "benchmark_results.jsonl"
+
+SCHEMA = [
+    """CREATE TABLE tbl_data_induk_karyawan (
+        nik VARCHAR(20) PRIMARY KEY,
+        nama_karyawan VARCHAR(100)
+    )""",
+    """CREATE TABLE tbl_data_induk_finance (
+        kode_finance VARCHAR(20) PRIMARY KEY,
+        nama_finance VARCHAR(100)
+    )""",
+    """CREATE TABLE tbl_data_induk_pelanggan (
+        pelanggan_id VARCHAR(20) PRIMARY KEY,
+        nama_pelanggan VARCHAR(100)
+    )""",
+    """CREATE TABLE tbl_data_induk_barang_motor (
+        data_id INT PRIMARY KEY,
+        kode_warna_lengkap VARCHAR(30),
+        nama_lengkap VARCHAR(100),
+        perk_notice DECIMAL(15,2)
+    )""",
+    """CREATE VIEW vi_data_induk_barang_motor AS
+        SELECT data_id, kode_warna_lengkap, nama_lengkap, perk_notice FROM tbl_data_induk_barang_motor""",
+    """CREATE TABLE tbl_spk (
+        kode_spk VARCHAR(20) PRIMARY KEY,
+        no_form_spk VARCHAR(20),
+        tgl_spk DATETIME,
+        cara_bayar VARCHAR(10),
+        kode_pelanggan_faktur VARCHAR(20),
+        kode_finance VARCHAR(20),
+        tenor INT,
+        kendaraan_warna_id INT,
+        sales VARCHAR(20),
+        supervisor VARCHAR(20),
+        harga_jual DECIMAL(15,2),
+        diskon DECIMAL(15,2),
+        nota_kredit DECIMAL(15,2),
+        komisi_makelar DECIMAL(15,2),
+        um_t_leasing DECIMAL(15,2),
+        uang_muka DECIMAL(15,2),
+        komisi_makelar_leasing DECIMAL(15,2),
+        promo_pusat DECIMAL(15,2),
+        perk_adm_wil DECIMAL(15,2),
+        saving DECIMAL(15,2)
+    )""",
+    """CREATE TABLE tbl_bast (
+        kode_bast VARCHAR(20) PRIMARY KEY,
+        kode_spk VARCHAR(20),
+        tgl_bast DATETIME,
+        no_rangka VARCHAR(30),
+        no_mesin VARCHAR(30)
+    )""",
+    """CREATE TABLE tbl_barang_masuk (
+        kode_bm VARCHAR(20) PRIMARY KEY,
+        no_do VARCHAR(20)
+    )""",
+    """CREATE TABLE tbl_sub_barang_masuk (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        kode_bm VARCHAR(20),
+        no_rangka VARCHAR(30)
+    )""",
+    """CREATE TABLE tbl_do_lengkap (
+        no_do VARCHAR(20),
+        kode_barang_lengkap VARCHAR(30),
+        harga_ppn DECIMAL(15,2),
+        PRIMARY KEY (no_do, kode_barang_lengkap)
+    )""",
+    """CREATE VIEW vi_do_lengkap AS
+        SELECT no_do, kode_barang_lengkap, harga_ppn FROM tbl_do_lengkap""",
+    """CREATE TABLE tbl_penagihan_leasing (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        kode_bast VARCHAR(20),
+        dp_gross DECIMAL(15,2),
+        subs_ahm DECIMAL(15,2),
+        main_dealer DECIMAL(15,2)
+    )""",
+]
+
+DROP = [
+    "DROP VIEW IF EXISTS vi_data_induk_barang_motor",
+    "DROP VIEW IF EXISTS vi_do_lengkap",
+] + [
+    f"DROP TABLE IF EXISTS {table}" for table in (
+        'tbl_data_induk_karyawan', 'tbl_data_induk_finance', 'tbl_data_induk_pelanggan',
+        'tbl_data_induk_barang_motor', 'tbl_spk', 'tbl_bast', 'tbl_barang_masuk',
+        'tbl_sub_barang_masuk', 'tbl_do_lengkap', 'tbl_penagihan_leasing',
+    )
+]
+
+
+def use_bench_database():
+    """Point connect_to_database() at the local benchmark server instead of production."""
+    host = os.getenv("BENCH_DB_HOST")
+    if not host:
+        print("BENCH_DB_HOST belum diatur. Benchmark hanya boleh dijalankan di server lokal.")
+        sys.exit(1)
+    if host == os.getenv("DB_HOST"):
+        print("BENCH_DB_HOST sama dengan DB_HOST. Benchmark tidak boleh dijalankan di database produksi.")
+        sys.exit(1)
+    os.environ["DB_HOST"] = host
+    os.environ["DB_USERNAME"] = os.getenv("BENCH_DB_USERNAME", "root")
+    os.environ["DB_PASSWORD"] = os.getenv("BENCH_DB_PASSWORD", "")
+
+
+def parse_scale(scale):
+    """Accept a named scale (10k, 100k, 1m) or a plain number of BASTs."""
+    return SCALES.get(scale.lower()) or int(scale)
+
+
+def insert_rows(cursor, table, columns, rows):
+    """Insert rows in batches of BATCH_SIZE."""
+    statement = (f"INSERT INTO {table} ({', '.join(columns)}) "
+                 f"VALUES ({', '.join(['%s'] * len(columns))})")
+    for start in range(0, len(rows), BATCH_SIZE):
+        cursor.executemany(statement, rows[start:start + BATCH_SIZE])
+
+
+def generate_database(database_name, bast_count, report_date, seed=42, with_indexes=True):
+    """
+    Create one dealer schema on the benchmark server and fill it with synthetic data.
+
+    BASTs are spread evenly over HISTORY_DAYS ending at report_date. About 60% are
+    credit sales with a leasing billing row, and 5% of SPKs have no BAST yet
+    (booked in the last 30 days); the others are booked up to two weeks before
+    their BAST.
+
+    Args:
+        database_name (str): Schema to (re)create
+        bast_count (int): Number of BASTs to generate
+        report_date (date): Last day that receives BASTs
+        seed (int): Random seed so every run generates the same data
+        with_indexes (bool): Also create the indexes index_tool.py recommends
+    """
+    rng = random.Random(f"{seed}-{database_name}")
+    conn = mysql.connector.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USERNAME"),
+        password=os.getenv("DB_PASSWORD"),
+    )
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{database_name}`")
+    cursor.execute(f"USE `{database_name}`")
+    for statement in DROP + SCHEMA:
+        cursor.execute(statement)
+
+    supervisors = [(f"SPV{i:03d}", f"Supervisor {i}") for i in range(1, 13)]
+    sales = [(f"SLS{i:03d}", f"Sales {i}") for i in range(1, 61)]
+    finances = [(f"FIN{i:02d}", name) for i, name in enumerate(
+        ['Adira Finance', 'FIF Group', 'Mandiri Utama Finance', 'BAF', 'WOM Finance', 'MCF'], 1)]
+    models = [(i, f"MDL{i:03d}-{rng.choice(['HTM', 'MRH', 'PTH', 'BRU'])}",
+               f"Model {i} {rng.choice(['CBS', 'ABS', 'STD', 'DLX'])}", rng.choice([0, 50000, 100000]))
+              for i in range(1, 41)]
+    insert_rows(cursor, 'tbl_data_induk_karyawan', ('nik', 'nama_karyawan'), supervisors + sales)
+    insert_rows(cursor, 'tbl_data_induk_finance', ('kode_finance', 'nama_finance'), finances)
+    insert_rows(cursor, 'tbl_data_induk_barang_motor',
+                ('data_id', 'kode_warna_lengkap', 'nama_lengkap', 'perk_notice'), models)
+
+    spk_count = int(bast_count * 1.05)
+    first_day = datetime.combine(report_date, datetime.min.time()) - timedelta(days=HISTORY_DAYS - 1)
+    bast_total = 0
+    # Generate and load in chunks so 1M-row scales do not have to fit in memory
+    for chunk_start in range(1, spk_count + 1, CHUNK_SIZE):
+        customers, spks, basts, bm_rows, sbm_rows, do_rows, leasing_rows = [], [], [], [], [], [], []
+        for n in range(chunk_start, min(chunk_start + CHUNK_SIZE, spk_count + 1)):
+            kode_spk = f"SPK{n:08d}"
+            model = rng.choice(models)
+            kredit = rng.random() < 0.6
+            harga_jual = rng.randrange(17_000_000, 45_000_000, 50_000)
+            customers.append((f"PLG{n:08d}", f"Pelanggan {n}"))
+            delivered = n <= bast_count
+            if delivered:
+                tgl_bast = first_day + timedelta(days=(n - 1) * HISTORY_DAYS // bast_count,
+                                                 seconds=rng.randrange(8 * 3600, 17 * 3600))
+                # Booked up to two weeks before delivery
+                tgl_spk = tgl_bast - timedelta(days=rng.randrange(0, 15), hours=rng.randrange(0, 8))
+            else:
+                tgl_spk = first_day + timedelta(days=HISTORY_DAYS - 1 - rng.randrange(0, 30),
+                                                seconds=rng.randrange(8 * 3600, 17 * 3600))
+            spks.append((
+                kode_spk, f"F{n:08d}", tgl_spk, 'KREDIT' if kredit else 'TUNAI', f"PLG{n:08d}",
+                rng.choice(finances)[0] if kredit else None, rng.choice([11, 17, 23, 29, 35]) if kredit else 0,
+                model[0], rng.choice(sales)[0], rng.choice(supervisors)[0], harga_jual,
+                rng.randrange(0, 1_500_000, 50_000), rng.randrange(0, 300_000, 50_000),
+                rng.randrange(0, 500_000, 50_000), rng.randrange(0, 3_000_000, 100_000) if kredit else 0,
+                rng.randrange(0, 3_000_000, 100_000) if kredit else 0, rng.randrange(0, 200_000, 50_000) if kredit else 0,
+                rng.randrange(0, 500_000, 50_000), rng.randrange(0, 100_000, 10_000), rng.randrange(0, 100_000, 10_000),
+            ))
+            if not delivered:
+                # Undelivered SPK, booked in the last 30 days
+                continue
+
+            kode_bast = f"BST{n:08d}"
+            no_rangka = f"MH1{n:014d}"
+            basts.append((kode_bast, kode_spk, tgl_bast, no_rangka, f"JM1{n:09d}"))
+
+            # Units arrive in deliveries of 20 frames per DO
+            kode_bm = f"BM{(n - 1) // 20:07d}"
+            no_do = f"DO{(n - 1) // 20:07d}"
+            if (n - 1) % 20 == 0:
+                bm_rows.append((kode_bm, no_do))
+            sbm_rows.append((kode_bm, no_rangka))
+            do_rows.append((no_do, model[1], harga_jual - rng.randrange(1_000_000, 3_000_000, 50_000)))
+            if kredit:
+                leasing_rows.append((kode_bast, rng.randrange(0, 2_000_000, 50_000),
+                                     rng.randrange(0, 500_000, 50_000), rng.randrange(0, 300_000, 50_000)))
+
+        # A DO lists each model once
+        do_rows = list({(no_do, kode): (no_do, kode, harga) for no_do, kode, harga in do_rows}.values())
+        insert_rows(cursor, 'tbl_data_induk_pelanggan', ('pelanggan_id', 'nama_pelanggan'), customers)
+        insert_rows(cursor, 'tbl_spk', (
+            'kode_spk', 'no_form_spk', 'tgl_spk', 'cara_bayar', 'kode_pelanggan_faktur', 'kode_finance', 'tenor',
+            'kendaraan_warna_id', 'sales', 'supervisor', 'harga_jual', 'diskon', 'nota_kredit',
+            'komisi_makelar', 'um_t_leasing', 'uang_muka', 'komisi_makelar_leasing', 'promo_pusat',
+            'perk_adm_wil', 'saving'), spks)
+        insert_rows(cursor, 'tbl_bast', ('kode_bast', 'kode_spk', 'tgl_bast', 'no_rangka', 'no_mesin'), basts)
+        insert_rows(cursor, 'tbl_barang_masuk', ('kode_bm', 'no_do'), bm_rows)
+        insert_rows(cursor, 'tbl_sub_barang_masuk', ('kode_bm', 'no_rangka'), sbm_rows)
+        insert_rows(cursor, 'tbl_do_lengkap', ('no_do', 'kode_barang_lengkap', 'harga_ppn'), do_rows)
+        insert_rows(cursor, 'tbl_penagihan_leasing', ('kode_bast', 'dp_gross', 'subs_ahm', 'main_dealer'), leasing_rows)
+        conn.commit()
+        bast_total += len(basts)
+
+    if with_indexes:
+        for statement in migration_ddl(database_name, check_schema(database_name)['missing']):
+            cursor.execute(statement)
+
+    conn.commit()
+    cursor.close()
+    conn.close()
+    print(f"{database_name}: {bast_total:,} BAST, {spk_count:,} SPK generated")
+
+
+def git_commit():
+    """Short hash of the checked out commit, so results can be compared across commits."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def summarize_timings(samples):
+    return {
+        'min_ms': round(min(samples), 2),
+        'median_ms': round(statistics.median(samples), 2),
+        'max_ms': round(max(samples), 2),
+    }
+
+
+def run_benchmark(scale_name, bast_count, repeat, report_date):
+    """
+    Time process_location_data for every location and the SPV report end to end.
+
+    Email goes to a local SMTP sink. Report state, history, staff identities,
+    the SPK cache and exports live in a temporary directory, the outbox is off
+    and unchanged reports are always sent, so every repeat renders and sends
+    and nothing is written to the production files. Results are printed and
+    appended to RESULTS_FILE as one JSON line.
+    """
+    # Imported after use_bench_database() so nothing touches production first
+    from vehicle_reporting import process_location_data
+    from spv_report import send_spv_report
+    from db_operations import clear_dimension_cache, spk_cache_file
+
+    sink = SMTPSink().start()
+    work_dir = tempfile.mkdtemp(prefix="m2-benchmark-")
+    os.environ.update({
+        'SMTP_SERVER': '127.0.0.1',
+        'SMTP_PORT': str(sink.port),
+        'SMTP_STARTTLS': '0',
+        'SENDER_EMAIL': 'benchmark@localhost',
+        'SENDER_PASSWORD': 'benchmark',
+        'EMAIL_RECIPIENTS': 'benchmark@localhost',
+        'SPK_CACHE_FILE': os.path.join(work_dir, 'spk_pipeline_cache.json'),
+        'REPORT_STATE_FILE': os.path.join(work_dir, 'report_state.json'),
+        'REPORT_HISTORY_FILE': os.path.join(work_dir, 'report_history.jsonl'),
+        'REPORT_UNCHANGED_MODE': 'send',
+        'REPORT_EXPORT_DIR': os.path.join(work_dir, 'exports'),
+        'STAFF_IDENTITY_FILE': os.path.join(work_dir, 'staff_identity.json'),
+        'OUTBOX_ENABLED': '0',
+        'OUTBOX_DIR': os.path.join(work_dir, 'outbox'),
+    })
+    # Not a scheduler slot: no report may be skipped as already sent
+    os.environ.pop('REPORT_SLOT_START', None)
+
+    samples = {}
+    phases = {}
+    start_date = report_date.replace(month=1, day=1).strftime('%Y-%m-%d')
+    end_date = report_date.strftime('%Y-%m-%d')
+    try:
+        for _ in range(repeat):
+            drain_records()
+            # Every run starts cold, as a scheduled run in a fresh process would
+            clear_dimension_cache()
+            if os.path.exists(spk_cache_file()):
+                os.remove(spk_cache_file())
+            for db_name, location_name in LOCATIONS:
+                start = time.perf_counter()
+                process_location_data(db_name, location_name, report_date)
+                samples.setdefault(f"process_location_data[{db_name}]", []).append(
+                    (time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            send_spv_report(start_date, end_date, ['benchmark@localhost'])
+            samples.setdefault("spv_report", []).append((time.perf_counter() - start) * 1000)
+
+            totals = {}
+            for record in drain_records():
+                totals[record['phase']] = totals.get(record['phase'], 0) + record['duration_ms']
+            for phase, total in totals.items():
+                phases.setdefault(phase, []).append(total)
+    finally:
+        sink.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    result = {
+        'ts': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'scale': scale_name,
+        'bast_per_database': bast_count,
+        'repeat': repeat,
+        'report_date': end_date,
+        'timings': {name: summarize_timings(values) for name, values in samples.items()},
+        'phases': {name: summarize_timings(values) for name, values in phases.items()},
+        'emails': len(sink.messages),
+        'email_bytes': sum(message['bytes'] for message in sink.messages),
+    }
+
+    print(f"{'Step':<40} {'min ms':>10} {'median ms':>10} {'max ms':>10}")
+    for name, timing in list(result['timings'].items()) + [(f"phase:{k}", v) for k, v in result['phases'].items()]:
+        print(f"{name:<40} {timing['min_ms']:>10.1f} {timing['median_ms']:>10.1f} {timing['max_ms']:>10.1f}")
+    print(f"{result['emails']} emails, {result['email_bytes']:,} bytes received by the SMTP sink")
+
+    with open(os.getenv("BENCH_RESULTS_FILE", RESULTS_FILE), "a", encoding="utf-8") as f:
+        f.write(json.dumps(result) + "\n")
+    return result
+
+
+def synthetic_spv_data(spv_count, seed=42):
+    """SPV performance rows for both locations, shaped like get_spv_performance() output."""
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(spv_count):
+        for db_name, location_name in LOCATIONS:
+            ytd = rnd.randint(0, 600)
+            mtd = rnd.randint(0, min(ytd, 80))
+            rows.append({
+                'nama_spv': f"SPV {i:04d}",
+                'today_do': rnd.randint(0, min(mtd, 6)),
+                'mtd_do': mtd,
+                'ytd_do': ytd,
+                'database_source': db_name,
+            })
+    return {'data': rows}
+
+
+def run_render_benchmark(row_counts, repeat):
+    """
+    Time format_spv_report for each SPV count, with a cold and a warm fragment cache.
+
+    Needs no database or SMTP server. Results are printed and appended to
+    RESULTS_FILE as one JSON line.
+    """
+    from spv_report import format_spv_report
+    from report_templates import clear_fragment_cache
+
+    samples = {}
+    sizes = {}
+    for count in row_counts:
+        spv_data = synthetic_spv_data(count)
+        for _ in range(repeat):
+            clear_fragment_cache()
+            start = time.perf_counter()
+            html = format_spv_report(spv_data, '2025-01-01', '2025-06-05')
+            samples.setdefault(f"format_spv_report[{count} spv, cold]", []).append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            format_spv_report(spv_data, '2025-01-01', '2025-06-05')
+            samples.setdefault(f"format_spv_report[{count} spv, cached]", []).append((time.perf_counter() - start) * 1000)
+        sizes[count] = len(html.encode('utf-8'))
+
+    result = {
+        'ts': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'benchmark': 'render',
+        'repeat': repeat,
+        'timings': {name: summarize_timings(values) for name, values in samples.items()},
+        'html_bytes': sizes,
+    }
+
+    print(f"{'Step':<40} {'min ms':>10} {'median ms':>10} {'max ms':>10}")
+    for name, timing in result['timings'].items():
+        print(f"{name:<40} {timing['min_ms']:>10.2f} {timing['median_ms']:>10.2f} {timing['max_ms']:>10.2f}")
+    for count, size in sizes.items():
+        print(f"{count} SPV: {size:,} bytes of HTML")
+
+    with open(os.getenv("BENCH_RESULTS_FILE", RESULTS_FILE), "a", encoding="utf-8") as f:
+        f.write(json.dumps(result) + "\n")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the report pipeline on synthetic data')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate = subparsers.add_parser('generate', help='Create and load the synthetic dealer databases')
+    generate.add_argument('--scale', default='10k', help='10k, 100k, 1m or a number of BASTs per database')
+    generate.add_argument('--seed', type=int, default=42, help='Random seed')
+    generate.add_argument('--no-indexes', action='store_true', help='Only create primary keys')
+
+    run = subparsers.add_parser('run', help='Time the report pipeline against the synthetic databases')
+    run.add_argument('--scale', default='10k', help='Scale the databases were generated with (for the results file)')
+    run.add_argument('--repeat', type=int, default=3, help='Number of timed repetitions')
+
+    render = subparsers.add_parser('render', help='Time report rendering only, no database needed')
+    render.add_argument('--rows', default='10,1000', help='Comma-separated SPV counts')
+    render.add_argument('--repeat', type=int, default=5, help='Number of timed repetitions')
+
+    for sub in (generate, run):
+        sub.add_argument('--date', help='Report date in YYYY-MM-DD format (default: today)')
+    args = parser.parse_args()
+
+    if args.command == 'render':
+        run_render_benchmark([int(count) for count in args.rows.split(",")], args.repeat)
+        return
+
+    use_bench_database()
+    report_date = datetime.strptime(args.date, '%Y-%m-%d').date() if args.date else datetime.now().date()
+    bast_count = parse_scale(args.scale)
+
+    if args.command == 'generate':
+        for db_name, location_name in LOCATIONS:
+            generate_database(db_name, bast_count, report_date, args.seed, not args.no_indexes)
+    else:
+        run_benchmark(args.scale, bast_count, args.repeat, report_date)
+
+
+if __name__ == "__main__":
+    main()
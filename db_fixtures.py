@@ -0,0 +1,175 @@
+#db_fixtures.py
+#Rekam hasil query ke file fixture dan putar ulang tanpa MySQL
+#  DB_FIXTURE_MODE=record python vehicle_reporting.py 05062025
+#  DB_FIXTURE_MODE=replay python vehicle_reporting.py 05062025
+#Folder fixture diatur dengan DB_FIXTURE_DIR (default: fixtures)
+
+import os
+import sys
+import gzip
+import json
+import hashlib
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+MANIFEST_FILE = "manifest.json"
+
+
+class FixtureNotFoundError(LookupError):
+    """Raised in replay mode when a query has no recorded result."""
+
+
+def mode():
+    """Current fixture mode: 'record', 'replay' or None when fixtures are off."""
+    value = os.getenv("DB_FIXTURE_MODE", "").lower()
+    return value if value in ("record", "replay") else None
+
+
+def is_replay():
+    return mode() == "replay"
+
+
+def fixture_dir():
+    return os.getenv("DB_FIXTURE_DIR", "fixtures")
+
+
+def fixture_key(database_name, query, params):
+    """Stable file name for one query, independent of whitespace in the SQL."""
+    normalized = " ".join(query.split())
+    raw = json.dumps([database_name, normalized, [str(p) for p in (params or ())]])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _encode(value):
+    """Encode a column value so Decimal and date types survive the JSON round trip."""
+    if isinstance(value, Decimal):
+        return {'$dec': str(value)}
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, timedelta):
+        return {'$td': value.total_seconds()}
+    if isinstance(value, (bytes, bytearray)):
+        return {'$bytes': bytes(value).hex()}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if '$dec' in value:
+            return Decimal(value['$dec'])
+        if '$dt' in value:
+            return datetime.fromisoformat(value['$dt'])
+        if '$date' in value:
+            return date.fromisoformat(value['$date'])
+        if '$td' in value:
+            return timedelta(seconds=value['$td'])
+        if '$bytes' in value:
+            return bytes.fromhex(value['$bytes'])
+    return value
+
+
+def _path(database_name, query, params):
+    return os.path.join(fixture_dir(), database_name, fixture_key(database_name, query, params) + ".json.gz")
+
+
+def save(database_name, query, params, name, rows):
+    """
+    Write a query's result set to its fixture file.
+
+    Rows are stored column-wise (one column list plus value lists) and gzipped,
+    which keeps fixtures for the full-row vehicle queries small.
+    """
+    path = _path(database_name, query, params)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    columns = list(rows[0].keys()) if rows else []
+    fixture = {
+        'database': database_name,
+        'name': name,
+        'params': [str(p) for p in (params or ())],
+        'columns': columns,
+        'rows': [[_encode(row[column]) for column in columns] for row in rows],
+    }
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(fixture, f, separators=(",", ":"))
+
+
+def load(database_name, query, params):
+    """Return the recorded rows of a query as dictionaries, like a dictionary cursor."""
+    path = _path(database_name, query, params)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            fixture = json.load(f)
+    except FileNotFoundError:
+        raise FixtureNotFoundError(
+            f"No fixture for {database_name} query with params {params} ({path}). "
+            f"Record it first with DB_FIXTURE_MODE=record."
+        ) from None
+    columns = fixture['columns']
+    return [dict(zip(columns, (_decode(value) for value in row))) for row in fixture['rows']]
+
+
+class ReplayCursor:
+    """Stands in for a dictionary cursor; queries are answered by execute_query() from fixtures."""
+
+    def close(self):
+        pass
+
+
+class ReplayConnection:
+    """Stands in for a MySQL connection while replaying fixtures."""
+
+    def __init__(self, database_name):
+        self.database = database_name
+
+    def cursor(self, *args, **kwargs):
+        return ReplayCursor()
+
+    def close(self):
+        pass
+
+
+def _job_name():
+    return os.path.basename(sys.argv[0]) or "interactive"
+
+
+def _read_manifest():
+    try:
+        with open(os.path.join(fixture_dir(), MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+_recorded_clock = {}
+
+
+def now():
+    """
+    Current time for report calculations.
+
+    In record mode the time is stored per script in the fixture manifest, and in
+    replay mode that stored time is returned instead. Date windows, query
+    parameters and the report footer then come out the same as in the recorded run.
+    """
+    current = mode()
+    if current == "replay":
+        if 'now' not in _recorded_clock:
+            recorded = _read_manifest().get(_job_name())
+            _recorded_clock['now'] = datetime.fromisoformat(recorded) if recorded else datetime.now()
+        return _recorded_clock['now']
+
+    value = datetime.now()
+    if current == "record" and 'now' not in _recorded_clock:
+        _recorded_clock['now'] = value
+        manifest = _read_manifest()
+        manifest[_job_name()] = value.isoformat()
+        os.makedirs(fixture_dir(), exist_ok=True)
+        with open(os.path.join(fixture_dir(), MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+    return _recorded_clock.get('now', value) if current == "record" else value
@@ -2,60 +2,28 @@
 
 import mysql.connector
 import os
+import json
 from datetime import datetime, timezone, timedelta
 from typing import Dict, Any
 from dotenv import load_dotenv
+from metrics import track, result_bytes
+import query_profiler
+import db_fixtures
 
 # Load environment variables
 load_dotenv()
 
-def connect_to_database(database_name="honda_mis"):
-    """Establish connection to the MySQL database.
-    
-    Args:
-        database_name (str): Name of the database to connect to. Default is "honda_mis".
-    """
-    return mysql.connector.connect(
-        host=os.getenv("DB_HOST"),
-        user=os.getenv("DB_USERNAME"),
-        password=os.getenv("DB_PASSWORD"),
-        database=database_name
-    )
+# Dealer databases the reports run against, with the location name used in reports
+LOCATIONS = [
+    ("honda_mis", "M2 Madiun"),
+    ("m2_magetan", "M2 Magetan"),
+]
 
-def get_vehicle_data(start_date: str, end_date: str, database_name="honda_mis") -> Dict[str, Any]:
-    """
-    Retrieve vehicle data from database for the specified date range.
-    
-    Args:
-        start_date (str): Start date in YYYY-MM-DD format
-        end_date (str): End date in YYYY-MM-DD format
-        database_name (str): Name of the database to connect to. Default is "honda_mis".
-    """
-    conn = connect_to_database(database_name)
-    cursor = conn.cursor(dictionary=True)
-    
-    # Choose the appropriate query based on the database
-    if database_name == "honda_mis":
-        # Original query for honda_mis
-        vehicle_query = """
-        SELECT 
-            bast.kode_bast, 
-            bast.tgl_bast,
-            spk.no_form_spk,
-            spk.cara_bayar,
-            mp.nama_pelanggan,
-            spk.kode_finance,
-            mf.nama_finance,
-            spk.tenor,
-            mb.kode_warna_lengkap,
-            mb.nama_lengkap,
-            bast.no_rangka,
-            bast.no_mesin,
-            mk_sales.nama_karyawan AS nama_sales,
-            mk_spv.nama_karyawan AS nama_spv,
-            spk.harga_jual,
-            IFNULL(dor.harga_ppn, 0) AS harga_tebus,
-            (
+# Margin per unit, as in vehicle_reporting.get_margin_summary();
+# m2_magetan and other databases lack subs_ahm, main_dealer and perk_adm_wil.
+# {perk_notice} is the model's perk_notice term, which needs the mb join
+_MARGIN_UNIT_TEMPLATE = {
+    "honda_mis": """
                 spk.harga_jual - (
                     IFNULL(dor.harga_ppn, 0) + 
                     spk.diskon + 
@@ -63,148 +31,383 @@ def get_vehicle_data(start_date: str, end_date: str, database_name="honda_mis")
                     spk.komisi_makelar +
                     IFNULL(pl.dp_gross, 0) - 
                     IFNULL(pl.subs_ahm, 0) - 
-                    IFNULL(pl.main_dealer, 0) - 
-                    IFNULL(mb.perk_notice, 0) +
+                    IFNULL(pl.main_dealer, 0){perk_notice} +
                     (spk.um_t_leasing - spk.uang_muka + spk.komisi_makelar_leasing) - 
                     spk.promo_pusat
-                ) - spk.perk_adm_wil + spk.saving
-            ) AS margin_unit
-        FROM tbl_spk AS spk 
-        INNER JOIN tbl_bast AS bast 
-            ON bast.kode_spk = spk.kode_spk 
-        LEFT JOIN tbl_data_induk_finance AS mf 
-            ON spk.kode_finance = mf.kode_finance 
-        INNER JOIN vi_data_induk_barang_motor AS mb 
-            ON spk.kendaraan_warna_id = mb.data_id 
-        INNER JOIN tbl_data_induk_pelanggan AS mp 
-            ON spk.kode_pelanggan_faktur = mp.pelanggan_id 
-        INNER JOIN tbl_data_induk_karyawan AS mk_sales 
-            ON spk.sales = mk_sales.nik 
-        INNER JOIN tbl_data_induk_karyawan AS mk_spv 
-            ON spk.supervisor = mk_spv.nik 
-        LEFT JOIN tbl_sub_barang_masuk AS sbm 
-            ON bast.no_rangka = sbm.no_rangka
-        LEFT JOIN tbl_barang_masuk AS bm 
-            ON sbm.kode_bm = bm.kode_bm
-        LEFT JOIN vi_do_lengkap AS dor 
-            ON bm.no_do = dor.no_do 
-            AND mb.kode_warna_lengkap = dor.kode_barang_lengkap
-        LEFT JOIN tbl_penagihan_leasing pl 
-            ON pl.kode_bast = bast.kode_bast
-        WHERE DATE_FORMAT(bast.tgl_bast, '%Y-%m-%d') BETWEEN %s AND %s
-        """
-    else:
-        # Modified query for m2_magetan and any other database without subs_ahm and main_dealer
-        vehicle_query = """
-        SELECT 
-            bast.kode_bast, 
-            bast.tgl_bast,
-            spk.no_form_spk,
-            spk.cara_bayar,
-            mp.nama_pelanggan,
-            spk.kode_finance,
-            mf.nama_finance,
-            spk.tenor,
-            mb.kode_warna_lengkap,
-            mb.nama_lengkap,
-            bast.no_rangka,
-            bast.no_mesin,
-            mk_sales.nama_karyawan AS nama_sales,
-            mk_spv.nama_karyawan AS nama_spv,
-            spk.harga_jual,
-            IFNULL(dor.harga_ppn, 0) AS harga_tebus,
-            (
+                ) - spk.perk_adm_wil + spk.saving""",
+    "default": """
                 spk.harga_jual - (
                     IFNULL(dor.harga_ppn, 0) + 
                     spk.diskon + 
                     spk.nota_kredit + 
                     spk.komisi_makelar +
-                    IFNULL(pl.dp_gross, 0) - 
-                    0 - /* Replace pl.subs_ahm with 0 */
-                    0 - /* Replace pl.main_dealer with 0 */
-                    IFNULL(mb.perk_notice, 0) +
+                    IFNULL(pl.dp_gross, 0){perk_notice} +
                     (spk.um_t_leasing - spk.uang_muka + spk.komisi_makelar_leasing) - 
                     spk.promo_pusat
-                ) - 0 + spk.saving /* Replace spk.perk_adm_wil with 0 */
-            ) AS margin_unit
-        FROM tbl_spk AS spk 
-        INNER JOIN tbl_bast AS bast 
-            ON bast.kode_spk = spk.kode_spk 
-        LEFT JOIN tbl_data_induk_finance AS mf 
-            ON spk.kode_finance = mf.kode_finance 
-        INNER JOIN vi_data_induk_barang_motor AS mb 
-            ON spk.kendaraan_warna_id = mb.data_id 
-        INNER JOIN tbl_data_induk_pelanggan AS mp 
-            ON spk.kode_pelanggan_faktur = mp.pelanggan_id 
-        INNER JOIN tbl_data_induk_karyawan AS mk_sales 
-            ON spk.sales = mk_sales.nik 
-        INNER JOIN tbl_data_induk_karyawan AS mk_spv 
-            ON spk.supervisor = mk_spv.nik 
-        LEFT JOIN tbl_sub_barang_masuk AS sbm 
-            ON bast.no_rangka = sbm.no_rangka
-        LEFT JOIN tbl_barang_masuk AS bm 
-            ON sbm.kode_bm = bm.kode_bm
-        LEFT JOIN vi_do_lengkap AS dor 
-            ON bm.no_do = dor.no_do 
-            AND mb.kode_warna_lengkap = dor.kode_barang_lengkap
-        LEFT JOIN tbl_penagihan_leasing pl 
-            ON pl.kode_bast = bast.kode_bast
-        WHERE DATE_FORMAT(bast.tgl_bast, '%Y-%m-%d') BETWEEN %s AND %s
-        """
+                ) + spk.saving""",
+}
+
+MARGIN_UNIT_SQL = {
+    key: sql.format(perk_notice=" - \n                    IFNULL(mb.perk_notice, 0)")
+    for key, sql in _MARGIN_UNIT_TEMPLATE.items()
+}
+
+# The same margin without perk_notice, for queries that leave the model to the
+# dimension cache; resolve_vehicle_rows() adds perk_notice per unit afterwards
+MARGIN_UNIT_SQL_NO_NOTICE = {
+    key: sql.format(perk_notice="")
+    for key, sql in _MARGIN_UNIT_TEMPLATE.items()
+}
+
+# Leasing billing columns the margin reads per database; m2_magetan and others lack subs_ahm and main_dealer
+LEASING_COLUMNS = {
+    "honda_mis": ("dp_gross", "subs_ahm", "main_dealer"),
+    "default": ("dp_gross",),
+}
+
+# Date filter most report queries put on tbl_bast; two placeholders, start and end date
+BAST_RANGE = "bast.tgl_bast >= %s AND bast.tgl_bast < DATE_ADD(%s, INTERVAL 1 DAY)"
+
+def unit_cost_joins(database_name, bast_filter=BAST_RANGE):
+    """
+    LEFT JOINs that attach the DO price (dor.harga_ppn) and the leasing billing (pl.*) to each BAST.
+
+    Joined directly, a frame received twice in tbl_sub_barang_masuk, a model
+    listed twice on a DO in vi_do_lengkap or a second billing row in
+    tbl_penagihan_leasing repeats the BAST row and inflates COUNT(*) and every
+    SUM. Here each source is first collapsed to one row per kode_bast in a
+    derived table, restricted to the BASTs matching bast_filter, so the derived
+    tables are no bigger than the report window. The outer query must join
+    tbl_spk AS spk and tbl_bast AS bast and can keep using dor.harga_ppn and pl.*.
+
+    Args:
+        database_name (str): Selects the columns from LEASING_COLUMNS
+        bast_filter (str): Condition on `bast`, the same as the outer WHERE
+
+    Returns:
+        str: SQL for the FROM clause; the placeholders of bast_filter appear twice, before the outer WHERE
+    """
+    leasing = ", ".join(f"MAX(pl.{column}) AS {column}"
+                        for column in LEASING_COLUMNS.get(database_name, LEASING_COLUMNS["default"]))
+    return f"""
+        LEFT JOIN (
+            /* One DO price per BAST, however often the frame was received */
+            SELECT bast.kode_bast, MAX(dor.harga_ppn) AS harga_ppn
+            FROM tbl_bast AS bast 
+            INNER JOIN tbl_spk AS spk 
+                ON bast.kode_spk = spk.kode_spk 
+            INNER JOIN vi_data_induk_barang_motor AS mb 
+                ON spk.kendaraan_warna_id = mb.data_id 
+            INNER JOIN tbl_sub_barang_masuk AS sbm 
+                ON bast.no_rangka = sbm.no_rangka
+            INNER JOIN tbl_barang_masuk AS bm 
+                ON sbm.kode_bm = bm.kode_bm
+            INNER JOIN vi_do_lengkap AS dor 
+                ON bm.no_do = dor.no_do 
+                AND mb.kode_warna_lengkap = dor.kode_barang_lengkap
+            WHERE {bast_filter}
+            GROUP BY bast.kode_bast
+        ) AS dor 
+            ON dor.kode_bast = bast.kode_bast
+        LEFT JOIN (
+            /* One leasing billing row per BAST */
+            SELECT pl.kode_bast, {leasing}
+            FROM tbl_bast AS bast 
+            INNER JOIN tbl_penagihan_leasing AS pl 
+                ON pl.kode_bast = bast.kode_bast
+            WHERE {bast_filter}
+            GROUP BY pl.kode_bast
+        ) AS pl 
+            ON pl.kode_bast = bast.kode_bast"""
+
+def connect_to_database(database_name="honda_mis"):
+    """Establish connection to the MySQL database.
     
+    Args:
+        database_name (str): Name of the database to connect to. Default is "honda_mis".
+    """
+    with track("connect", database_name):
+        if db_fixtures.is_replay():
+            return db_fixtures.ReplayConnection(database_name)
+        return mysql.connector.connect(
+            host=os.getenv("DB_HOST"),
+            user=os.getenv("DB_USERNAME"),
+            password=os.getenv("DB_PASSWORD"),
+            database=database_name,
+            connection_timeout=int(os.getenv("DB_CONNECT_TIMEOUT", "30"))
+        )
+
+def execute_query(cursor, query, params, database_name, name, fetch_one=False):
+    """
+    Execute a report query and record its latency, row count and result size.
+    
+    Args:
+        cursor: Dictionary cursor to execute on
+        query (str): SQL statement
+        params (tuple): Statement parameters
+        database_name (str): Database the cursor is connected to
+        name (str): Short description of the query for metrics and logs
+        fetch_one (bool): Fetch a single row instead of the full result set
+    """
+    fixture_mode = db_fixtures.mode()
+    profiling = query_profiler.is_enabled() and fixture_mode != "replay"
+    if profiling:
+        # The profiler must never break the report query itself
+        try:
+            examined_before = query_profiler.rows_examined(cursor)
+        except Exception as e:
+            print(f"Query profiler skipped for {name} ({database_name}): {e}")
+            profiling = False
+
+    with track("query", database_name, name) as record:
+        if fixture_mode == "replay":
+            rows = db_fixtures.load(database_name, query, params)
+        else:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+        record['rows'] = len(rows)
+        record['bytes'] = result_bytes(rows)
+
+    if fixture_mode == "record":
+        db_fixtures.save(database_name, query, params, name, rows)
+    if profiling:
+        try:
+            query_profiler.record(cursor, query, params, database_name, name,
+                                  record['duration_ms'], record['rows'], examined_before)
+        except Exception as e:
+            print(f"Query profiler failed for {name} ({database_name}): {e}")
+
+    if fetch_one:
+        return rows[0] if rows else None
+    return rows
+
+# Master tables resolved client-side instead of joined: name -> (table, key column, value columns)
+DIMENSIONS = {
+    'karyawan': ('tbl_data_induk_karyawan', 'nik', ('nama_karyawan',)),
+    'finance': ('tbl_data_induk_finance', 'kode_finance', ('nama_finance',)),
+    'motor': ('vi_data_induk_barang_motor', 'data_id', ('nama_lengkap', 'kode_warna_lengkap', 'perk_notice')),
+}
+
+# (database, dimension) -> {'rows': {key: row}, 'count': rows loaded, 'rechecked': bool}
+_dimension_cache = {}
+
+def _load_dimension(database_name, dimension):
+    table, key, columns = DIMENSIONS[dimension]
+    conn = connect_to_database(database_name)
+    cursor = conn.cursor(dictionary=True)
     try:
-        # Get vehicle data
-        cursor.execute(vehicle_query, (start_date, end_date))
-        results = cursor.fetchall()
-        
-        if not results:
-            empty_summary = {
-                'total_units': 0,
-                'total_value': 0,
-                'total_margin': 0,
-                'average_margin': 0,
-                'margin_percentage': 0,
-                'models_count': {},
-                'daily_stats': {},
-                'payment_methods': {
-                    'tunai': {'count': 0, 'margin': 0},
-                    'kredit': {'count': 0, 'margin': 0}
-                }
-            }
-            return {'data': [], 'summary': empty_summary}
+        rows = execute_query(cursor, f"SELECT {key}, {', '.join(columns)} FROM {table}", (),
+                             database_name, f"dimension {dimension}")
+    finally:
+        cursor.close()
+        conn.close()
+    entry = {'rows': {row[key]: row for row in rows}, 'count': len(rows), 'rechecked': False}
+    _dimension_cache[(database_name, dimension)] = entry
+    return entry
+
+def _dimension_count(database_name, dimension):
+    table = DIMENSIONS[dimension][0]
+    conn = connect_to_database(database_name)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        row = execute_query(cursor, f"SELECT COUNT(*) AS n FROM {table}", (), database_name,
+                            f"dimension {dimension} count", fetch_one=True)
+    finally:
+        cursor.close()
+        conn.close()
+    return row['n'] if row else 0
+
+def lookup_dimension(database_name, dimension, key):
+    """
+    Row of a master table by its key, from the in-process dimension cache.
+
+    Each master table in DIMENSIONS is loaded once per process and database.
+    The first key that is not found triggers one row-count check; if the table
+    grew or shrank since it was loaded (e.g. a new employee or model during the
+    run) it is loaded again. Later misses are treated as orphan keys.
+
+    Returns:
+        dict: The key and value columns of DIMENSIONS[dimension], or None
+    """
+    if key is None:
+        return None
+    entry = _dimension_cache.get((database_name, dimension)) or _load_dimension(database_name, dimension)
+    row = entry['rows'].get(key)
+    if row is None and not entry['rechecked']:
+        entry['rechecked'] = True
+        if _dimension_count(database_name, dimension) != entry['count']:
+            entry = _load_dimension(database_name, dimension)
+            entry['rechecked'] = True
+            row = entry['rows'].get(key)
+    return row
+
+def dimension_value(database_name, dimension, key, column):
+    """One column of lookup_dimension(), or None for an unknown key."""
+    row = lookup_dimension(database_name, dimension, key)
+    return row[column] if row else None
+
+def clear_dimension_cache():
+    """Forget all loaded master tables, e.g. between benchmark runs."""
+    _dimension_cache.clear()
+
+# Tenor buckets in months, as (upper bound, label); credit without a tenor goes to "Lainnya"
+TENOR_BUCKETS = [(12, "≤ 12 bln"), (24, "13-24 bln"), (36, "25-36 bln"), (None, "> 36 bln")]
+
+def tenor_bucket(tenor):
+    try:
+        months = int(tenor)
+    except (TypeError, ValueError):
+        return "Lainnya"
+    for upper, label in TENOR_BUCKETS:
+        if upper is None or months <= upper:
+            return label
+
+def resolve_vehicle_rows(rows, database_name):
+    """
+    Add the model and finance names to grouped vehicle rows from the dimension cache.
 
-        # Calculate summary statistics
-        total_units = len(results)
-        total_value = sum(float(row['harga_tebus'] or 0) for row in results)
-        total_margin = sum(float(row['margin_unit'] or 0) for row in results)
+    The vehicle query leaves the model's perk_notice out of the margin, so it
+    is added here per unit, as the joined query used to subtract it from the costs.
+    """
+    for row in rows:
+        model = lookup_dimension(database_name, 'motor', row['kendaraan_warna_id']) or {}
+        row['nama_lengkap'] = model.get('nama_lengkap')
+        row['kode_warna_lengkap'] = model.get('kode_warna_lengkap')
+        row['nama_finance'] = dimension_value(database_name, 'finance', row['kode_finance'], 'nama_finance')
+        row['margin'] = (row['margin'] or 0) + (model.get('perk_notice') or 0) * row['units']
+    return rows
+
+def summarize_vehicle_rows(rows):
+    """
+    Roll grouped vehicle rows (one per day, payment method, model colour, finance and tenor) up into the summary.
+
+    Used by get_vehicle_data() and by slice_vehicle_data() for sub-ranges of an
+    already fetched result.
+    """
+    total_units = 0
+    total_value = 0
+    total_margin = 0
+    payment_stats = {
+        'tunai': {'count': 0, 'margin': 0},
+        'kredit': {'count': 0, 'margin': 0}
+    }
+    models_count = {}
+    daily_stats = {}
+    finance_stats = {}
+    tenor_stats = {}
+    
+    for row in rows:
+        units = row['units']
+        value = float(row['harga_tebus'] or 0)
+        margin = float(row['margin'] or 0)
+        total_units += units
+        total_value += value
+        total_margin += margin
         
-        # Calculate payment method statistics
-        payment_stats = {
-            'tunai': {'count': 0, 'margin': 0},
-            'kredit': {'count': 0, 'margin': 0}
-        }
+        payment_type = row['cara_bayar'].lower() if row['cara_bayar'] else 'tunai'
+        if payment_type in payment_stats:
+            payment_stats[payment_type]['count'] += units
+            payment_stats[payment_type]['margin'] += margin
         
-        for row in results:
-            payment_type = row['cara_bayar'].lower() if row['cara_bayar'] else 'tunai'
-            if payment_type in payment_stats:
-                payment_stats[payment_type]['count'] += 1
-                payment_stats[payment_type]['margin'] += float(row['margin_unit'] or 0)
+        model = models_count.setdefault(row['nama_lengkap'], {'units': 0, 'value': 0, 'margin': 0, 'colors': {}})
+        model['units'] += units
+        model['value'] += value
+        model['margin'] += margin
+        colors = model['colors']
+        colors[row['kode_warna_lengkap']] = colors.get(row['kode_warna_lengkap'], 0) + units
         
-        # Create summary
-        summary = {
-            'total_units': total_units,
-            'total_value': total_value,
-            'total_margin': total_margin,
-            'average_margin': total_margin / total_units if total_units > 0 else 0,
-            'margin_percentage': (total_margin / total_value * 100) if total_value > 0 else 0,
-            'models_count': {},
-            'daily_stats': {},
-            'payment_methods': payment_stats
-        }
+        day = daily_stats.setdefault(str(row['tgl']), {'units': 0, 'value': 0, 'margin': 0, 'tunai': 0, 'kredit': 0})
+        day['units'] += units
+        day['value'] += value
+        day['margin'] += margin
+        if payment_type in payment_stats:
+            day[payment_type] += units
+        
+        # Leasing breakdown, credit sales only
+        if payment_type == 'kredit':
+            for stats, key in ((finance_stats, row.get('nama_finance') or "Lainnya"),
+                               (tenor_stats, tenor_bucket(row.get('tenor')))):
+                bucket = stats.setdefault(key, {'units': 0, 'margin': 0})
+                bucket['units'] += units
+                bucket['margin'] += margin
+    
+    return {
+        'total_units': total_units,
+        'total_value': total_value,
+        'total_margin': total_margin,
+        'average_margin': total_margin / total_units if total_units > 0 else 0,
+        'margin_percentage': (total_margin / total_value * 100) if total_value > 0 else 0,
+        'models_count': dict(sorted(models_count.items(), key=lambda item: item[1]['units'], reverse=True)),
+        'daily_stats': dict(sorted(daily_stats.items())),
+        'finance': dict(sorted(finance_stats.items(), key=lambda item: item[1]['units'], reverse=True)),
+        'tenor': {label: tenor_stats[label] for _, label in TENOR_BUCKETS + [(None, "Lainnya")] if label in tenor_stats},
+        'payment_methods': payment_stats
+    }
 
+def slice_vehicle_data(data, start, end):
+    """
+    Restrict a get_vehicle_data() result to the days start..end (dates, inclusive) without a query.
+
+    Lets one fetch over a wider window serve several periods, e.g. month-to-date and week-to-date.
+    """
+    rows = [row for row in data.get('data', []) if start <= row['tgl'] <= end]
+    return {'data': rows, 'summary': summarize_vehicle_rows(rows)}
+
+def get_vehicle_data(start_date: str, end_date: str, database_name="honda_mis") -> Dict[str, Any]:
+    """
+    Retrieve vehicle data from database for the specified date range.
+    
+    The database groups the sales by day, payment method, model colour
+    (kendaraan_warna_id), finance company (kode_finance) and tenor in the same
+    scan, so 'data' holds those grouped rows rather than one row per unit. The
+    query joins no master tables: model and finance names and the model's
+    perk_notice come from the dimension cache (resolve_vehicle_rows()). The
+    summary is rolled up from the resolved rows, including:
+        models_count: {nama_lengkap: {'units', 'value', 'margin', 'colors': {kode_warna_lengkap: units}}}
+        daily_stats: {'YYYY-MM-DD': {'units', 'value', 'margin', 'tunai', 'kredit'}}
+        finance: {nama_finance: {'units', 'margin'}} of credit sales
+        tenor: {TENOR_BUCKETS label: {'units', 'margin'}} of credit sales
+    
+    Args:
+        start_date (str): Start date in YYYY-MM-DD format
+        end_date (str): End date in YYYY-MM-DD format
+        database_name (str): Name of the database to connect to. Default is "honda_mis".
+    """
+    conn = connect_to_database(database_name)
+    cursor = conn.cursor(dictionary=True)
+    cost_joins = unit_cost_joins(database_name)
+    
+    margin_sql = MARGIN_UNIT_SQL_NO_NOTICE.get(database_name, MARGIN_UNIT_SQL_NO_NOTICE["default"])
+    vehicle_query = f"""
+    SELECT 
+        DATE(bast.tgl_bast) AS tgl,
+        spk.cara_bayar,
+        spk.kendaraan_warna_id,
+        spk.kode_finance,
+        spk.tenor,
+        COUNT(*) AS units,
+        SUM(IFNULL(dor.harga_ppn, 0)) AS harga_tebus,
+        SUM({margin_sql}
+        ) AS margin
+    FROM tbl_spk AS spk 
+    INNER JOIN tbl_bast AS bast 
+        ON bast.kode_spk = spk.kode_spk 
+    {cost_joins}
+    /* Range on the raw column so an index on tgl_bast can be used */
+    WHERE bast.tgl_bast >= %s AND bast.tgl_bast < DATE_ADD(%s, INTERVAL 1 DAY)
+    GROUP BY DATE(bast.tgl_bast), spk.cara_bayar, spk.kendaraan_warna_id, spk.kode_finance, spk.tenor
+    """
+    
+    try:
+        # Get vehicle data
+        # The range is bound three times: both derived tables of cost_joins, then the WHERE
+        results = execute_query(cursor, vehicle_query, (start_date, end_date) * 3,
+                                database_name, f"vehicle data {start_date}..{end_date}")
+        
+        results = resolve_vehicle_rows(results, database_name)
         return {
             'data': results,
-            'summary': summary
+            'summary': summarize_vehicle_rows(results)
         }
         
     except mysql.connector.Error as err:
@@ -219,6 +422,8 @@ def get_vehicle_data(start_date: str, end_date: str, database_name="honda_mis")
                 'margin_percentage': 0,
                 'models_count': {},
                 'daily_stats': {},
+                'finance': {},
+                'tenor': {},
                 'payment_methods': {
                     'tunai': {'count': 0, 'margin': 0},
                     'kredit': {'count': 0, 'margin': 0}
@@ -233,63 +438,102 @@ def get_spv_performance(start_date: str, end_date: str, database_name="honda_mis
     """
     Retrieve SPV performance data from database for the specified date range.
     
+    The query groups by SPV and salesperson NIK, so the sales leaderboard comes
+    from the same scan; their names are resolved from the dimension cache and
+    the SPV rows are rolled up from the salesperson rows. Entries stay per
+    NIK; build_spv_report() merges them per person.
+    DO counts are distinct BASTs, so the margin joins cannot inflate them.
+    
     Args:
         start_date (str): Start date in YYYY-MM-DD format
         end_date (str): End date in YYYY-MM-DD format
         database_name (str): Name of the database to connect to. Default is "honda_mis".
+    
+    Returns:
+        dict: {'data': [{'nik', 'nama_spv', 'today_do', 'mtd_do', 'ytd_do', 'today_margin', 'mtd_margin',
+              'ytd_margin', 'sales': [{'nik', 'nama_sales', same counts and margins}]}]}, one entry per
+              SPV NIK, highest total DO first
     """
     conn = connect_to_database(database_name)
     cursor = conn.cursor(dictionary=True)
     
     # Get current date for today's stats
-    today = datetime.now().strftime('%Y-%m-%d')
+    now = db_fixtures.now()
+    today = now.strftime('%Y-%m-%d')
     
     # Get first day of current month for MTD
-    first_day_of_month = datetime.now().replace(day=1).strftime('%Y-%m-%d')
+    first_day_of_month = now.replace(day=1).strftime('%Y-%m-%d')
     
     # Get first day of current year for YTD
-    first_day_of_year = datetime.now().replace(month=1, day=1).strftime('%Y-%m-%d')
+    first_day_of_year = now.replace(month=1, day=1).strftime('%Y-%m-%d')
     
-    spv_query = """
+    margin_sql = MARGIN_UNIT_SQL.get(database_name, MARGIN_UNIT_SQL["default"])
+    cost_joins = unit_cost_joins(database_name)
+    spv_query = f"""
     SELECT 
-        mk_spv.nama_karyawan AS nama_spv,
-        COUNT(*) as total_do,
-        SUM(CASE WHEN DATE_FORMAT(bast.tgl_bast, '%Y-%m-%d') = %s THEN 1 ELSE 0 END) as today_do,
-        SUM(CASE WHEN DATE_FORMAT(bast.tgl_bast, '%Y-%m-%d') BETWEEN %s AND %s THEN 1 ELSE 0 END) as mtd_do,
-        SUM(CASE WHEN DATE_FORMAT(bast.tgl_bast, '%Y-%m-%d') BETWEEN %s AND %s THEN 1 ELSE 0 END) as ytd_do
+        spk.supervisor,
+        spk.sales,
+        COUNT(DISTINCT bast.kode_bast) as total_do,
+        COUNT(DISTINCT CASE WHEN DATE_FORMAT(bast.tgl_bast, '%Y-%m-%d') = %s THEN bast.kode_bast END) as today_do,
+        COUNT(DISTINCT CASE WHEN DATE_FORMAT(bast.tgl_bast, '%Y-%m-%d') BETWEEN %s AND %s THEN bast.kode_bast END) as mtd_do,
+        COUNT(DISTINCT CASE WHEN DATE_FORMAT(bast.tgl_bast, '%Y-%m-%d') BETWEEN %s AND %s THEN bast.kode_bast END) as ytd_do,
+        SUM(CASE WHEN DATE_FORMAT(bast.tgl_bast, '%Y-%m-%d') = %s THEN {margin_sql}
+            ELSE 0 END) as today_margin,
+        SUM(CASE WHEN DATE_FORMAT(bast.tgl_bast, '%Y-%m-%d') BETWEEN %s AND %s THEN {margin_sql}
+            ELSE 0 END) as mtd_margin,
+        SUM(CASE WHEN DATE_FORMAT(bast.tgl_bast, '%Y-%m-%d') BETWEEN %s AND %s THEN {margin_sql}
+            ELSE 0 END) as ytd_margin
     FROM tbl_bast AS bast 
     INNER JOIN tbl_spk AS spk 
         ON bast.kode_spk = spk.kode_spk 
-    INNER JOIN tbl_data_induk_karyawan AS mk_spv 
-        ON spk.supervisor = mk_spv.nik 
-    WHERE DATE_FORMAT(bast.tgl_bast, '%Y-%m-%d') BETWEEN %s AND %s
-    GROUP BY mk_spv.nama_karyawan
+    LEFT JOIN vi_data_induk_barang_motor AS mb 
+        ON spk.kendaraan_warna_id = mb.data_id 
+        {cost_joins}
+    WHERE bast.tgl_bast >= %s AND bast.tgl_bast < DATE_ADD(%s, INTERVAL 1 DAY)
+    GROUP BY spk.supervisor, spk.sales
     ORDER BY total_do DESC
     """
     
     try:
-        # Get SPV performance data
-        cursor.execute(spv_query, (
+        # Get SPV and salesperson performance data
+        results = execute_query(cursor, spv_query, (
             today,  # For today's DO
             first_day_of_month, end_date,  # For MTD
             first_day_of_year, end_date,  # For YTD
+            today,  # For today's margin
+            first_day_of_month, end_date,  # For MTD margin
+            first_day_of_year, end_date,  # For YTD margin
+            start_date, end_date,  # For the DO price derived table
+            start_date, end_date,  # For the leasing derived table
             start_date, end_date  # For the main date range
-        ))
-        results = cursor.fetchall()
+        ), database_name, f"SPV performance {start_date}..{end_date}")
         
         if not results:
             return {'data': []}
             
-        # Format the results
-        formatted_results = []
+        # Roll the salesperson rows up per SPV NIK; rows arrive ordered by DO, so each SPV's sales stay ranked.
+        # Names come from the dimension cache; people are matched across NIKs and databases by staff_identity.
+        fields = ('today_do', 'mtd_do', 'ytd_do', 'today_margin', 'mtd_margin', 'ytd_margin')
+        spvs = {}
+        totals = {}
         for row in results:
-            formatted_results.append({
-                'nama_spv': row['nama_spv'],
-                'mtd_do': row['mtd_do'],
-                'ytd_do': row['ytd_do'],
-                'today_do': row['today_do']
-            })
+            nama_spv = dimension_value(database_name, 'karyawan', row['supervisor'], 'nama_karyawan')
+            if nama_spv is None:
+                # As with the former INNER JOIN, DOs without a known SPV are not listed
+                continue
+            counts = {field: row[field] or 0 for field in ('today_do', 'mtd_do', 'ytd_do')}
+            counts.update({field: float(row[field] or 0) for field in ('today_margin', 'mtd_margin', 'ytd_margin')})
+            spv = spvs.setdefault(row['supervisor'], {
+                'nik': row['supervisor'], 'nama_spv': nama_spv, **dict.fromkeys(fields, 0), 'sales': []})
+            for field in fields:
+                spv[field] += counts[field]
+            spv['sales'].append(dict(
+                nik=row['sales'],
+                nama_sales=dimension_value(database_name, 'karyawan', row['sales'], 'nama_karyawan'),
+                **counts))
+            totals[row['supervisor']] = totals.get(row['supervisor'], 0) + (row['total_do'] or 0)
             
+        formatted_results = sorted(spvs.values(), key=lambda spv: totals[spv['nik']], reverse=True)
         return {'data': formatted_results}
         
     except mysql.connector.Error as err:
@@ -297,4 +541,164 @@ def get_spv_performance(start_date: str, end_date: str, database_name="honda_mis
         return {'data': []}
     finally:
         cursor.close()
-        conn.close()
\ No newline at end of file
+        conn.close()
+def find_join_fanout(start_date: str, end_date: str, database_name="honda_mis"):
+    """
+    Diagnostic: BASTs whose cost sources hold more than one row and would multiply a direct join.
+
+    Counts, per BAST in the range, the receipts of its frame
+    (tbl_sub_barang_masuk), the DO lines those receipts match in vi_do_lengkap
+    and its leasing billing rows. The report queries collapse these with
+    unit_cost_joins(); joined directly, each BAST would appear `multiplier` times.
+
+    Args:
+        start_date (str): Start date in YYYY-MM-DD format
+        end_date (str): End date in YYYY-MM-DD format
+        database_name (str): Database to connect to
+
+    Returns:
+        list: {'kode_bast', 'tgl', 'no_rangka', 'receipts', 'do_lines', 'leasing_rows', 'multiplier'},
+              largest multiplier first
+    """
+    query = f"""
+    SELECT 
+        bast.kode_bast,
+        DATE(bast.tgl_bast) AS tgl,
+        bast.no_rangka,
+        (SELECT COUNT(*) FROM tbl_sub_barang_masuk AS sbm 
+            WHERE sbm.no_rangka = bast.no_rangka) AS receipts,
+        (SELECT COUNT(*) FROM tbl_sub_barang_masuk AS sbm 
+            INNER JOIN tbl_barang_masuk AS bm 
+                ON sbm.kode_bm = bm.kode_bm
+            INNER JOIN vi_do_lengkap AS dor 
+                ON bm.no_do = dor.no_do 
+                AND mb.kode_warna_lengkap = dor.kode_barang_lengkap
+            WHERE sbm.no_rangka = bast.no_rangka) AS do_lines,
+        (SELECT COUNT(*) FROM tbl_penagihan_leasing AS pl 
+            WHERE pl.kode_bast = bast.kode_bast) AS leasing_rows
+    FROM tbl_bast AS bast 
+    INNER JOIN tbl_spk AS spk 
+        ON bast.kode_spk = spk.kode_spk 
+    LEFT JOIN vi_data_induk_barang_motor AS mb 
+        ON spk.kendaraan_warna_id = mb.data_id 
+    WHERE {BAST_RANGE}
+    HAVING receipts > 1 OR do_lines > 1 OR leasing_rows > 1
+    """
+
+    conn = connect_to_database(database_name)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        rows = execute_query(cursor, query, (start_date, end_date), database_name,
+                             f"join fan-out {start_date}..{end_date}")
+    finally:
+        cursor.close()
+        conn.close()
+
+    for row in rows:
+        # Rows of the direct LEFT JOIN chain: the DO lines (at least one per receipt) times the billing rows
+        row['multiplier'] = max(row['do_lines'], row['receipts'], 1) * max(row['leasing_rows'], 1)
+    return sorted(rows, key=lambda row: row['multiplier'], reverse=True)
+
+# Counts returned per SPV by get_spk_pipeline()
+SPK_PIPELINE_FIELDS = ('today_spk', 'mtd_spk', 'backlog', 'delivered', 'lead_days')
+
+def spk_backlog_days():
+    """How far back an undelivered SPK still counts as backlog, from SPK_BACKLOG_DAYS (default 90)."""
+    return max(1, int(os.getenv("SPK_BACKLOG_DAYS", "90")))
+
+def spk_cache_file():
+    return os.getenv("SPK_CACHE_FILE", "spk_pipeline_cache.json")
+
+def _read_spk_cache():
+    try:
+        with open(spk_cache_file(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_spk_cache(cache_key, pipeline):
+    cache = _read_spk_cache()
+    cache[cache_key] = pipeline
+    path = spk_cache_file()
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def get_spk_pipeline(report_date, database_name="honda_mis", use_cache=True) -> Dict[str, Any]:
+    """
+    SPK orders booked, undelivered SPKs (backlog) and SPK-to-BAST lead time per SPV.
+
+    One query: tbl_spk over an indexed tgl_spk range, LEFT JOINed to the BASTs
+    delivered up to report_date. An SPK without a BAST is backlog; SPKs booked
+    more than SPK_BACKLOG_DAYS ago are outside the range and no longer count.
+    Lead time is measured over this month's deliveries whose SPK is inside the
+    range. A closed day's pipeline cannot change any more, so it is cached in
+    SPK_CACHE_FILE and not queried again (the cache is bypassed while fixtures
+    are recorded or replayed).
+
+    Args:
+        report_date (date): Day the pipeline is measured on
+        database_name (str): Database to connect to
+        use_cache (bool): Read and write SPK_CACHE_FILE for closed days
+
+    Returns:
+        dict: {'database': database_name,
+               'spvs': [{'nik', 'nama_spv', 'today_spk', 'mtd_spk', 'backlog', 'delivered', 'lead_days'}],
+               'summary': the same counts summed}, one entry per SPV NIK, highest backlog first;
+              None on a database error. nama_spv is None for a NIK without an employee row;
+              report_model.merge_spk_pipelines() resolves the NIKs to people.
+    """
+    cache_key = f"{database_name}|{report_date.isoformat()}"
+    closed = use_cache and report_date < db_fixtures.now().date() and db_fixtures.mode() is None
+    if closed:
+        cached = _read_spk_cache().get(cache_key)
+        if cached is not None:
+            return cached
+
+    month_start = report_date.replace(day=1)
+    window_start = min(month_start, report_date - timedelta(days=spk_backlog_days()))
+    query = """
+    SELECT 
+        spk.supervisor,
+        COUNT(DISTINCT CASE WHEN spk.tgl_spk >= %s THEN spk.kode_spk END) AS today_spk,
+        COUNT(DISTINCT CASE WHEN spk.tgl_spk >= %s THEN spk.kode_spk END) AS mtd_spk,
+        COUNT(DISTINCT CASE WHEN bast.kode_bast IS NULL THEN spk.kode_spk END) AS backlog,
+        COUNT(DISTINCT CASE WHEN bast.tgl_bast >= %s THEN bast.kode_bast END) AS delivered,
+        SUM(CASE WHEN bast.tgl_bast >= %s THEN DATEDIFF(bast.tgl_bast, spk.tgl_spk) ELSE 0 END) AS lead_days
+    FROM tbl_spk AS spk 
+    LEFT JOIN tbl_bast AS bast 
+        ON bast.kode_spk = spk.kode_spk 
+        AND bast.tgl_bast < DATE_ADD(%s, INTERVAL 1 DAY)
+    WHERE spk.tgl_spk >= %s AND spk.tgl_spk < DATE_ADD(%s, INTERVAL 1 DAY)
+    GROUP BY spk.supervisor
+    """
+    day, first = report_date.strftime('%Y-%m-%d'), month_start.strftime('%Y-%m-%d')
+    params = (day, first, first, first, day, window_start.strftime('%Y-%m-%d'), day)
+
+    conn = connect_to_database(database_name)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        rows = execute_query(cursor, query, params, database_name, f"SPK pipeline {params[5]}..{day}")
+    except mysql.connector.Error as err:
+        print(f"Database error in get_spk_pipeline ({database_name}): {err}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+    # SPV names come from the dimension cache; people are matched across NIKs by the staff identity map
+    spvs = [
+        {'nik': row['supervisor'],
+         'nama_spv': dimension_value(database_name, 'karyawan', row['supervisor'], 'nama_karyawan'),
+         **{field: int(row[field] or 0) for field in SPK_PIPELINE_FIELDS}}
+        for row in rows
+    ]
+    spvs.sort(key=lambda spv: spv['backlog'], reverse=True)
+    pipeline = {
+        'database': database_name,
+        'spvs': spvs,
+        'summary': {field: sum(spv[field] for spv in spvs) for field in SPK_PIPELINE_FIELDS},
+    }
+    if closed:
+        _write_spk_cache(cache_key, pipeline)
+    return pipeline
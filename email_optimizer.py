@@ -0,0 +1,469 @@
+#email_optimizer.py
+#Optimasi HTML email setelah render: CSS di-inline, rule yang tidak terpakai dibuang,
+#whitespace dipadatkan, dan ukuran dicek terhadap batas clip Gmail (~102 KB)
+#  python email_optimizer.py laporan.html [--output laporan.min.html]
+
+import os
+import re
+import argparse
+from html import escape
+from html.parser import HTMLParser
+from dotenv import load_dotenv
+from metrics import track
+
+# Load environment variables
+load_dotenv()
+
+# Gmail clips messages whose HTML is larger than about 102 KB
+DEFAULT_SIZE_BUDGET = 102_000
+
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "wbr"}
+
+# Interactive states and pseudo-elements have no meaning in a mail client; such rules are dropped
+DEAD_PSEUDOS = {"hover", "active", "focus", "visited", "link", "focus-within", "before", "after"}
+
+# Structural pseudo-classes that can be evaluated against the rendered tree
+STRUCTURAL_PSEUDOS = {"first-child", "last-child", "nth-child"}
+
+COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+COMPOUND_RE = re.compile(r"(?P<tag>[a-zA-Z][\w-]*|\*)|\.(?P<cls>[\w-]+)|#(?P<id>[\w-]+)"
+                         r"|(?P<colons>::?)(?P<pseudo>[\w-]+)(?:\((?P<arg>[^)]*)\))?")
+
+
+def is_enabled():
+    return os.getenv("EMAIL_OPTIMIZE", "1") != "0"
+
+
+def css_mode():
+    """'inline', 'style' or 'auto' (inline when it fits the budget and is not larger)."""
+    value = os.getenv("EMAIL_CSS_MODE", "auto").lower()
+    return value if value in ("inline", "style", "auto") else "auto"
+
+
+def size_budget():
+    return int(os.getenv("EMAIL_SIZE_BUDGET_BYTES", str(DEFAULT_SIZE_BUDGET)))
+
+
+class Node:
+    __slots__ = ("tag", "attrs", "children", "parent", "position", "siblings", "classes", "style")
+
+    def __init__(self, tag, attrs, parent):
+        self.tag = tag
+        self.attrs = dict(attrs)
+        self.children = []
+        self.parent = parent
+        self.position = 1
+        self.siblings = 1
+        self.classes = set((self.attrs.get("class") or "").split())
+        self.style = []
+
+
+class _TreeBuilder(HTMLParser):
+    """Parses the report HTML into Node objects; text stays as plain strings."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node("#root", (), None)
+        self.doctype = None
+        self.stack = [self.root]
+
+    def handle_decl(self, decl):
+        self.doctype = decl
+
+    def handle_starttag(self, tag, attrs):
+        node = Node(tag, attrs, self.stack[-1])
+        self.stack[-1].children.append(node)
+        if tag not in VOID_TAGS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self.stack[-1].children.append(Node(tag, attrs, self.stack[-1]))
+
+    def handle_endtag(self, tag):
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                del self.stack[i:]
+                return
+
+    def handle_data(self, data):
+        self.stack[-1].children.append(data)
+
+
+def _index_siblings(node):
+    elements = [child for child in node.children if isinstance(child, Node)]
+    for position, child in enumerate(elements, 1):
+        child.position = position
+        child.siblings = len(elements)
+        _index_siblings(child)
+
+
+def _elements(node):
+    for child in node.children:
+        if isinstance(child, Node):
+            yield child
+            yield from _elements(child)
+
+
+def parse_css(css):
+    """
+    Split a stylesheet into rules.
+
+    Returns a list of (selector_text, declarations_text) for plain rules and
+    (at_rule_prelude, [rules]) for blocks such as @media.
+    """
+    css = COMMENT_RE.sub("", css)
+    rules = []
+    i = 0
+    while True:
+        brace = css.find("{", i)
+        if brace == -1:
+            return rules
+        prelude = css[i:brace].strip()
+        if prelude.startswith("@"):
+            depth, j = 1, brace + 1
+            while depth and j < len(css):
+                depth += {"{": 1, "}": -1}.get(css[j], 0)
+                j += 1
+            rules.append((prelude, parse_css(css[brace + 1:j - 1])))
+            i = j
+        else:
+            end = css.find("}", brace)
+            end = len(css) if end == -1 else end
+            rules.append((prelude, css[brace + 1:end].strip()))
+            i = end + 1
+
+
+def parse_declarations(text):
+    """Return [(property, value, important)] for a declaration block or style attribute."""
+    declarations = []
+    for part in text.split(";"):
+        name, sep, value = part.partition(":")
+        if not sep or not name.strip():
+            continue
+        value = " ".join(value.split())
+        important = value.lower().endswith("!important")
+        if important:
+            value = value[:-len("!important")].rstrip()
+        declarations.append((name.strip().lower(), value, important))
+    return declarations
+
+
+def parse_selector(text):
+    """
+    Parse one selector into [(combinator, compound)], leftmost first.
+
+    A compound is a dict with tag, classes, ids and pseudos. Returns None when the
+    selector uses syntax this module does not evaluate (attribute selectors, ~, +).
+    """
+    chain = []
+    combinator = None
+    for token in re.split(r"\s*(>)\s*|\s+", text.strip()):
+        if not token:
+            continue
+        if token == ">":
+            combinator = ">"
+            continue
+        compound = {'tag': None, 'classes': [], 'ids': [], 'pseudos': []}
+        pos = 0
+        for match in COMPOUND_RE.finditer(token):
+            if match.start() != pos:
+                return None
+            pos = match.end()
+            if match.group('tag'):
+                compound['tag'] = match.group('tag').lower()
+            elif match.group('cls'):
+                compound['classes'].append(match.group('cls'))
+            elif match.group('id'):
+                compound['ids'].append(match.group('id'))
+            else:
+                compound['pseudos'].append((match.group('pseudo').lower(), (match.group('arg') or "").strip()))
+        if pos != len(token):
+            return None
+        chain.append((combinator or " ", compound))
+        combinator = None
+    return chain or None
+
+
+def specificity(chain):
+    ids = sum(len(compound['ids']) for _, compound in chain)
+    classes = sum(len(compound['classes']) + len(compound['pseudos']) for _, compound in chain)
+    tags = sum(1 for _, compound in chain if compound['tag'] not in (None, "*"))
+    return ids, classes, tags
+
+
+def _nth(position, arg):
+    if arg == "odd":
+        return position % 2 == 1
+    if arg == "even":
+        return position % 2 == 0
+    return arg.isdigit() and position == int(arg)
+
+
+def _match_compound(node, compound):
+    if compound['tag'] not in (None, "*") and node.tag != compound['tag']:
+        return False
+    if any(cls not in node.classes for cls in compound['classes']):
+        return False
+    if any(node.attrs.get("id") != id_ for id_ in compound['ids']):
+        return False
+    for pseudo, arg in compound['pseudos']:
+        if pseudo == "first-child" and node.position != 1:
+            return False
+        if pseudo == "last-child" and node.position != node.siblings:
+            return False
+        if pseudo == "nth-child" and not _nth(node.position, arg):
+            return False
+    return True
+
+
+def matches(node, chain):
+    """True if the selector chain matches the node (evaluated right to left)."""
+    combinator, compound = chain[-1]
+    if not _match_compound(node, compound):
+        return False
+    if len(chain) == 1:
+        return True
+    parent = node.parent
+    if combinator == ">":
+        return parent is not None and parent.tag != "#root" and matches(parent, chain[:-1])
+    while parent is not None and parent.tag != "#root":
+        if matches(parent, chain[:-1]):
+            return True
+        parent = parent.parent
+    return False
+
+
+class _ElementIndex:
+    """Elements grouped by class and tag, so a selector is only tested against plausible candidates."""
+
+    def __init__(self, elements):
+        self.elements = elements
+        self.by_class = {}
+        self.by_tag = {}
+        for node in elements:
+            self.by_tag.setdefault(node.tag, []).append(node)
+            for cls in node.classes:
+                self.by_class.setdefault(cls, []).append(node)
+
+    def select(self, chain):
+        compound = chain[-1][1]
+        if compound['classes']:
+            candidates = self.by_class.get(compound['classes'][0], [])
+        elif compound['tag'] not in (None, "*"):
+            candidates = self.by_tag.get(compound['tag'], [])
+        else:
+            candidates = self.elements
+        return [node for node in candidates if matches(node, chain)]
+
+
+def _pseudo_names(chain):
+    return {pseudo for _, compound in chain for pseudo, _ in compound['pseudos']}
+
+
+def _format_declarations(declarations, keep_important):
+    return ";".join(f"{name}:{value}{'!important' if important and keep_important else ''}"
+                    for name, value, important in declarations)
+
+
+def _minify_rules(rules, index, stats):
+    """Minified CSS for rules kept in the <style> block, dropping selectors that match nothing."""
+    out = []
+    for prelude, body in rules:
+        if isinstance(body, list):
+            inner = _minify_rules(body, index, stats)
+            if inner:
+                out.append(f"{' '.join(prelude.split())}{{{inner}}}")
+            continue
+        selectors = []
+        for selector in prelude.split(","):
+            chain = parse_selector(selector)
+            if chain is not None and _pseudo_names(chain) & DEAD_PSEUDOS:
+                stats['dropped'] += 1
+                continue
+            if chain is not None and not index.select(chain):
+                stats['dropped'] += 1
+                continue
+            selectors.append(" ".join(selector.split()))
+        if selectors:
+            out.append(f"{','.join(selectors)}{{{_format_declarations(parse_declarations(body), True)}}}")
+    return "".join(out)
+
+
+def _collapse_text(node):
+    """Collapse whitespace runs in text and drop whitespace between tags."""
+    children = []
+    for child in node.children:
+        if isinstance(child, Node):
+            if child.tag not in ("style", "script", "pre", "textarea"):
+                _collapse_text(child)
+            children.append(child)
+        else:
+            text = re.sub(r"\s+", " ", child)
+            if text.strip():
+                children.append(text)
+    for i, child in enumerate(children):
+        if isinstance(child, str):
+            if i == 0:
+                child = child.lstrip()
+            if i == len(children) - 1:
+                child = child.rstrip()
+            children[i] = child
+    node.children = children
+
+
+def _escape_attr(value):
+    # Only & and " need escaping in a double-quoted attribute; keeps quotes in font lists readable
+    return value.replace("&", "&amp;").replace('"', "&quot;")
+
+
+def _serialize(node, out):
+    for child in node.children:
+        if not isinstance(child, Node):
+            out.append(escape(child, quote=False))
+            continue
+        attrs = "".join(f' {name}="{_escape_attr(value)}"' if value is not None else f" {name}"
+                        for name, value in child.attrs.items())
+        out.append(f"<{child.tag}{attrs}>")
+        if child.tag in VOID_TAGS:
+            continue
+        if child.tag in ("style", "script"):
+            out.append("".join(child.children))
+        else:
+            _serialize(child, out)
+        out.append(f"</{child.tag}>")
+
+
+def _render(builder):
+    out = [f"<!{builder.doctype}>"] if builder.doctype else []
+    _serialize(builder.root, out)
+    return "".join(out)
+
+
+def _apply(html, inline):
+    """Parse, optimize and serialize once; inline=False keeps all styles in a minified <style> block."""
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    _index_siblings(builder.root)
+    elements = [node for node in _elements(builder.root) if node.tag not in ("style", "script")]
+    index = _ElementIndex(elements)
+    style_nodes = [node for node in _elements(builder.root) if node.tag == "style"]
+    stats = {'inlined': 0, 'dropped': 0}
+
+    kept = []
+    for order, style_node in enumerate(style_nodes):
+        for prelude, body in parse_css("".join(style_node.children)):
+            if not inline or isinstance(body, list):
+                kept.append((prelude, body))
+                continue
+            remaining = []
+            declarations = parse_declarations(body)
+            for selector in prelude.split(","):
+                chain = parse_selector(selector)
+                if chain is None or _pseudo_names(chain) - STRUCTURAL_PSEUDOS:
+                    remaining.append(selector)
+                    continue
+                weight = specificity(chain)
+                matched = index.select(chain)
+                if not matched:
+                    stats['dropped'] += 1
+                    continue
+                stats['inlined'] += 1
+                for node in matched:
+                    for name, value, important in declarations:
+                        node.style.append(((important, weight, len(node.style)), name, value))
+            if remaining:
+                kept.append((",".join(remaining), body))
+
+    residual = _minify_rules(kept, index, stats)
+
+    if inline:
+        # Classes still referenced by the <style> block must stay on the elements
+        used_classes = set(re.findall(r"\.([\w-]+)", residual))
+        for node in elements:
+            cascade = {}
+            for _, name, value in sorted(node.style, key=lambda item: item[0]):
+                cascade[name] = value
+            # An existing style attribute wins over non-!important sheet rules
+            for name, value, important in parse_declarations(node.attrs.get("style") or ""):
+                cascade[name] = value
+            if cascade:
+                node.attrs["style"] = ";".join(f"{name}:{value}" for name, value in cascade.items())
+            if "class" in node.attrs:
+                classes = [cls for cls in node.attrs["class"].split() if cls in used_classes]
+                if classes:
+                    node.attrs["class"] = " ".join(classes)
+                else:
+                    del node.attrs["class"]
+
+    for i, style_node in enumerate(style_nodes):
+        if i == 0 and residual:
+            style_node.children = [residual]
+        else:
+            style_node.parent.children.remove(style_node)
+
+    _collapse_text(builder.root)
+    return _render(builder), stats
+
+
+def optimize_html(html, report, budget=None):
+    """
+    Post-render stage for report emails.
+
+    Drops CSS rules that match no element or only apply to interactive states
+    (:hover), collapses whitespace and then either inlines the remaining rules
+    into style attributes or keeps them as one minified <style> block.
+    @media blocks always stay in the <style> block.
+
+    EMAIL_CSS_MODE picks the variant. The default, auto, inlines unless the
+    inlined HTML is larger than the <style> variant and over the size budget
+    (EMAIL_SIZE_BUDGET_BYTES, default 102 KB for Gmail clipping). A warning is
+    printed when the result is still over the budget. EMAIL_OPTIMIZE=0 sends
+    the HTML unchanged.
+
+    Args:
+        html (str): Rendered report
+        report (str): Report name for metrics and warnings
+        budget (int, optional): Size budget in bytes
+
+    Returns:
+        str: Optimized HTML
+    """
+    budget = budget or size_budget()
+    before = len(html.encode("utf-8"))
+    if not is_enabled():
+        if before > budget:
+            print(f"PERINGATAN: email {report} {before / 1000:.0f} KB, melebihi batas {budget / 1000:.0f} KB (Gmail clip)")
+        return html
+
+    mode = css_mode()
+    with track("render", detail=f"optimize_html {report}") as record:
+        optimized, stats = _apply(html, inline=mode != "style")
+        if mode == "auto":
+            mode = "inline"
+            if len(optimized.encode("utf-8")) > budget:
+                embedded, embedded_stats = _apply(html, inline=False)
+                if len(embedded.encode("utf-8")) < len(optimized.encode("utf-8")):
+                    optimized, stats, mode = embedded, embedded_stats, "style"
+        after = len(optimized.encode("utf-8"))
+        record.update(bytes_before=before, bytes=after, css_mode=mode,
+                      rules_inlined=stats['inlined'], rules_dropped=stats['dropped'],
+                      over_budget=after > budget)
+
+    print(f"Email {report}: {before / 1000:.1f} KB -> {after / 1000:.1f} KB ({mode})")
+    if after > budget:
+        print(f"PERINGATAN: email {report} {after / 1000:.0f} KB, melebihi batas {budget / 1000:.0f} KB (Gmail clip)")
+    return optimized
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Optimize a rendered report HTML file for email')
+    parser.add_argument('file', help='HTML file to optimize')
+    parser.add_argument('--output', help='Write the optimized HTML here')
+    args = parser.parse_args()
+
+    with open(args.file, encoding="utf-8") as f:
+        result = optimize_html(f.read(), os.path.basename(args.file))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(result)
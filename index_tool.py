@@ -0,0 +1,256 @@
+#index_tool.py
+#Cek index yang dibutuhkan query laporan: python index_tool.py
+#Tulis migration: python index_tool.py --sql migration.sql
+#Terapkan dan bandingkan EXPLAIN: python index_tool.py --apply
+#Cari BAST yang menggandakan baris join (fan-out): python index_tool.py --fanout [--since 2025-01-01]
+
+import os
+import sys
+import argparse
+from datetime import datetime
+import mysql.connector
+from dotenv import load_dotenv
+from db_operations import (connect_to_database, get_vehicle_data, get_spv_performance, get_spk_pipeline,
+                           find_join_fanout, LOCATIONS)
+import query_profiler
+
+# Load environment variables
+load_dotenv()
+
+# Indexes the report join graph needs: (table, leading columns, why)
+REQUIRED_INDEXES = [
+    ('tbl_bast', ('tgl_bast',), 'date range filter on every report query'),
+    ('tbl_bast', ('kode_spk',), 'join tbl_bast -> tbl_spk'),
+    ('tbl_spk', ('kode_spk',), 'join tbl_bast -> tbl_spk'),
+    ('tbl_spk', ('tgl_spk',), 'date range filter of the SPK pipeline query'),
+    ('tbl_sub_barang_masuk', ('no_rangka',), 'join on frame number for the DO price'),
+    ('tbl_barang_masuk', ('kode_bm',), 'join tbl_sub_barang_masuk -> tbl_barang_masuk'),
+    ('tbl_penagihan_leasing', ('kode_bast',), 'join for leasing billing (dp_gross, subsidies)'),
+]
+# Employee and finance master tables are not joined; db_operations reads them whole into its dimension cache
+
+# Views joined by the reports; they cannot be indexed directly, only their base tables
+REPORT_VIEWS = ('vi_do_lengkap', 'vi_data_induk_barang_motor')
+
+
+def index_name(table, columns):
+    """Name used for an index created by this tool."""
+    return f"idx_{table.replace('tbl_', '')}_{'_'.join(columns)}"[:64]
+
+
+def check_schema(database_name):
+    """
+    Compare the indexes in one dealer schema against REQUIRED_INDEXES.
+
+    Args:
+        database_name (str): Schema to inspect
+
+    Returns:
+        dict: 'missing' as (table, columns, reason) tuples, 'present' as
+              (table, columns, index name) tuples and 'skipped' as notes
+    """
+    conn = connect_to_database(database_name)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT TABLE_NAME, TABLE_TYPE
+            FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = %s
+        """, (database_name,))
+        table_types = {row['TABLE_NAME']: row['TABLE_TYPE'] for row in cursor.fetchall()}
+
+        cursor.execute("""
+            SELECT TABLE_NAME, COLUMN_NAME
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = %s
+        """, (database_name,))
+        columns = {(row['TABLE_NAME'], row['COLUMN_NAME']) for row in cursor.fetchall()}
+
+        cursor.execute("""
+            SELECT TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX, COLUMN_NAME
+            FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = %s
+            ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+        """, (database_name,))
+        indexes = {}
+        for row in cursor.fetchall():
+            indexes.setdefault((row['TABLE_NAME'], row['INDEX_NAME']), []).append(row['COLUMN_NAME'])
+    finally:
+        cursor.close()
+        conn.close()
+
+    result = {'missing': [], 'present': [], 'skipped': []}
+    for table, required, reason in REQUIRED_INDEXES:
+        if table not in table_types:
+            result['skipped'].append(f"{table}: table not found")
+            continue
+        if table_types[table] == 'VIEW':
+            result['skipped'].append(f"{table}: is a view, index its base tables instead")
+            continue
+        absent = [column for column in required if (table, column) not in columns]
+        if absent:
+            result['skipped'].append(f"{table}: column {', '.join(absent)} not found")
+            continue
+
+        # An index covers the requirement when the required columns are its leading columns
+        covering = [name for (idx_table, name), idx_columns in indexes.items()
+                    if idx_table == table and tuple(idx_columns[:len(required)]) == required]
+        if covering:
+            result['present'].append((table, required, covering[0]))
+        else:
+            result['missing'].append((table, required, reason))
+
+    for view in REPORT_VIEWS:
+        if table_types.get(view) == 'VIEW':
+            result['skipped'].append(f"{view}: is a view, check its base tables with EXPLAIN below")
+    return result
+
+
+def migration_ddl(database_name, missing):
+    """Build ALTER TABLE statements that add the missing indexes."""
+    return [
+        f"ALTER TABLE `{database_name}`.`{table}` ADD INDEX `{index_name(table, columns)}` "
+        f"({', '.join(f'`{column}`' for column in columns)});"
+        for table, columns, reason in missing
+    ]
+
+
+def explain_report_queries(database_name, report_date):
+    """
+    Run the report queries for one day with the profiler on and return their plans.
+
+    Returns:
+        list: Profiler statistics with 'plan' and 'warnings' per statement
+    """
+    # Imported here because vehicle_reporting pulls in the email and rendering code
+    from vehicle_reporting import get_margin_summary
+
+    previous = os.environ.get("QUERY_PROFILE")
+    os.environ["QUERY_PROFILE"] = "1"
+    query_profiler.reset_profile()
+    try:
+        get_vehicle_data(report_date, report_date, database_name)
+        get_margin_summary(report_date, report_date, database_name)
+        get_spv_performance(report_date, report_date, database_name)
+        get_spk_pipeline(datetime.strptime(report_date, '%Y-%m-%d').date(), database_name, use_cache=False)
+        return query_profiler.get_profile()
+    finally:
+        query_profiler.reset_profile()
+        if previous is None:
+            del os.environ["QUERY_PROFILE"]
+        else:
+            os.environ["QUERY_PROFILE"] = previous
+
+
+def estimated_rows(plan):
+    """Optimizer's join cardinality estimate: product of the rows column of each step."""
+    total = 1
+    for step in plan:
+        total *= max(int(step.get('rows') or 1), 1)
+    return total
+
+
+def print_plan_comparison(before, after):
+    """Print EXPLAIN estimates and warnings per report query before and after migration."""
+    after_by_fp = {stats['fingerprint']: stats for stats in after}
+    for stats in before:
+        new = after_by_fp.get(stats['fingerprint'])
+        if new is None:
+            continue
+        print(f"  {stats['name']}:")
+        print(f"    estimated rows {estimated_rows(stats['plan']):,} -> {estimated_rows(new['plan']):,}, "
+              f"warnings {len(stats['warnings'])} -> {len(new['warnings'])}")
+        for warning in new['warnings']:
+            print(f"    still: {warning}")
+
+
+def print_fanout(database_name, since, until, limit=20):
+    """Print the BASTs that fan out a direct join of the cost sources, worst first."""
+    rows = find_join_fanout(since, until, database_name)
+    if not rows:
+        print(f"  No BAST between {since} and {until} fans out.")
+        return
+    print(f"  {len(rows)} BAST fan out between {since} and {until}:")
+    print(f"  {'kode_bast':<20} {'tgl':<10} {'no_rangka':<20} {'receipts':>8} {'do_lines':>8} {'leasing':>8} {'rows':>5}")
+    for row in rows[:limit]:
+        print(f"  {row['kode_bast']:<20} {row['tgl'].isoformat():<10} {row['no_rangka'] or '-':<20} "
+              f"{row['receipts']:>8} {row['do_lines']:>8} {row['leasing_rows']:>8} {row['multiplier']:>5}x")
+    if len(rows) > limit:
+        print(f"  ... and {len(rows) - limit} more")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify and provision indexes used by the report queries')
+    parser.add_argument('--apply', action='store_true', help='Create the missing indexes and compare EXPLAIN plans')
+    parser.add_argument('--sql', help='Write the migration DDL to this file')
+    parser.add_argument('--date', default=datetime.now().strftime('%Y-%m-%d'),
+                        help='Date (YYYY-MM-DD) used for the EXPLAIN comparison')
+    parser.add_argument('--fanout', action='store_true',
+                        help='Only report BASTs whose DO price or leasing rows would multiply a direct join')
+    parser.add_argument('--since', help='First day (YYYY-MM-DD) checked by --fanout, default 1 January of --date')
+    args = parser.parse_args()
+
+    if args.fanout:
+        since = args.since or args.date[:4] + "-01-01"
+        for database_name, location_name in LOCATIONS:
+            print(f"=== {location_name} ({database_name}) ===")
+            try:
+                print_fanout(database_name, since, args.date)
+            except mysql.connector.Error as err:
+                print(f"Database error ({database_name}): {err}")
+        return
+
+    all_ddl = []
+    for database_name, location_name in LOCATIONS:
+        print(f"=== {location_name} ({database_name}) ===")
+        try:
+            result = check_schema(database_name)
+        except mysql.connector.Error as err:
+            print(f"Database error ({database_name}): {err}")
+            continue
+
+        for table, columns, name in result['present']:
+            print(f"  OK       {table}({', '.join(columns)}) via {name}")
+        for table, columns, reason in result['missing']:
+            print(f"  MISSING  {table}({', '.join(columns)}) - {reason}")
+        for note in result['skipped']:
+            print(f"  SKIPPED  {note}")
+
+        ddl = migration_ddl(database_name, result['missing'])
+        all_ddl.extend(ddl)
+        if not ddl:
+            print("  All required indexes are present.")
+            continue
+        for statement in ddl:
+            print(f"  {statement}")
+
+        if args.apply:
+            before = explain_report_queries(database_name, args.date)
+            conn = connect_to_database(database_name)
+            cursor = conn.cursor()
+            try:
+                for statement in ddl:
+                    print(f"  Applying: {statement}")
+                    cursor.execute(statement)
+            except mysql.connector.Error as err:
+                print(f"Database error ({database_name}): {err}")
+            finally:
+                cursor.close()
+                conn.close()
+            after = explain_report_queries(database_name, args.date)
+            print("  EXPLAIN before -> after:")
+            print_plan_comparison(before, after)
+
+    if args.sql and all_ddl:
+        with open(args.sql, "w", encoding="utf-8") as f:
+            f.write(f"-- Report index migration generated {datetime.now():%Y-%m-%d %H:%M}\n")
+            f.write("\n".join(all_ddl) + "\n")
+        print(f"Migration written to {args.sql}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
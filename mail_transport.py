@@ -0,0 +1,260 @@
+#mail_transport.py
+
+import os
+import copy
+import time
+import atexit
+import smtplib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from dotenv import load_dotenv
+from metrics import track
+
+# Load environment variables
+load_dotenv()
+
+# Errors after which the session is re-established and the message sent again
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+def build_message(subject, html, recipients, plain_text=None, headers=None):
+    """
+    Build a report email with an HTML part and an optional plain-text part.
+
+    Args:
+        subject (str): Email subject
+        html (str): HTML body
+        recipients (list): Addresses for the To header
+        plain_text (str, optional): Plain-text alternative, attached before the HTML part
+        headers (dict, optional): Extra headers such as priority flags
+    """
+    message = MIMEMultipart("alternative")
+    message["From"] = os.getenv("SENDER_EMAIL")
+    message["Subject"] = subject
+    message["To"] = ", ".join(recipients)
+    for name, value in (headers or {}).items():
+        message[name] = value
+
+    if plain_text is not None:
+        message.attach(MIMEText(plain_text, "plain"))
+    message.attach(MIMEText(html, "html"))
+    return message
+
+
+class MailTransport:
+    """
+    One authenticated SMTP session shared by every message sent in a run.
+
+    The session is opened on the first send and kept until close(). If the server
+    drops the connection, the next send reconnects and retries once.
+    """
+
+    def __init__(self):
+        self.server = os.getenv("SMTP_SERVER")
+        self.port = int(os.getenv("SMTP_PORT"))
+        self.sender = os.getenv("SENDER_EMAIL")
+        self.password = os.getenv("SENDER_PASSWORD")
+        self.timeout = int(os.getenv("SMTP_TIMEOUT", "60"))
+        # SMTP_STARTTLS=0 is only meant for a local sink such as smtp_sink.py
+        self.starttls = os.getenv("SMTP_STARTTLS", "1") != "0"
+        self._smtp = None
+        self.sessions = 0
+
+    def connect(self):
+        """Open the SMTP connection, upgrade to TLS and log in."""
+        self.close()
+        with track("smtp", detail=f"login {self.server}:{self.port}"):
+            smtp = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+            try:
+                if self.starttls:
+                    smtp.starttls()
+                smtp.login(self.sender, self.password)
+            except Exception:
+                smtp.close()
+                raise
+        self._smtp = smtp
+        self.sessions += 1
+
+    def send(self, message, recipients=None):
+        """
+        Send one message over the shared session.
+
+        Args:
+            message: email.message.Message to send
+            recipients (list, optional): Envelope recipients, default the message headers
+
+        Returns:
+            dict: Recipients the server refused, mapped to (code, reason)
+        """
+        with track("smtp", detail=message["Subject"],
+                   recipients=len(recipients) if recipients else None) as record:
+            record['bytes'] = len(message.as_bytes())
+            start = time.perf_counter()
+            if self._smtp is None:
+                self.connect()
+            try:
+                refused = self._smtp.send_message(message, to_addrs=recipients)
+            except RECONNECT_ERRORS:
+                # Server dropped the idle session; log in again and retry once
+                self.connect()
+                refused = self._smtp.send_message(message, to_addrs=recipients)
+            record['latency_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        print(f"Email '{message['Subject']}' terkirim dalam {record['latency_ms']:.0f} ms")
+        return refused
+
+    def close(self):
+        """Quit the session if one is open."""
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+
+def _recipient_status(recipients, refused):
+    """Map each recipient to 'sent' or the server's refusal, e.g. 'refused: 550 5.1.1 Recipient rejected'."""
+    status = {}
+    for address in recipients:
+        if address in refused:
+            code, reason = refused[address]
+            if isinstance(reason, bytes):
+                reason = reason.decode("utf-8", "replace")
+            status[address] = f"refused: {code} {reason}"
+        else:
+            status[address] = "sent"
+    return status
+
+
+class RecipientRateLimiter:
+    """Sliding one-minute window on the number of recipients handed to the SMTP server."""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self._window = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self, count):
+        """Block until count more recipients fit in the current minute."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._window and now - self._window[0][0] >= 60:
+                    self._window.popleft()
+                used = sum(n for _, n in self._window)
+                # A batch larger than the whole budget goes through on an empty window
+                if used + count <= self.per_minute or not self._window:
+                    self._window.append((now, count))
+                    return
+                wait = 60 - (now - self._window[0][0])
+            time.sleep(wait)
+
+
+def send_batches(message, recipients, batch_size=None, max_sessions=None, per_minute=None):
+    """
+    Send one message to a large recipient list in batches over parallel SMTP sessions.
+
+    Each batch gets its own copy of the message with only that batch in the To
+    header. Each worker thread keeps one session open for all of its batches.
+
+    Args:
+        message: email.message.Message to send
+        recipients (list): All recipients
+        batch_size (int, optional): Recipients per message (SMTP_MAX_RECIPIENTS_PER_MESSAGE, default 100)
+        max_sessions (int, optional): Concurrent SMTP sessions (SMTP_MAX_SESSIONS, default 4)
+        per_minute (int, optional): Recipients per minute (SMTP_MAX_RECIPIENTS_PER_MINUTE, default 1000)
+
+    Returns:
+        dict: Delivery status per recipient: 'sent', or 'refused: ...' / 'failed: ...'
+    """
+    batch_size = batch_size or int(os.getenv("SMTP_MAX_RECIPIENTS_PER_MESSAGE", "100"))
+    max_sessions = max_sessions or int(os.getenv("SMTP_MAX_SESSIONS", "4"))
+    limiter = RecipientRateLimiter(per_minute or int(os.getenv("SMTP_MAX_RECIPIENTS_PER_MINUTE", "1000")))
+    batches = [recipients[i:i + batch_size] for i in range(0, len(recipients), batch_size)]
+
+    local = threading.local()
+    sessions = []
+    sessions_lock = threading.Lock()
+
+    def send_batch(batch):
+        if not hasattr(local, "transport"):
+            local.transport = MailTransport()
+            with sessions_lock:
+                sessions.append(local.transport)
+        batch_message = copy.deepcopy(message)
+        batch_message.replace_header("To", ", ".join(batch))
+        limiter.acquire(len(batch))
+        try:
+            refused = local.transport.send(batch_message, batch)
+        except smtplib.SMTPRecipientsRefused as e:
+            refused = e.recipients
+        except Exception as e:
+            local.transport.close()
+            return {address: f"failed: {type(e).__name__}: {e}" for address in batch}
+        return _recipient_status(batch, refused)
+
+    status = {}
+    try:
+        with ThreadPoolExecutor(max_workers=min(max_sessions, len(batches)) or 1) as pool:
+            for batch_status in pool.map(send_batch, batches):
+                status.update(batch_status)
+    finally:
+        for transport in sessions:
+            transport.close()
+    return status
+
+
+def deliver(message, recipients=None, transport=None):
+    """
+    Send a message, fanning out over parallel sessions when the list is larger than one batch.
+
+    Args:
+        message: email.message.Message to send
+        recipients (list, optional): Envelope recipients, default the To header
+        transport (MailTransport, optional): Session for single-batch sends, default the shared one
+
+    Returns:
+        dict: Delivery status per recipient, see send_batches()
+    """
+    if recipients is None:
+        recipients = [r.strip() for r in message["To"].split(",") if r.strip()]
+    if len(recipients) > int(os.getenv("SMTP_MAX_RECIPIENTS_PER_MESSAGE", "100")):
+        status = send_batches(message, recipients)
+    else:
+        transport = transport or get_transport()
+        try:
+            refused = transport.send(message, recipients)
+        except smtplib.SMTPRecipientsRefused as e:
+            refused = e.recipients
+        status = _recipient_status(recipients, refused)
+
+    failed = {address: result for address, result in status.items() if result != "sent"}
+    for address, result in failed.items():
+        print(f"Email '{message['Subject']}' ke {address} gagal: {result}")
+    return status
+
+
+_transport = None
+
+
+def get_transport():
+    """Return the transport shared by the whole process, creating it on first use."""
+    global _transport
+    if _transport is None:
+        _transport = MailTransport()
+    return _transport
+
+
+def close_transport():
+    """Close the shared session; called at the end of a run and at interpreter exit."""
+    global _transport
+    if _transport is not None:
+        _transport.close()
+        _transport = None
+
+
+atexit.register(close_transport)
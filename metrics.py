@@ -0,0 +1,192 @@
+#metrics.py
+#Per-phase timing for report runs, written as JSONL and Prometheus textfile output
+#Ringkasan p50/p95: python metrics.py [--days 28]
+
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import argparse
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from run_phase import PHASES, set_phase
+
+# Load environment variables
+load_dotenv()
+
+RUN_ID = uuid.uuid4().hex[:12]
+
+# Records collected during this process, written out by flush_metrics()
+_records = []
+
+# Location (database) of the enclosing track("location", ...) block
+_location_stack = []
+
+
+@contextmanager
+def track(phase, location=None, detail="", **fields):
+    """
+    Time a block of report work and record it as one metrics entry.
+
+    The yielded dict can be filled with extra measurements such as 'rows' and
+    'bytes'. Entries without a location inherit the one of the enclosing
+    track("location", ...) block.
+
+    Args:
+        phase (str): connect, query, render, smtp, or location for a whole location run
+        location (str, optional): Database name the work belongs to
+        detail (str): Free text such as the query name or email subject
+    """
+    if location is None and _location_stack:
+        location = _location_stack[-1]
+    record = {'phase': phase, 'location': location, 'detail': detail}
+    record.update(fields)
+
+    if phase in PHASES:
+        set_phase(phase, f"{location}: {detail}" if location and detail else (detail or location or ""))
+    if phase == "location":
+        _location_stack.append(location)
+
+    start = time.perf_counter()
+    try:
+        yield record
+        record['status'] = 'ok'
+    except BaseException:
+        record['status'] = 'error'
+        raise
+    finally:
+        record['duration_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        record['ts'] = datetime.now().isoformat(timespec='seconds')
+        if phase == "location":
+            _location_stack.pop()
+        _records.append(record)
+
+
+def result_bytes(rows):
+    """Approximate size of a fetched result set in bytes."""
+    if not rows:
+        return 0
+    if isinstance(rows, dict):
+        rows = [rows]
+    return sum(len(str(value)) for row in rows for value in row.values())
+
+
+def _prometheus_lines(job, records):
+    """Aggregate this run's records into Prometheus gauges per phase and location."""
+    totals = {}
+    for record in records:
+        key = (record['phase'], record['location'] or 'all')
+        entry = totals.setdefault(key, {'seconds': 0.0, 'rows': 0, 'bytes': 0, 'calls': 0, 'errors': 0})
+        entry['seconds'] += record['duration_ms'] / 1000
+        entry['rows'] += record.get('rows', 0) or 0
+        entry['bytes'] += record.get('bytes', 0) or 0
+        entry['calls'] += 1
+        entry['errors'] += record['status'] != 'ok'
+
+    gauges = [
+        ('seconds', 'm2_report_phase_duration_seconds', 'Total time spent in each phase during the last run'),
+        ('rows', 'm2_report_phase_rows', 'Rows returned in each phase during the last run'),
+        ('bytes', 'm2_report_phase_bytes', 'Bytes fetched, rendered or sent in each phase during the last run'),
+        ('calls', 'm2_report_phase_calls', 'Number of calls per phase during the last run'),
+        ('errors', 'm2_report_phase_errors', 'Number of failed calls per phase during the last run'),
+    ]
+    lines = []
+    for field, name, help_text in gauges:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for (phase, location), entry in sorted(totals.items()):
+            lines.append(f'{name}{{job="{job}",location="{location}",phase="{phase}"}} {entry[field]:g}')
+    lines.append("# HELP m2_report_last_run_timestamp_seconds Unix time the last run finished")
+    lines.append("# TYPE m2_report_last_run_timestamp_seconds gauge")
+    lines.append(f'm2_report_last_run_timestamp_seconds{{job="{job}"}} {time.time():.0f}')
+    return lines
+
+
+def drain_records():
+    """Return the records collected so far in this process and clear them."""
+    records = list(_records)
+    _records.clear()
+    return records
+
+
+def flush_metrics(job):
+    """
+    Write the records collected in this process and clear them.
+
+    Records are appended to METRICS_FILE (default metrics.jsonl). When
+    METRICS_PROM_DIR is set, a <job>.prom file for the node_exporter textfile
+    collector is written there as well.
+
+    Args:
+        job (str): Name of the report script, e.g. "vehicle_reporting"
+    """
+    records = drain_records()
+    if not records:
+        return
+
+    metrics_file = os.getenv("METRICS_FILE", "metrics.jsonl")
+    try:
+        with open(metrics_file, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(dict(record, run_id=RUN_ID, job=job), default=str) + "\n")
+    except OSError as e:
+        print(f"Gagal menulis metrics ke {metrics_file}: {e}")
+
+    prom_dir = os.getenv("METRICS_PROM_DIR")
+    if prom_dir:
+        prom_file = os.path.join(prom_dir, f"m2_report_{job}.prom")
+        try:
+            # Write to a temporary file first so the collector never reads a partial file
+            with open(prom_file + ".tmp", "w", encoding="utf-8") as f:
+                f.write("\n".join(_prometheus_lines(job, records)) + "\n")
+            os.replace(prom_file + ".tmp", prom_file)
+        except OSError as e:
+            print(f"Gagal menulis metrics ke {prom_file}: {e}")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(metrics_file, days=28):
+    """
+    Print p50/p95 durations per location and phase from a metrics JSONL file.
+
+    Args:
+        metrics_file (str): Path to the JSONL file written by flush_metrics()
+        days (int): Only include records from the last N days
+    """
+    cutoff = (datetime.now() - timedelta(days=days)).isoformat(timespec='seconds')
+    durations = {}
+    with open(metrics_file, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record['ts'] < cutoff:
+                continue
+            key = (record['location'] or 'all', record['phase'])
+            durations.setdefault(key, []).append(record['duration_ms'])
+
+    print(f"{'Location':<14} {'Phase':<10} {'Count':>6} {'p50 (ms)':>10} {'p95 (ms)':>10}")
+    for (location, phase), values in sorted(durations.items()):
+        print(f"{location:<14} {phase:<10} {len(values):>6} "
+              f"{percentile(values, 50):>10.1f} {percentile(values, 95):>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Summarize report run metrics')
+    parser.add_argument('--file', default=os.getenv("METRICS_FILE", "metrics.jsonl"), help='Metrics JSONL file')
+    parser.add_argument('--days', type=int, default=28, help='Only include the last N days')
+    args = parser.parse_args()
+    try:
+        summarize(args.file, args.days)
+    except FileNotFoundError:
+        print(f"File metrics tidak ditemukan: {args.file}")
+        sys.exit(1)
@@ -0,0 +1,342 @@
+#outbox.py
+#Antrian email di disk, dikirim oleh sender di background dengan retry
+#  python outbox.py run      # sender terus berjalan
+#  python outbox.py once     # kirim semua yang sudah jatuh tempo lalu keluar
+#  python outbox.py status
+#  python outbox.py retry-dead
+
+import os
+import sys
+import json
+import time
+import uuid
+import email
+import logging
+import argparse
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+from mail_transport import MailTransport, deliver
+from metrics import flush_metrics
+import report_history
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger("outbox")
+
+# Seconds before the first retry; doubles on every failed attempt up to MAX_BACKOFF_SECONDS
+BASE_BACKOFF_SECONDS = 30
+MAX_BACKOFF_SECONDS = 3600
+
+# A claimed message that has not finished after this long is assumed to be from a crashed sender
+STALE_CLAIM_SECONDS = 1800
+
+# What dispatch() did with a message; a message no recipient accepted raises instead
+SENT = "sent"
+QUEUED = "queued"
+PARTIAL = "partial"
+
+
+def is_enabled():
+    """Return True when report emails should go through the outbox (OUTBOX_ENABLED=1)."""
+    return os.getenv("OUTBOX_ENABLED", "").lower() in ("1", "true", "yes")
+
+
+def outbox_dir(state="pending"):
+    path = os.path.join(os.getenv("OUTBOX_DIR", "outbox"), state)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _write_json(path, data):
+    # Write then rename so a reader never sees a half-written file
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def enqueue(message, recipients=None, report=None):
+    """
+    Store a rendered message in the outbox for the background sender.
+
+    Args:
+        message: email.message.Message to deliver
+        recipients (list, optional): Envelope recipients, default the To header
+        report (dict, optional): {'job', 'key', 'fingerprint'} of the report in the message,
+            marked delivered in report_history once the sender has sent it
+
+    Returns:
+        str: Id of the queued message
+    """
+    message_id = f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+    pending = outbox_dir("pending")
+    with open(os.path.join(pending, message_id + ".eml"), "wb") as f:
+        f.write(message.as_bytes())
+    # The .json file is written last; its presence marks the message as ready
+    _write_json(os.path.join(pending, message_id + ".json"), {
+        'id': message_id,
+        'subject': message["Subject"],
+        'recipients': recipients or [r.strip() for r in message["To"].split(",") if r.strip()],
+        'created': time.time(),
+        'attempts': 0,
+        'next_attempt': 0,
+        'last_error': None,
+        'recipient_status': {},
+        'report': report,
+    })
+    print(f"Email '{message['Subject']}' masuk antrian outbox ({message_id})")
+    return message_id
+
+
+def dispatch(message, recipients=None, report=None):
+    """
+    Queue the message when the outbox is enabled, otherwise send it right away.
+
+    With report given, its outcome is recorded in report_history where it is
+    known: here for a direct send, by the background sender for a queued
+    message. Only a send every recipient accepted marks the report delivered;
+    a partial send records the failed recipients and is sent again in full
+    on the next run.
+
+    Args:
+        message: email.message.Message to deliver
+        recipients (list, optional): Envelope recipients, default the To header
+        report (dict, optional): {'job', 'key', 'fingerprint'} of the report in the message,
+            any other keys are stored with the decision (e.g. location)
+
+    Returns:
+        str: SENT if every recipient accepted the message, PARTIAL if only some
+        did, QUEUED if it was only queued
+
+    Raises:
+        RuntimeError: No recipient accepted the message
+    """
+    if is_enabled():
+        message_id = enqueue(message, recipients, report)
+        _record_report(report, "queued", message_id=message_id)
+        return QUEUED
+    try:
+        recipient_status = deliver(message, recipients)
+    except Exception as e:
+        _record_report(report, "failed", error=f"{type(e).__name__}: {e}")
+        raise
+    failed = {address: result for address, result in recipient_status.items() if result != "sent"}
+    if failed and len(failed) == len(recipient_status):
+        _record_report(report, "failed", recipient_status=failed)
+        raise RuntimeError(f"no recipient accepted '{message['Subject']}'")
+    if failed:
+        _record_report(report, PARTIAL, recipient_status=failed)
+        return PARTIAL
+    _record_report(report, SENT)
+    return SENT
+
+
+def _record_report(report, decision, **fields):
+    if not report:
+        return
+    if decision == SENT:
+        report_history.mark_delivered(report['key'], report['fingerprint'])
+    extra = {name: value for name, value in report.items() if name not in ('job', 'key', 'fingerprint')}
+    report_history.record_decision(report['job'], report['key'], report['fingerprint'],
+                                   decision, **extra, **fields)
+
+
+def _claim(meta_path):
+    """Atomically take a pending message; returns the claimed path or None if another sender has it."""
+    claimed = meta_path + ".sending"
+    try:
+        os.rename(meta_path, claimed)
+    except OSError:
+        return None
+    # rename keeps the mtime from the enqueue; stale claims are measured from the claim itself
+    os.utime(claimed)
+    return claimed
+
+
+def _release_stale_claims(pending):
+    for name in os.listdir(pending):
+        path = os.path.join(pending, name)
+        if name.endswith(".json.sending") and time.time() - os.path.getmtime(path) > STALE_CLAIM_SECONDS:
+            os.replace(path, path[:-len(".sending")])
+
+
+def _move(message_id, meta, claimed_path, state):
+    target = outbox_dir(state)
+    os.replace(os.path.join(outbox_dir("pending"), message_id + ".eml"), os.path.join(target, message_id + ".eml"))
+    _write_json(os.path.join(target, message_id + ".json"), meta)
+    os.remove(claimed_path)
+
+
+def deliver_pending(transport, max_attempts=None, rate_per_minute=None):
+    """
+    Send every pending message that is due, oldest first.
+
+    Failed messages are rescheduled with exponential backoff. After max_attempts
+    they move to the dead/ folder.
+
+    Returns:
+        dict: Counts of 'sent', 'retry' and 'dead' messages in this pass
+    """
+    max_attempts = max_attempts or int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+    rate_per_minute = rate_per_minute or int(os.getenv("OUTBOX_RATE_PER_MINUTE", "20"))
+    min_interval = 60.0 / rate_per_minute
+    pending = outbox_dir("pending")
+    _release_stale_claims(pending)
+
+    counts = {'sent': 0, 'retry': 0, 'dead': 0}
+    last_send = 0.0
+    for name in sorted(os.listdir(pending)):
+        if not name.endswith(".json"):
+            continue
+        meta_path = os.path.join(pending, name)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if meta['next_attempt'] > time.time():
+            continue
+        claimed = _claim(meta_path)
+        if claimed is None:
+            continue
+
+        # Rate limit across the whole pass
+        wait = last_send + min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        last_send = time.monotonic()
+
+        meta['attempts'] += 1
+        try:
+            with open(os.path.join(pending, meta['id'] + ".eml"), "rb") as f:
+                message = email.message_from_bytes(f.read())
+            recipient_status = deliver(message, meta['recipients'], transport)
+            meta.setdefault('recipient_status', {}).update(recipient_status)
+            # Permanent (5xx) refusals will not succeed on a retry; everything else is tried again
+            undelivered = [address for address, result in recipient_status.items()
+                           if result != "sent" and not result.startswith("refused: 5")]
+            if undelivered:
+                meta['recipients'] = undelivered
+                raise RuntimeError(f"{len(undelivered)} recipient(s) not delivered")
+            # Report decisions of queued messages are only known once the sender is done with them,
+            # and are the same as dispatch() records for a direct send
+            refused = {address: result for address, result in meta['recipient_status'].items() if result != "sent"}
+            if len(refused) == len(meta['recipient_status']):
+                # Every recipient refused permanently, a retry cannot help
+                _move(meta['id'], meta, claimed, "dead")
+                _record_report(meta.get('report'), "failed", via="outbox", message_id=meta['id'],
+                               recipient_status=refused)
+                counts['dead'] += 1
+                logger.error(f"Outbox: {meta['id']} '{meta['subject']}' refused by every recipient")
+            else:
+                meta['sent'] = time.time()
+                _move(meta['id'], meta, claimed, "sent")
+                if refused:
+                    _record_report(meta.get('report'), PARTIAL, via="outbox", message_id=meta['id'],
+                                   recipient_status=refused)
+                else:
+                    _record_report(meta.get('report'), SENT, via="outbox", message_id=meta['id'])
+                counts['sent'] += 1
+                logger.info(f"Outbox: sent {meta['id']} '{meta['subject']}' after {meta['attempts']} attempt(s)"
+                            + (f", {len(refused)} recipient(s) refused" if refused else ""))
+        except Exception as e:
+            meta['last_error'] = f"{type(e).__name__}: {e}"
+            transport.close()
+            if meta['attempts'] >= max_attempts:
+                _move(meta['id'], meta, claimed, "dead")
+                _record_report(meta.get('report'), "failed", via="outbox", message_id=meta['id'],
+                               recipient_status=meta['recipient_status'])
+                counts['dead'] += 1
+                logger.error(f"Outbox: {meta['id']} '{meta['subject']}' moved to dead letters: {meta['last_error']}")
+            else:
+                backoff = min(BASE_BACKOFF_SECONDS * 2 ** (meta['attempts'] - 1), MAX_BACKOFF_SECONDS)
+                meta['next_attempt'] = time.time() + backoff
+                _write_json(meta_path, meta)
+                os.remove(claimed)
+                counts['retry'] += 1
+                logger.warning(f"Outbox: {meta['id']} failed ({meta['last_error']}), retry in {backoff}s")
+    return counts
+
+
+class OutboxSender(threading.Thread):
+    """Background thread that delivers the outbox every poll_seconds."""
+
+    def __init__(self, poll_seconds=None):
+        super().__init__(name="outbox-sender", daemon=True)
+        self.poll_seconds = poll_seconds or int(os.getenv("OUTBOX_POLL_SECONDS", "15"))
+        self.stopped = threading.Event()
+
+    def run(self):
+        transport = MailTransport()
+        while not self.stopped.is_set():
+            try:
+                deliver_pending(transport)
+            except Exception as e:
+                logger.error(f"Outbox: delivery pass failed: {e}")
+            finally:
+                # Do not hold an idle session open between passes
+                transport.close()
+                flush_metrics("outbox")
+            self.stopped.wait(self.poll_seconds)
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start_sender():
+    """Start the background sender and return it."""
+    sender = OutboxSender()
+    sender.start()
+    logger.info(f"Outbox sender started, polling {outbox_dir('pending')} every {sender.poll_seconds}s")
+    return sender
+
+
+def status():
+    """Return the number of messages per outbox folder."""
+    return {state: sum(1 for name in os.listdir(outbox_dir(state)) if name.endswith(".eml"))
+            for state in ("pending", "sent", "dead")}
+
+
+def retry_dead():
+    """Move dead letters back to pending with their attempt counter reset."""
+    dead, pending = outbox_dir("dead"), outbox_dir("pending")
+    moved = 0
+    for name in os.listdir(dead):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(dead, name), encoding="utf-8") as f:
+            meta = json.load(f)
+        meta.update(attempts=0, next_attempt=0)
+        os.replace(os.path.join(dead, meta['id'] + ".eml"), os.path.join(pending, meta['id'] + ".eml"))
+        _write_json(os.path.join(pending, name), meta)
+        os.remove(os.path.join(dead, name))
+        moved += 1
+    return moved
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Deliver queued report emails')
+    parser.add_argument('command', choices=['run', 'once', 'status', 'retry-dead'])
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        sender = start_sender()
+        try:
+            while sender.is_alive():
+                sender.join(1)
+        except KeyboardInterrupt:
+            sender.stop()
+    elif args.command == 'once':
+        transport = MailTransport()
+        try:
+            print(deliver_pending(transport))
+        finally:
+            transport.close()
+    elif args.command == 'status':
+        for state, count in status().items():
+            print(f"{state:<8} {count}")
+    else:
+        print(f"{retry_dead()} pesan dikembalikan ke antrian")
+    sys.exit(0)
@@ -0,0 +1,166 @@
+#query_profiler.py
+#Aktifkan dengan QUERY_PROFILE=1 di .env atau environment
+
+import os
+import re
+import hashlib
+import mysql.connector
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Join keys the report queries rely on; a scan of one of these tables means the
+# listed column is missing an index
+JOIN_KEYS = {
+    'tbl_bast': 'kode_spk / tgl_bast',
+    'tbl_spk': 'kode_spk',
+    'tbl_sub_barang_masuk': 'no_rangka',
+    'tbl_barang_masuk': 'kode_bm',
+    'tbl_penagihan_leasing': 'kode_bast',
+}
+
+# Handler counters that together approximate the rows a statement examined
+HANDLER_READ_COUNTERS = (
+    'Handler_read_first', 'Handler_read_key', 'Handler_read_last',
+    'Handler_read_next', 'Handler_read_prev', 'Handler_read_rnd', 'Handler_read_rnd_next',
+)
+
+# Statements seen in this process, keyed by (database, fingerprint)
+_statements = {}
+
+
+def is_enabled():
+    """Return True when query profiling is switched on through QUERY_PROFILE."""
+    return os.getenv("QUERY_PROFILE", "").lower() in ("1", "true", "yes")
+
+
+def fingerprint(query):
+    """Short, stable identifier of a statement independent of whitespace and comments."""
+    normalized = re.sub(r'/\*.*?\*/', ' ', query, flags=re.S)
+    normalized = re.sub(r'\s+', ' ', normalized).strip().lower()
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:10]
+
+
+def table_aliases(query):
+    """Map each alias used in FROM/JOIN clauses to its table name."""
+    aliases = {}
+    for table, alias in re.findall(r'(?:FROM|JOIN)\s+(\w+)(?:\s+AS)?\s+(\w+)', query, flags=re.I):
+        if alias.upper() not in ('ON', 'WHERE', 'INNER', 'LEFT', 'RIGHT', 'JOIN', 'GROUP', 'ORDER'):
+            aliases[alias] = table
+        aliases[table] = table
+    return aliases
+
+
+def rows_examined(cursor):
+    """Sum of the session's Handler_read_* counters, used as a before/after probe."""
+    cursor.execute("SHOW SESSION STATUS LIKE 'Handler_read%'")
+    return sum(int(row['Value']) for row in cursor.fetchall()
+               if row['Variable_name'] in HANDLER_READ_COUNTERS)
+
+
+def explain(cursor, query, params):
+    """
+    Run EXPLAIN for a statement and flag full scans and unindexed joins.
+
+    Returns:
+        tuple: (plan rows, list of warning strings)
+    """
+    cursor.execute("EXPLAIN " + query, params)
+    plan = cursor.fetchall()
+    aliases = table_aliases(query)
+    warnings = []
+    for position, step in enumerate(plan):
+        alias = step.get('table') or ''
+        table = aliases.get(alias, alias)
+        access = (step.get('type') or '').upper()
+        extra = step.get('Extra') or ''
+        hint = f" (expected index on {JOIN_KEYS[table]})" if table in JOIN_KEYS else ""
+        if access == 'ALL' and position == 0:
+            warnings.append(f"full table scan on {table} AS {alias}, ~{step.get('rows')} rows{hint}")
+        elif access in ('ALL', 'INDEX') or 'join buffer' in extra.lower():
+            warnings.append(f"join without usable index on {table} AS {alias}, ~{step.get('rows')} rows per lookup{hint}")
+    return plan, warnings
+
+
+def record(cursor, query, params, database_name, name, duration_ms, rows, examined_before):
+    """
+    Log one profiled execution and capture its plan the first time the statement is seen.
+
+    Args:
+        cursor: Cursor the statement ran on, used for the follow-up probes
+        query (str): SQL statement
+        params (tuple): Statement parameters
+        database_name (str): Database the statement ran against
+        name (str): Short description of the query
+        duration_ms (float): Measured latency
+        rows (int): Rows returned
+        examined_before (int): rows_examined() taken before the statement ran
+    """
+    fp = fingerprint(query)
+    try:
+        examined = rows_examined(cursor) - examined_before
+    except mysql.connector.Error:
+        examined = None
+
+    print(f"[profile] {database_name} {fp} {name} params={params} "
+          f"{duration_ms:.1f} ms, {rows} rows returned, {examined} rows examined")
+
+    key = (database_name, fp)
+    stats = _statements.get(key)
+    if stats is None:
+        stats = _statements[key] = {
+            'database': database_name,
+            'fingerprint': fp,
+            'name': name,
+            'calls': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'rows': 0,
+            'rows_examined': 0,
+            'plan': [],
+            'warnings': [],
+        }
+        try:
+            stats['plan'], stats['warnings'] = explain(cursor, query, params)
+        except mysql.connector.Error as err:
+            stats['warnings'] = [f"EXPLAIN failed: {err}"]
+
+    stats['calls'] += 1
+    stats['total_ms'] += duration_ms
+    stats['max_ms'] = max(stats['max_ms'], duration_ms)
+    stats['rows'] += rows
+    stats['rows_examined'] += examined or 0
+
+
+def get_profile():
+    """Return the statements profiled so far, slowest total time first."""
+    return sorted(_statements.values(), key=lambda s: s['total_ms'], reverse=True)
+
+
+def reset_profile():
+    """Forget all profiled statements."""
+    _statements.clear()
+
+
+def print_profile_summary():
+    """Print the end-of-run summary of profiled statements and their plan warnings."""
+    if not _statements:
+        return
+    print("")
+    print("=== Query profile ===")
+    print(f"{'Database':<12} {'Fingerprint':<11} {'Calls':>5} {'Total ms':>10} {'Max ms':>9} "
+          f"{'Rows':>8} {'Examined':>10}  Query")
+    for stats in get_profile():
+        print(f"{stats['database']:<12} {stats['fingerprint']:<11} {stats['calls']:>5} "
+              f"{stats['total_ms']:>10.1f} {stats['max_ms']:>9.1f} {stats['rows']:>8} "
+              f"{stats['rows_examined']:>10}  {stats['name']}")
+    flagged = [s for s in get_profile() if s['warnings']]
+    if flagged:
+        print("")
+        print("Plan warnings:")
+        for stats in flagged:
+            for warning in stats['warnings']:
+                print(f"  {stats['database']} {stats['fingerprint']}: {warning}")
+    else:
+        print("No full table scans or unindexed joins detected.")
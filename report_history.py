@@ -0,0 +1,140 @@
+#report_history.py
+#Sidik jari (fingerprint) laporan per lokasi dan riwayat keputusan kirim/lewati
+#  python report_history.py [--last 20]
+#Mode untuk laporan yang tidak berubah diatur dengan REPORT_UNCHANGED_MODE:
+#  send   - selalu kirim laporan lengkap (default)
+#  skip   - tidak kirim apa pun
+#  notice - kirim email singkat "tidak ada perubahan"
+
+import os
+import json
+import time
+import hashlib
+import argparse
+from dotenv import load_dotenv
+from metrics import RUN_ID
+
+# Load environment variables
+load_dotenv()
+
+UNCHANGED_MODES = ("send", "skip", "notice")
+
+# Decisions after which a retry in the same scheduler slot must not send the report again
+HANDLED_DECISIONS = ("sent", "queued", "skipped", "notice")
+
+
+def unchanged_mode():
+    """What to do with a report whose numbers match the last delivered one."""
+    value = os.getenv("REPORT_UNCHANGED_MODE", "send").lower()
+    return value if value in UNCHANGED_MODES else "send"
+
+
+def history_file():
+    return os.getenv("REPORT_HISTORY_FILE", "report_history.jsonl")
+
+
+def state_file():
+    return os.getenv("REPORT_STATE_FILE", "report_state.json")
+
+
+def fingerprint(model):
+    """
+    Hash of a computed report model.
+
+    The model is serialized as canonical JSON (sorted keys, Decimal and dates as
+    strings), so two runs over the same numbers give the same fingerprint.
+    """
+    raw = json.dumps(model, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _read_state():
+    try:
+        with open(state_file(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def last_delivered(report_key):
+    """Return the state of the last delivered report for this key, or None."""
+    return _read_state().get(report_key)
+
+
+def is_unchanged(report_key, report_fingerprint):
+    last = last_delivered(report_key)
+    return last is not None and last['fingerprint'] == report_fingerprint
+
+
+def mark_delivered(report_key, report_fingerprint):
+    """Remember the fingerprint of a report that was just sent; never call it for a message that is only queued."""
+    state = _read_state()
+    state[report_key] = {'fingerprint': report_fingerprint, 'delivered': time.time()}
+    path = state_file()
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def record_decision(job, report_key, report_fingerprint, decision, **fields):
+    """
+    Append one line to the run history.
+
+    Args:
+        job (str): Script that made the decision, e.g. 'vehicle_reporting'
+        report_key (str): Location and report date the fingerprint belongs to
+        report_fingerprint (str): Fingerprint of the computed model
+        decision (str): 'sent', 'queued', 'partial', 'skipped', 'notice' or 'failed'
+        **fields: Extra values to store, e.g. location
+    """
+    entry = {
+        'ts': time.time(),
+        'run_id': RUN_ID,
+        'job': job,
+        'key': report_key,
+        'fingerprint': report_fingerprint,
+        'decision': decision,
+        **fields,
+    }
+    with open(history_file(), "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, default=str) + "\n")
+
+
+def slot_start():
+    """Start of the scheduler slot this run belongs to (REPORT_SLOT_START, epoch seconds), None outside the scheduler."""
+    value = os.getenv("REPORT_SLOT_START")
+    return float(value) if value else None
+
+
+def handled_in_slot(report_key):
+    """
+    Return True if an earlier attempt in the current scheduler slot already sent, queued or skipped this report.
+
+    Lets report_scheduler.py retry a whole job without emailing the reports
+    that went out before it hung or failed. A failed or partial send is not
+    handled and is sent again in full.
+    """
+    since = slot_start()
+    if since is None:
+        return False
+    return any(entry['key'] == report_key and entry['ts'] >= since and entry['decision'] in HANDLED_DECISIONS
+               for entry in read_history())
+
+
+def read_history(last=None):
+    try:
+        with open(history_file(), encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return []
+    return entries[-last:] if last else entries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Show send/skip decisions of recent report runs')
+    parser.add_argument('--last', type=int, default=20, help='Number of entries to show')
+    args = parser.parse_args()
+
+    for entry in read_history(args.last):
+        when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['ts']))
+        print(f"{when}  {entry['job']:<18} {entry['key']:<30} {entry['decision']:<8} {entry['fingerprint'][:12]}")
@@ -0,0 +1,427 @@
+#report_model.py
+#Model laporan bertipe: dihitung sekali per lokasi, lalu dipakai oleh semua renderer
+#(HTML, teks, JSON, CSV) di report_renderers.py tanpa query tambahan
+
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Optional, Tuple
+
+MONTHS_ID = {
+    1: 'Januari', 2: 'Februari', 3: 'Maret', 4: 'April',
+    5: 'Mei', 6: 'Juni', 7: 'Juli', 8: 'Agustus',
+    9: 'September', 10: 'Oktober', 11: 'November', 12: 'Desember'
+}
+
+
+def format_currency(amount):
+    """Format number to Indonesian Rupiah."""
+    return f"Rp {amount:,.0f}"
+
+def format_percentage(value):
+    """Format number to percentage with 2 decimal places."""
+    return f"{value:+.2f}%" if value != 0 else "0.00%"
+
+def format_date(date):
+    """Format date to Indonesian format."""
+    return f"{date.day} {MONTHS_ID[date.month]} {date.year}"
+
+
+@dataclass(frozen=True)
+class PaymentSplit:
+    """Units and amount for one payment method (tunai or kredit)."""
+    count: int
+    amount: float
+
+
+@dataclass(frozen=True)
+class Comparison:
+    """A period compared with an earlier one (same date last year or last month)."""
+    units: int
+    amount: float
+    unit_change: int
+    unit_change_pct: float
+    amount_change: float
+    amount_change_pct: float
+
+
+@dataclass(frozen=True)
+class PeriodCard:
+    """
+    One summary card of the vehicle report.
+
+    kind is 'sales' (amount = total harga beli, payment amounts = margin) or
+    'margin' (amount = total margin); period is 'daily', 'weekly' or 'monthly'.
+    For weekly cards vs_last_month holds the comparison with last week.
+    """
+    kind: str
+    period: str
+    title: str
+    units: int
+    amount: float
+    tunai: PaymentSplit
+    kredit: PaymentSplit
+    vs_last_year: Comparison
+    vs_last_month: Comparison
+
+
+@dataclass(frozen=True)
+class TrendMonth:
+    """Units and margin of one calendar month and of the same month a year earlier."""
+    year: int
+    month: int
+    units: int
+    margin: float
+    last_year_units: int
+    last_year_margin: float
+
+
+@dataclass(frozen=True)
+class YearComparison:
+    """Same-day, month-to-date and year-to-date figures of one year, each up to that year's report day."""
+    year: int
+    day_units: int
+    day_margin: float
+    mtd_units: int
+    mtd_margin: float
+    ytd_units: int
+    ytd_margin: float
+
+
+@dataclass(frozen=True)
+class Breakdown:
+    """Units and margin of one finance company or tenor bucket."""
+    label: str
+    units: int
+    margin: float
+
+
+@dataclass(frozen=True)
+class PipelineRow:
+    """SPKs booked, undelivered SPKs and SPK-to-BAST lead time of one SPV or a whole location."""
+    name: str
+    today_spk: int
+    mtd_spk: int
+    backlog: int
+    delivered: int
+    lead_days: int
+
+    @property
+    def average_lead_days(self):
+        return self.lead_days / self.delivered if self.delivered else 0
+
+
+@dataclass(frozen=True)
+class VehicleReport:
+    database: str
+    location: str
+    report_date: date
+    generated_at: datetime
+    sales: Tuple[PeriodCard, ...]
+    margins: Tuple[PeriodCard, ...]
+    trend: Tuple[TrendMonth, ...] = ()
+    years: Tuple[YearComparison, ...] = ()
+    finance: Tuple[Breakdown, ...] = ()
+    tenors: Tuple[Breakdown, ...] = ()
+    pipeline: Optional[PipelineRow] = None
+    pipeline_spvs: Tuple[PipelineRow, ...] = ()
+
+    @property
+    def cards(self):
+        return self.sales + self.margins
+
+    def card(self, kind, period):
+        return next((card for card in self.cards if card.kind == kind and card.period == period), None)
+
+
+@dataclass(frozen=True)
+class SalesRow:
+    """DO count and margin of one salesperson, both locations combined."""
+    name: str
+    today_do: int
+    mtd_do: int
+    ytd_do: int
+    today_margin: float
+    mtd_margin: float
+    ytd_margin: float
+
+
+@dataclass(frozen=True)
+class SpvRow:
+    """DO counts of one SPV across both locations, with their salespeople ranked by YTD DO."""
+    name: str
+    today_madiun: int
+    today_magetan: int
+    mtd_madiun: int
+    mtd_magetan: int
+    ytd_madiun: int
+    ytd_magetan: int
+    sales: Tuple[SalesRow, ...] = ()
+
+    @property
+    def today_total(self):
+        return self.today_madiun + self.today_magetan
+
+    @property
+    def mtd_total(self):
+        return self.mtd_madiun + self.mtd_magetan
+
+    @property
+    def ytd_total(self):
+        return self.ytd_madiun + self.ytd_magetan
+
+
+@dataclass(frozen=True)
+class SpvReport:
+    start_date: str
+    end_date: str
+    rows: Tuple[SpvRow, ...]
+
+
+# Zero comparison, for periods without a comparison window
+EMPTY_CHANGES = {
+    'unit_change': 0, 'unit_change_pct': 0, 'value_change': 0, 'value_change_pct': 0,
+    'last_year_units': 0, 'last_year_value': 0, 'last_month_units': 0, 'last_month_value': 0,
+}
+
+
+def sales_card(period, title, data, yoy, mom):
+    """Build a sales card from get_vehicle_data() output and calculate_yoy/mom_changes() results."""
+    summary = data['summary']
+    payments = summary['payment_methods']
+    return PeriodCard(
+        kind='sales', period=period, title=title,
+        units=summary['total_units'], amount=summary['total_value'],
+        tunai=PaymentSplit(payments['tunai']['count'], payments['tunai']['margin']),
+        kredit=PaymentSplit(payments['kredit']['count'], payments['kredit']['margin']),
+        vs_last_year=Comparison(yoy['last_year_units'], yoy['last_year_value'], yoy['unit_change'],
+                                yoy['unit_change_pct'], yoy['value_change'], yoy['value_change_pct']),
+        vs_last_month=Comparison(mom['last_month_units'], mom['last_month_value'], mom['unit_change'],
+                                 mom['unit_change_pct'], mom['value_change'], mom['value_change_pct']),
+    )
+
+
+def margin_card(period, title, margin, yoy, mom):
+    """Build a margin card from get_margin_summary() output and calculate_margin_changes() results."""
+    def comparison(changes):
+        return Comparison(changes['last_period_vehicles'], changes['last_period_margin'],
+                          changes['vehicles_change'], changes['vehicles_change_pct'],
+                          changes['margin_change'], changes['margin_change_pct'])
+
+    return PeriodCard(
+        kind='margin', period=period, title=title,
+        units=margin['total_vehicles'], amount=margin['total_margin'],
+        tunai=PaymentSplit(margin['tunai_count'], margin['tunai_margin']),
+        kredit=PaymentSplit(margin['kredit_count'], margin['kredit_margin']),
+        vs_last_year=comparison(yoy),
+        vs_last_month=comparison(mom),
+    )
+
+
+def build_vehicle_report(database, location, report_date, generated_at,
+                         daily_data, monthly_data, daily_yoy, monthly_yoy, daily_mom, monthly_mom,
+                         daily_margin=None, monthly_margin=None, daily_margin_yoy=None,
+                         daily_margin_mom=None, monthly_margin_yoy=None, monthly_margin_mom=None, trend=None,
+                         weekly_data=None, weekly_yoy=None, weekly_wow=None, years=None, pipeline=None):
+    """
+    Build the vehicle report model for one location.
+
+    The margin cards are only included when both daily and monthly margin data
+    are present, as in the HTML report. trend is the month list returned by
+    vehicle_reporting.get_monthly_trend(). The weekly card is added when
+    weekly_data is given; weekly_wow (vs last week) takes the month-over-month
+    slot of the card. years is the list returned by
+    vehicle_reporting.get_year_comparison(), current year first. The leasing
+    breakdown (finance companies and tenor buckets) is taken from the
+    month-to-date summary. pipeline is db_operations.get_spk_pipeline() passed
+    through merge_spk_pipelines(), for one location or the whole group.
+    """
+    sales = [sales_card('daily', "Penjualan Hari Ini", daily_data, daily_yoy, daily_mom)]
+    if weekly_data:
+        sales.append(sales_card('weekly', "Penjualan Minggu Ini", weekly_data,
+                                weekly_yoy or EMPTY_CHANGES, weekly_wow or EMPTY_CHANGES))
+    sales.append(sales_card('monthly', "Penjualan Bulan Ini", monthly_data, monthly_yoy, monthly_mom))
+    margins = ()
+    if daily_margin and monthly_margin:
+        margins = (
+            margin_card('daily', "Keuntungan Hari Ini", daily_margin, daily_margin_yoy, daily_margin_mom),
+            margin_card('monthly', "Keuntungan Bulan Ini", monthly_margin, monthly_margin_yoy, monthly_margin_mom),
+        )
+    trend = tuple(TrendMonth(**month) for month in trend or ())
+    years = tuple(YearComparison(**year) for year in years or ())
+    summary = monthly_data['summary']
+    finance = sorted(summary.get('finance', {}).items(), key=lambda item: item[1]['units'], reverse=True)
+    finance = tuple(Breakdown(label, stats['units'], stats['margin']) for label, stats in finance)
+    tenors = tuple(Breakdown(label, stats['units'], stats['margin']) for label, stats in summary.get('tenor', {}).items())
+    pipeline_total, pipeline_spvs = None, ()
+    if pipeline:
+        pipeline_total = PipelineRow(location, **pipeline['summary'])
+        pipeline_spvs = tuple(
+            PipelineRow(spv['nama_spv'], spv['today_spk'], spv['mtd_spk'], spv['backlog'], spv['delivered'],
+                        spv['lead_days'])
+            for spv in pipeline['spvs']
+        )
+    return VehicleReport(database, location, report_date, generated_at, tuple(sales), margins, trend, years,
+                         finance, tenors, pipeline_total, pipeline_spvs)
+
+
+def _merge_counts(values):
+    """Sum dicts of numbers key by key; nested dicts (e.g. per-day stats) are merged recursively."""
+    merged = {}
+    for value in values:
+        for key, item in value.items():
+            if isinstance(item, dict):
+                merged[key] = _merge_counts([merged.get(key, {}), item])
+            else:
+                merged[key] = merged.get(key, 0) + item
+    return merged
+
+
+def merge_vehicle_data(datasets):
+    """
+    Combine get_vehicle_data() results of several locations into one.
+
+    Totals, payment methods, model counts and daily stats are summed; the
+    averages and percentages are recomputed from the summed totals.
+    """
+    summaries = [data['summary'] for data in datasets]
+    total_units = sum(summary.get('total_units') or 0 for summary in summaries)
+    total_value = sum(float(summary.get('total_value') or 0) for summary in summaries)
+    total_margin = sum(float(summary.get('total_margin') or 0) for summary in summaries)
+    return {
+        'data': [row for data in datasets for row in data.get('data', [])],
+        'summary': {
+            'total_units': total_units,
+            'total_value': total_value,
+            'total_margin': total_margin,
+            'average_margin': total_margin / total_units if total_units > 0 else 0,
+            'margin_percentage': (total_margin / total_value * 100) if total_value > 0 else 0,
+            'models_count': _merge_counts(summary.get('models_count', {}) for summary in summaries),
+            'daily_stats': _merge_counts(summary.get('daily_stats', {}) for summary in summaries),
+            'finance': _merge_counts(summary.get('finance', {}) for summary in summaries),
+            'tenor': _merge_counts(summary.get('tenor', {}) for summary in summaries),
+            'payment_methods': {
+                method: {
+                    'count': sum(summary['payment_methods'][method]['count'] for summary in summaries
+                                 if 'payment_methods' in summary),
+                    'margin': sum(float(summary['payment_methods'][method]['margin']) for summary in summaries
+                                  if 'payment_methods' in summary),
+                }
+                for method in ('tunai', 'kredit')
+            },
+        },
+    }
+
+
+MARGIN_SUM_FIELDS = ('total_vehicles', 'total_margin', 'total_harga_jual', 'total_harga_tebus',
+                     'tunai_count', 'kredit_count', 'tunai_margin', 'kredit_margin')
+
+
+def merge_margin_summaries(summaries):
+    """Combine get_margin_summary() results of several locations; average_margin is recomputed."""
+    merged = {field: sum(float(summary[field] or 0) for summary in summaries) for field in MARGIN_SUM_FIELDS}
+    for field in ('total_vehicles', 'tunai_count', 'kredit_count'):
+        merged[field] = int(merged[field])
+    merged['average_margin'] = merged['total_margin'] / merged['total_vehicles'] if merged['total_vehicles'] > 0 else 0
+    return merged
+
+
+def merge_trends(trends):
+    """Sum get_monthly_trend() results of several locations month by month."""
+    merged = {}
+    for trend in trends:
+        for month in trend:
+            bucket = merged.setdefault((month['year'], month['month']), {
+                'year': month['year'], 'month': month['month'],
+                'units': 0, 'margin': 0, 'last_year_units': 0, 'last_year_margin': 0,
+            })
+            for field in ('units', 'margin', 'last_year_units', 'last_year_margin'):
+                bucket[field] += month[field]
+    return [merged[key] for key in sorted(merged)]
+
+
+def merge_year_comparisons(comparisons):
+    """Sum get_year_comparison() results of several locations year by year, current year first."""
+    merged = {}
+    for comparison in comparisons:
+        for year in comparison:
+            bucket = merged.setdefault(year['year'], dict.fromkeys(year, 0))
+            bucket['year'] = year['year']
+            for field, value in year.items():
+                if field != 'year':
+                    bucket[field] += value
+    return [merged[year] for year in sorted(merged, reverse=True)]
+
+
+def merge_spk_pipelines(pipelines, identities=None):
+    """
+    Sum get_spk_pipeline() results per person, for one location or several.
+
+    SPV rows are resolved like build_spv_report() does: by database and NIK
+    through identities (a staff_identity.IdentityMap) when given, otherwise
+    by normalized name. Rows without a NIK, such as an already merged
+    pipeline, are matched by name with the alias spellings applied.
+    """
+    spvs = {}
+    for pipeline in pipelines:
+        database_name = pipeline.get('database')
+        for spv in pipeline['spvs']:
+            name = (identities.resolve(database_name, spv.get('nik'), spv['nama_spv']) if identities
+                    else normalize_spv_name(spv['nama_spv']))
+            merged = spvs.setdefault(name, {'nama_spv': name})
+            for field, value in spv.items():
+                if field not in ('nik', 'nama_spv'):
+                    merged[field] = merged.get(field, 0) + value
+    return {
+        'spvs': sorted(spvs.values(), key=lambda spv: spv['backlog'], reverse=True),
+        'summary': _merge_counts(pipeline['summary'] for pipeline in pipelines),
+    }
+
+
+def normalize_spv_name(name):
+    """Normalize an employee name for matching; spelling aliases are applied by staff_identity.IdentityMap."""
+    return name.strip().title() if name else "Unknown"
+
+
+def build_spv_report(spv_data, start_date, end_date, identities=None):
+    """
+    Build the SPV report model from get_spv_performance() rows of both databases.
+
+    Rows must carry 'database_source'. Each SPV and salesperson is resolved
+    to one person through identities (a staff_identity.IdentityMap, keyed by
+    database and NIK); without it the normalized name is used. Rows of the
+    same person are combined and sorted by YTD total DO, highest first.
+    """
+    columns = {'honda_mis': 'madiun', 'm2_magetan': 'magetan'}
+    sales_fields = ('today_do', 'mtd_do', 'ytd_do', 'today_margin', 'mtd_margin', 'ytd_margin')
+    combined = {}
+    team = {}
+    for spv in spv_data['data']:
+        location = columns.get(spv.get('database_source', 'unknown'))
+        if location is None:
+            continue
+        database_name = spv['database_source']
+        name = (identities.resolve(database_name, spv.get('nik'), spv['nama_spv']) if identities
+                else normalize_spv_name(spv['nama_spv']))
+        counts = combined.setdefault(name, {
+            'today_madiun': 0, 'today_magetan': 0,
+            'mtd_madiun': 0, 'mtd_magetan': 0,
+            'ytd_madiun': 0, 'ytd_magetan': 0,
+        })
+        counts[f'today_{location}'] += spv['today_do'] or 0
+        counts[f'mtd_{location}'] += spv['mtd_do'] or 0
+        counts[f'ytd_{location}'] += spv['ytd_do'] or 0
+        for sales in spv.get('sales', ()):
+            sales_name = (identities.resolve(database_name, sales.get('nik'), sales['nama_sales']) if identities
+                          else normalize_spv_name(sales['nama_sales']))
+            merged = team.setdefault(name, {}).setdefault(sales_name, dict.fromkeys(sales_fields, 0))
+            for field in sales_fields:
+                merged[field] += sales[field] or 0
+
+    def ranked_sales(name):
+        members = [SalesRow(sales_name, **counts) for sales_name, counts in team.get(name, {}).items()]
+        members.sort(key=lambda row: (row.ytd_do, row.ytd_margin), reverse=True)
+        return tuple(members)
+
+    rows = [SpvRow(name, **counts, sales=ranked_sales(name)) for name, counts in combined.items()]
+    rows.sort(key=lambda row: row.ytd_total, reverse=True)
+    return SpvReport(start_date, end_date, tuple(rows))
@@ -0,0 +1,435 @@
+#report_renderers.py
+#Renderer HTML, teks, JSON dan CSV untuk model di report_model.py
+#  render(model, "text") / export(model, "m2_madiun_2025-06-05", ["json", "csv"])
+
+import os
+import io
+import csv
+import json
+from dataclasses import asdict
+from datetime import date, datetime
+from decimal import Decimal
+from report_model import VehicleReport, SpvReport, format_currency, format_percentage, format_date, MONTHS_ID
+import report_templates
+
+CARD_ICONS = {'sales': "📊", 'margin': "💰"}
+
+# Title of the second comparison; weekly cards compare with last week
+MOM_TITLES = {'weekly': "vs Minggu Lalu"}
+
+FORMATS = ("html", "text", "json", "csv")
+
+
+# Vehicle report
+
+def _comparison_fragment(card, comparison):
+    if card.kind == 'sales':
+        change, pct = f"{comparison.unit_change:+d} Unit", comparison.unit_change_pct
+        negative = comparison.unit_change < 0
+    else:
+        change, pct = format_currency(comparison.amount_change), comparison.amount_change_pct
+        negative = comparison.amount_change < 0
+    return (comparison.units, format_currency(comparison.amount), change, format_percentage(pct), negative)
+
+
+def vehicle_html(report):
+    cards = [
+        report_templates.stat_card(
+            card.kind, f"{CARD_ICONS[card.kind]} {card.title}", card.units, format_currency(card.amount),
+            card.tunai.count, format_currency(card.tunai.amount),
+            card.kredit.count, format_currency(card.kredit.amount),
+            _comparison_fragment(card, card.vs_last_year),
+            _comparison_fragment(card, card.vs_last_month),
+            MOM_TITLES.get(card.period, "vs Bulan Lalu"),
+        )
+        for card in report.cards
+    ]
+    return report_templates.vehicle_report(report.location, format_date(report.report_date),
+                                           report.generated_at.strftime("%H:%M:%S"), cards,
+                                           (trend_html(report.trend), years_html(report.years),
+                                            leasing_html(report.finance, report.tenors),
+                                            pipeline_html(report.pipeline, report.pipeline_spvs)))
+
+
+SPARK_BLOCKS = "▁▂▃▄▅▆▇█"
+
+
+def sparkline(values, top=None):
+    """Unicode block sparkline; pass the same top for two series to put them on one scale."""
+    top = top if top is not None else max(values, default=0)
+    if not top:
+        return SPARK_BLOCKS[0] * len(values)
+    return "".join(SPARK_BLOCKS[round(value / top * (len(SPARK_BLOCKS) - 1))] for value in values)
+
+
+def _month_label(month):
+    return f"{MONTHS_ID[month.month][:3]} {month.year % 100:02d}"
+
+
+def _format_millions(amount):
+    return f"{amount / 1_000_000:,.1f} jt"
+
+
+def trend_html(trend):
+    if not trend:
+        return ""
+    top = max(max(month.units, month.last_year_units) for month in trend)
+    rows = [
+        report_templates.trend_row(
+            _month_label(month), month.units, month.last_year_units,
+            _format_millions(month.margin), _format_millions(month.last_year_margin),
+            month.units < month.last_year_units, month.margin < month.last_year_margin,
+        )
+        for month in trend
+    ]
+    return report_templates.trend_section(
+        len(trend), sparkline([month.units for month in trend], top),
+        sparkline([month.last_year_units for month in trend], top), rows)
+
+
+def years_html(years):
+    if not years:
+        return ""
+    rows = [
+        report_templates.year_row(
+            year.year,
+            (year.day_units, _format_millions(year.day_margin)),
+            (year.mtd_units, _format_millions(year.mtd_margin)),
+            (year.ytd_units, _format_millions(year.ytd_margin)),
+        )
+        for year in years
+    ]
+    return report_templates.years_section(rows)
+
+
+def leasing_html(finance, tenors):
+    if not finance and not tenors:
+        return ""
+    return report_templates.leasing_section(
+        [report_templates.breakdown_row(item.label, item.units, _format_millions(item.margin)) for item in finance],
+        [report_templates.breakdown_row(item.label, item.units, _format_millions(item.margin)) for item in tenors],
+    )
+
+
+def _format_lead_time(row):
+    return f"{row.average_lead_days:.1f} hari" if row.delivered else "-"
+
+
+def pipeline_html(total, spvs):
+    if total is None:
+        return ""
+    return report_templates.pipeline_section(
+        total.today_spk, total.mtd_spk, total.backlog, _format_lead_time(total),
+        [report_templates.pipeline_row(spv.name, spv.today_spk, spv.mtd_spk, spv.backlog, _format_lead_time(spv))
+         for spv in spvs],
+    )
+
+
+def vehicle_text(report):
+    """Plain-text version of the vehicle report for the text/plain part of the email."""
+    lines = [report.location, format_date(report.report_date), ""]
+    for card in report.cards:
+        amount_label = "Total harga beli" if card.kind == 'sales' else "Total keuntungan"
+        payment_label = "margin " if card.kind == 'sales' else ""
+        lines += [
+            card.title,
+            f"  Unit terjual     : {card.units}",
+            f"  {amount_label:<17}: {format_currency(card.amount)}",
+            f"  Tunai            : {card.tunai.count} unit, {payment_label}{format_currency(card.tunai.amount)}",
+            f"  Kredit           : {card.kredit.count} unit, {payment_label}{format_currency(card.kredit.amount)}",
+        ]
+        for label, comparison in (("vs Tahun Lalu", card.vs_last_year),
+                                  (MOM_TITLES.get(card.period, "vs Bulan Lalu"), card.vs_last_month)):
+            units, amount, change, pct, _ = _comparison_fragment(card, comparison)
+            lines.append(f"  {label:<17}: {units} unit ({amount}), {change} ({pct})")
+        lines.append("")
+    if report.trend:
+        top = max(max(month.units, month.last_year_units) for month in report.trend)
+        lines += [
+            f"Tren {len(report.trend)} Bulan",
+            f"  Unit       {sparkline([month.units for month in report.trend], top)}",
+            f"  Tahun lalu {sparkline([month.last_year_units for month in report.trend], top)}",
+        ]
+        for month in report.trend:
+            lines.append(f"  {_month_label(month):<7} {month.units:>5} unit ({month.last_year_units:>5} TL)  "
+                         f"{_format_millions(month.margin):>10} ({_format_millions(month.last_year_margin)} TL)")
+        lines.append("")
+    if report.years:
+        lines.append(f"Perbandingan {len(report.years)} Tahun (unit / keuntungan)")
+        lines.append(f"  {'Tahun':<6} {'Hari Ini':>18} {'MTD':>20} {'YTD':>22}")
+        for year in report.years:
+            day = f"{year.day_units} / {_format_millions(year.day_margin)}"
+            mtd = f"{year.mtd_units} / {_format_millions(year.mtd_margin)}"
+            ytd = f"{year.ytd_units} / {_format_millions(year.ytd_margin)}"
+            lines.append(f"  {year.year:<6} {day:>18} {mtd:>20} {ytd:>22}")
+        lines.append("")
+    if report.finance or report.tenors:
+        lines.append("Leasing Bulan Ini (unit / keuntungan)")
+        width = max(len(item.label) for item in report.finance + report.tenors)
+        for heading, items in (("Finance", report.finance), ("Tenor", report.tenors)):
+            lines.append(f"  {heading}")
+            for item in items:
+                lines.append(f"    {item.label:<{width}} {item.units:>5}  {_format_millions(item.margin):>10}")
+        lines.append("")
+    if report.pipeline:
+        total = report.pipeline
+        lines += [
+            "Pipeline SPK",
+            f"  SPK hari ini     : {total.today_spk}",
+            f"  SPK bulan ini    : {total.mtd_spk}",
+            f"  SPK belum BAST   : {total.backlog}",
+            f"  SPK ke BAST      : {_format_lead_time(total)}",
+        ]
+        if report.pipeline_spvs:
+            width = max(len(spv.name) for spv in report.pipeline_spvs)
+            lines.append(f"  {'SPV':<{width}} {'Hari':>5} {'MTD':>5} {'Belum':>6} {'Lead':>10}")
+            for spv in report.pipeline_spvs:
+                lines.append(f"  {spv.name:<{width}} {spv.today_spk:>5} {spv.mtd_spk:>5} {spv.backlog:>6} "
+                             f"{_format_lead_time(spv):>10}")
+        lines.append("")
+    lines.append(f"Laporan dibuat otomatis pada {report.generated_at:%H:%M:%S}")
+    return "\n".join(lines) + "\n"
+
+
+def _json_value(value):
+    # SUM() columns arrive as Decimal; dates as date/datetime
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def vehicle_json(report):
+    return json.dumps(asdict(report), indent=2, default=_json_value)
+
+
+VEHICLE_CSV_COLUMNS = [
+    'database', 'location', 'report_date', 'kind', 'period', 'units', 'amount',
+    'tunai_count', 'tunai_amount', 'kredit_count', 'kredit_amount',
+    'last_year_units', 'last_year_amount', 'last_year_unit_change_pct', 'last_year_amount_change_pct',
+    'last_month_units', 'last_month_amount', 'last_month_unit_change_pct', 'last_month_amount_change_pct',
+]
+
+
+def vehicle_csv(report):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(VEHICLE_CSV_COLUMNS)
+    for card in report.cards:
+        yoy, mom = card.vs_last_year, card.vs_last_month
+        writer.writerow([
+            report.database, report.location, report.report_date.isoformat(), card.kind, card.period,
+            card.units, round(card.amount, 2),
+            card.tunai.count, round(card.tunai.amount, 2), card.kredit.count, round(card.kredit.amount, 2),
+            yoy.units, round(yoy.amount, 2), round(yoy.unit_change_pct, 2), round(yoy.amount_change_pct, 2),
+            mom.units, round(mom.amount, 2), round(mom.unit_change_pct, 2), round(mom.amount_change_pct, 2),
+        ])
+    return out.getvalue()
+
+
+# SPV report
+
+def _format_date_id(date_str):
+    try:
+        year, month, day = (int(part) for part in date_str.split("-"))
+        return f"{day} {MONTHS_ID[month]} {year}"
+    except (ValueError, KeyError):
+        return date_str
+
+
+def spv_html(report):
+    rows = [
+        report_templates.spv_row(
+            row.name,
+            row.today_madiun, row.today_magetan, row.today_total,
+            row.mtd_madiun, row.mtd_magetan, row.mtd_total,
+            row.ytd_madiun, row.ytd_magetan, row.ytd_total,
+        )
+        for row in report.rows
+    ]
+    return report_templates.spv_report(_format_date_id(report.start_date), _format_date_id(report.end_date), rows,
+                                       sales_board_html(report.rows))
+
+
+def sales_board_html(spv_rows):
+    """Sales leaderboard: each SPV's salespeople under an SPV heading row."""
+    parts = []
+    for spv in spv_rows:
+        if not spv.sales:
+            continue
+        parts.append(report_templates.leaderboard_group(spv.name))
+        parts += [
+            report_templates.leaderboard_row(sales.name, sales.today_do, sales.mtd_do, sales.ytd_do,
+                                             _format_millions(sales.mtd_margin), _format_millions(sales.ytd_margin))
+            for sales in spv.sales
+        ]
+    return report_templates.leaderboard(parts)
+
+
+def sales_board_text(spv_rows):
+    lines = []
+    members = [sales for spv in spv_rows for sales in spv.sales]
+    if not members:
+        return lines
+    width = max(len(sales.name) for sales in members)
+    lines += ["", "Sales Leaderboard (DO Today/MTD/YTD, margin MTD/YTD)"]
+    for spv in spv_rows:
+        if spv.sales:
+            lines.append(spv.name)
+        for sales in spv.sales:
+            lines.append(f"  {sales.name:<{width}}  {sales.today_do:>3} {sales.mtd_do:>4} {sales.ytd_do:>5}  "
+                         f"{_format_millions(sales.mtd_margin):>10} {_format_millions(sales.ytd_margin):>11}")
+    return lines
+
+
+def spv_text(report):
+    """Plain-text SPV table: Today, MTD and YTD as Madiun/Magetan/Total per SPV."""
+    width = max([len(row.name) for row in report.rows] + [3])
+    lines = [
+        "SPV DO Report",
+        f"{_format_date_id(report.start_date)} ~ {_format_date_id(report.end_date)}",
+        "",
+        f"{'SPV':<{width}}  {'Today':>13}  {'MTD':>13}  {'YTD':>15}",
+        f"{'':<{width}}  {'Mdn/Mgt/Tot':>13}  {'Mdn/Mgt/Tot':>13}  {'Mdn/Mgt/Tot':>15}",
+    ]
+    for row in report.rows:
+        today = f"{row.today_madiun}/{row.today_magetan}/{row.today_total}"
+        mtd = f"{row.mtd_madiun}/{row.mtd_magetan}/{row.mtd_total}"
+        ytd = f"{row.ytd_madiun}/{row.ytd_magetan}/{row.ytd_total}"
+        lines.append(f"{row.name:<{width}}  {today:>13}  {mtd:>13}  {ytd:>15}")
+    lines += sales_board_text(report.rows)
+    return "\n".join(lines) + "\n"
+
+
+def _spv_row_dict(row):
+    data = asdict(row)
+    data.update(today_total=row.today_total, mtd_total=row.mtd_total, ytd_total=row.ytd_total)
+    return data
+
+
+def spv_json(report):
+    return json.dumps({
+        'start_date': report.start_date,
+        'end_date': report.end_date,
+        'rows': [_spv_row_dict(row) for row in report.rows],
+    }, indent=2)
+
+
+SPV_CSV_COLUMNS = ['name', 'today_madiun', 'today_magetan', 'today_total', 'mtd_madiun', 'mtd_magetan',
+                   'mtd_total', 'ytd_madiun', 'ytd_magetan', 'ytd_total']
+
+
+def spv_csv(report):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=SPV_CSV_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for row in report.rows:
+        writer.writerow(_spv_row_dict(row))
+    return out.getvalue()
+
+
+class SpvPersonalizer:
+    """
+    Per-SPV variants of one SpvReport.
+
+    The ranking rows are rendered once and shared by every variant; each
+    recipient only adds their own table row and a highlighted ranking row.
+    """
+
+    def __init__(self, report):
+        self.report = report
+        self.start = _format_date_id(report.start_date)
+        self.end = _format_date_id(report.end_date)
+        self.positions = {row.name: i for i, row in enumerate(report.rows)}
+        self.ranking_rows = [
+            report_templates.ranking_row(i, row.name, row.today_total, row.mtd_total, row.ytd_total)
+            for i, row in enumerate(report.rows, 1)
+        ]
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def rank(self, name):
+        return self.positions[name] + 1
+
+    def html(self, name):
+        position = self.positions[name]
+        row = self.report.rows[position]
+        own_row = report_templates.spv_row(
+            row.name,
+            row.today_madiun, row.today_magetan, row.today_total,
+            row.mtd_madiun, row.mtd_magetan, row.mtd_total,
+            row.ytd_madiun, row.ytd_magetan, row.ytd_total,
+        )
+        ranking = list(self.ranking_rows)
+        ranking[position] = report_templates.ranking_row(
+            position + 1, row.name, row.today_total, row.mtd_total, row.ytd_total, True)
+        return report_templates.spv_personal_report(name, self.start, self.end, own_row, position + 1, ranking,
+                                                    sales_board_html([row]))
+
+    def text(self, name):
+        row = self.report.rows[self.positions[name]]
+        width = max([len(other.name) for other in self.report.rows] + [3])
+        lines = [
+            f"SPV DO Report: {name}",
+            f"{self.start} ~ {self.end}",
+            "",
+            f"           {'Madiun':>8} {'Magetan':>8} {'Total':>8}",
+            f"Today      {row.today_madiun:>8} {row.today_magetan:>8} {row.today_total:>8}",
+            f"MTD        {row.mtd_madiun:>8} {row.mtd_magetan:>8} {row.mtd_total:>8}",
+            f"YTD        {row.ytd_madiun:>8} {row.ytd_magetan:>8} {row.ytd_total:>8}",
+            "",
+            f"Peringkat #{self.rank(name)} dari {len(self.report.rows)} SPV (YTD)",
+            "",
+            f"{'#':>3}  {'SPV':<{width}}  {'Today':>5}  {'MTD':>5}  {'YTD':>6}",
+        ]
+        for i, other in enumerate(self.report.rows, 1):
+            marker = "*" if other.name == name else " "
+            lines.append(f"{i:>3}{marker} {other.name:<{width}}  {other.today_total:>5}  {other.mtd_total:>5}  {other.ytd_total:>6}")
+        lines += sales_board_text([row])
+        return "\n".join(lines) + "\n"
+
+
+RENDERERS = {
+    VehicleReport: {'html': vehicle_html, 'text': vehicle_text, 'json': vehicle_json, 'csv': vehicle_csv},
+    SpvReport: {'html': spv_html, 'text': spv_text, 'json': spv_json, 'csv': spv_csv},
+}
+
+
+def render(report, output_format):
+    """Render a report model as 'html', 'text', 'json' or 'csv'."""
+    try:
+        return RENDERERS[type(report)][output_format](report)
+    except KeyError:
+        raise ValueError(f"Unknown output format '{output_format}' for {type(report).__name__}") from None
+
+
+def export_formats():
+    """Formats to write next to the email, from REPORT_EXPORT_FORMATS (e.g. 'json,csv')."""
+    formats = [value.strip().lower() for value in os.getenv("REPORT_EXPORT_FORMATS", "").split(",") if value.strip()]
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown REPORT_EXPORT_FORMATS: {', '.join(sorted(unknown))}")
+    return formats
+
+
+def export(report, name, formats=None, directory=None):
+    """
+    Write the report in each format to REPORT_EXPORT_DIR (default exports/).
+
+    Returns:
+        list: Paths of the written files
+    """
+    formats = export_formats() if formats is None else formats
+    directory = directory or os.getenv("REPORT_EXPORT_DIR", "exports")
+    extensions = {'html': "html", 'text': "txt", 'json': "json", 'csv': "csv"}
+    paths = []
+    if formats:
+        os.makedirs(directory, exist_ok=True)
+    for output_format in formats:
+        path = os.path.join(directory, f"{name}.{extensions[output_format]}")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(render(report, output_format))
+        paths.append(path)
+    return paths
@@ -2,10 +2,13 @@
 #untuk bikin .exe
 #pyinstaller --onefile report_scheduler.py
 
+import os
 import time
 import subprocess
 import logging
 from datetime import datetime
+from run_phase import read_phase, clear_phase
+import outbox
 
 # Set up logging
 logging.basicConfig(
@@ -14,37 +17,110 @@ logging.basicConfig(
     format='%(asctime)s - %(message)s'
 )
 
-def run_report():
+# Wall-clock budget per report job in seconds; an overrunning job is killed
+JOB_TIMEOUTS = {
+    "vehicle": 600,
+    "spv": 300,
+}
+# Attempts per job while the slot's grace window is still open
+MAX_ATTEMPTS = 3
+# Pause before retrying a job that exited with an error, e.g. while the database restarts
+RETRY_DELAY_SECONDS = 30
+
+def run_job(job_name, label, command, window_end=None, slot_start=None):
+    """
+    Run one report job under its wall-clock budget.
+
+    A job that overruns its budget is killed and the phase it hung in is logged.
+    A job that timed out or exited with a non-zero code is retried as long as
+    the slot's grace window is still open. Retries are safe: every attempt gets
+    REPORT_SLOT_START, and the jobs skip each report that report_history
+    already records as sent, queued or skipped in this slot, so only the
+    reports that did not go out are sent again.
+
+    Args:
+        job_name (str): Key into JOB_TIMEOUTS
+        label (str): Human readable job name for the log
+        command (list): Command line to run
+        window_end (datetime, optional): End of the slot's grace window
+        slot_start (float, optional): Start of the slot (epoch seconds), default now
+
+    Returns:
+        CompletedProcess: Result of the last attempt, or None if it timed out
+    """
+    timeout = JOB_TIMEOUTS[job_name]
+    phase_file = os.path.abspath(f".phase-{job_name}")
+    env = dict(os.environ, REPORT_PHASE_FILE=phase_file,
+               REPORT_SLOT_START=str(slot_start if slot_start is not None else time.time()))
+
+    result = None
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        logging.info(f"Running {label} (attempt {attempt}/{MAX_ATTEMPTS}, budget {timeout}s)...")
+        clear_phase(phase_file)
+        try:
+            result = subprocess.run(command, capture_output=True, text=True,
+                                    timeout=timeout, env=env)
+            clear_phase(phase_file)
+            if result.returncode == 0:
+                return result
+            logging.error(f"{label} exited with return code {result.returncode}")
+            if result.stdout:
+                logging.info(f"{label} output: {result.stdout}")
+            if result.stderr:
+                logging.error(f"{label} error: {result.stderr}")
+        except subprocess.TimeoutExpired as e:
+            result = None
+            hung = read_phase(phase_file)
+            if hung:
+                phase, detail, stuck_for = hung
+                logging.error(f"{label} exceeded {timeout}s budget and was killed; "
+                              f"hung in phase '{phase}' ({detail}) for {stuck_for:.0f}s")
+            else:
+                logging.error(f"{label} exceeded {timeout}s budget and was killed before reporting a phase")
+            if e.stdout:
+                logging.info(f"{label} partial output: {e.stdout}")
+
+        if attempt == MAX_ATTEMPTS:
+            break
+        if window_end is None or datetime.now() >= window_end:
+            logging.error(f"{label} not retried: grace window has closed")
+            break
+        if result is not None:
+            time.sleep(RETRY_DELAY_SECONDS)
+
+    clear_phase(phase_file)
+    return result
+
+def log_result(label, result):
+    """Log a job that finished cleanly; run_job() already logged the output of failed attempts."""
+    if result is None or result.returncode != 0:
+        return
+    logging.info(f"{label} completed with return code: {result.returncode}")
+    if result.stdout:
+        logging.info(f"{label} output: {result.stdout}")
+    if result.stderr:
+        logging.error(f"{label} error: {result.stderr}")
+
+def run_report(window_end=None):
     current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     logging.info(f"Running reports at {current_time}")
     try:
         # Get current date for YTD report
         today = datetime.now()
+        # Shared by every attempt of both jobs, so retries skip reports already sent in this slot
+        slot_start = time.time()
         start_date = today.replace(month=1, day=1).strftime('%Y-%m-%d')
         end_date = today.strftime('%Y-%m-%d')
         
         # Run vehicle report
-        logging.info("Running vehicle report...")
-        vehicle_result = subprocess.run(["python", "vehicle_reporting.py"], 
-                                      capture_output=True, text=True)
+        vehicle_result = run_job("vehicle", "Vehicle report",
+                                 ["python", "vehicle_reporting.py"], window_end, slot_start)
+        log_result("Vehicle report", vehicle_result)
         
         # Run SPV report
-        logging.info("Running SPV performance report...")
-        spv_result = subprocess.run(["python", "spv_report.py", start_date, end_date],
-                                  capture_output=True, text=True)
-        
-        # Log results
-        logging.info(f"Vehicle report completed with return code: {vehicle_result.returncode}")
-        if vehicle_result.stdout:
-            logging.info(f"Vehicle report output: {vehicle_result.stdout}")
-        if vehicle_result.stderr:
-            logging.error(f"Vehicle report error: {vehicle_result.stderr}")
-            
-        logging.info(f"SPV report completed with return code: {spv_result.returncode}")
-        if spv_result.stdout:
-            logging.info(f"SPV report output: {spv_result.stdout}")
-        if spv_result.stderr:
-            logging.error(f"SPV report error: {spv_result.stderr}")
+        spv_result = run_job("spv", "SPV report",
+                             ["python", "spv_report.py", start_date, end_date], window_end, slot_start)
+        log_result("SPV report", spv_result)
             
     except Exception as e:
         logging.error(f"Failed to run reports: {e}")
@@ -72,13 +148,18 @@ def check_and_run_reports():
             # Only run if we haven't already run for this period
             if period_key not in already_run:
                 logging.info(f"Running report within grace period: {current_hour}:00-{current_hour}:{GRACE_MINUTES}")
-                run_report()
+                window_end = now.replace(minute=GRACE_MINUTES, second=0, microsecond=0)
+                run_report(window_end)
                 already_run.add(period_key)
     
     # Reset the already_run set at midnight to prepare for a new day
     if current_hour == 0 and current_minute == 0:
         already_run.clear()
 
+# Deliver queued report emails in the background while the scheduler runs
+if outbox.is_enabled():
+    outbox.start_sender()
+
 logging.info("Scheduler started with 15-minute grace periods")
 print("Scheduler started with 15-minute grace periods")
 print(f"Reports will run at {SCHEDULE_HOURS} with a {GRACE_MINUTES}-minute grace period")
@@ -0,0 +1,918 @@
+#report_templates.py
+#Kerangka HTML dan CSS statis laporan (dibangun sekali per proses) dan fragmen dinamis yang di-cache
+
+from functools import lru_cache
+
+# Rendered fragments kept per process; the scheduler runs each report in a fresh process.
+# Large enough that a full SPV table never evicts its own rows.
+FRAGMENT_CACHE_SIZE = 16384
+
+
+# Vehicle report (report_renderers.vehicle_html)
+
+VEHICLE_CSS = """
+            @media only screen and (max-width: 600px) {
+                .container {
+                    width: 100% !important;
+                    padding: 8px !important;
+                }
+                .card {
+                    margin: 6px 0 !important;
+                }
+                .stats-row {
+                    grid-template-columns: 1fr !important;
+                    gap: 8px !important;
+                }
+                .comparison-row {
+                    grid-template-columns: 1fr !important;
+                    gap: 6px !important;
+                }
+                .payment-row {
+                    grid-template-columns: 1fr 1fr !important;
+                    gap: 8px !important;
+                }
+            }
+            body {
+                margin: 0;
+                padding: 0;
+                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Helvetica, Arial, sans-serif;
+                background-color: #f5f5f5;
+                color: #333;
+                line-height: 1.3;
+            }
+            .container {
+                max-width: 650px;
+                margin: 0 auto;
+                padding: 10px;
+                background-color: #ffffff;
+            }
+            .header {
+                text-align: center;
+                padding: 15px 0;
+                background: linear-gradient(135deg, #e70000, #c60000);
+                color: white;
+                border-radius: 10px 10px 0 0;
+                box-shadow: 0 3px 6px rgba(0,0,0,0.15);
+            }
+            .header h1 {
+                margin: 0;
+                font-size: 22px;
+                font-weight: 700;
+            }
+            .date-range {
+                font-size: 14px;
+                color: #ffffff;
+                opacity: 0.95;
+                margin-top: 5px;
+            }
+            .card {
+                background: white;
+                border-radius: 10px;
+                box-shadow: 0 3px 8px rgba(0,0,0,0.1);
+                margin: 10px 0;
+                overflow: hidden;
+                border: 1px solid #ddd;
+            }
+            .card-header.do-section {
+                background: linear-gradient(135deg, #1976d2, #1565c0);
+                color: white;
+                padding: 12px 15px;
+            }
+            .card-header.margin-section {
+                background: linear-gradient(135deg, #388e3c, #2e7d32);
+                color: white;
+                padding: 12px 15px;
+            }
+            .card-title {
+                margin: 0;
+                font-size: 18px;
+                font-weight: 600;
+            }
+            .card-body {
+                padding: 15px;
+            }
+            .stats-row {
+                display: table;
+                width: 100%;
+                margin-bottom: 15px;
+            }
+            .stat-box {
+                display: table-cell;
+                width: 50%;
+                text-align: center;
+                padding: 15px 10px;
+                background: linear-gradient(135deg, #f8f9fa, #e9ecef);
+                border-radius: 8px;
+                border: 1px solid #dee2e6;
+                vertical-align: top;
+            }
+            .stat-box:first-child {
+                margin-right: 6px;
+            }
+            .stat-box:last-child {
+                margin-left: 6px;
+            }
+            .stat-value {
+                font-size: 20px;
+                font-weight: bold;
+                color: #333;
+                margin-bottom: 5px;
+            }
+            .stat-label {
+                font-size: 14px;
+                color: #666;
+                font-weight: 500;
+            }
+            .payment-row {
+                display: table;
+                width: 100%;
+                margin-bottom: 15px;
+            }
+            .payment-box {
+                display: table-cell;
+                width: 50%;
+                text-align: center;
+                padding: 12px;
+                background: #fff;
+                border-radius: 8px;
+                border: 2px solid #e9ecef;
+                vertical-align: top;
+            }
+            .payment-box:first-child {
+                margin-right: 6px;
+            }
+            .payment-box:last-child {
+                margin-left: 6px;
+            }
+            .payment-count {
+                font-size: 18px;
+                font-weight: bold;
+                color: #333;
+                margin-bottom: 4px;
+            }
+            .payment-value {
+                font-size: 14px;
+                color: #333;
+                font-weight: 500;
+                margin-bottom: 4px;
+            }
+            .payment-label {
+                font-size: 13px;
+                color: #666;
+                font-weight: 500;
+            }
+            .comparison-row {
+                display: table;
+                width: 100%;
+                margin-top: 15px;
+            }
+            .comparison-box {
+                display: table-cell;
+                width: 50%;
+                background: #f8f9fa;
+                padding: 12px;
+                border-radius: 8px;
+                border: 1px solid #e9ecef;
+                vertical-align: top;
+                text-align: center;
+            }
+            .comparison-box:first-child {
+                margin-right: 6px;
+            }
+            .comparison-box:last-child {
+                margin-left: 6px;
+            }
+            .comparison-title {
+                font-size: 14px;
+                color: #333;
+                margin-bottom: 6px;
+                font-weight: 600;
+            }
+            .comparison-content {
+                font-size: 12px;
+                color: #666;
+                margin-bottom: 4px;
+            }
+            .comparison-change {
+                font-size: 13px;
+                color: #28a745;
+                font-weight: 600;
+            }
+            .comparison-change.negative {
+                color: #dc3545;
+            }
+            .footer {
+                text-align: center;
+                padding: 12px;
+                color: #666;
+                font-size: 12px;
+                border-top: 1px solid #ddd;
+                background: #f8f9fa;
+                border-radius: 0 0 10px 10px;
+            }
+            .card-header.trend-section {
+                background: linear-gradient(135deg, #6a1b9a, #4a148c);
+                color: white;
+                padding: 12px 15px;
+            }
+            .sparkline {
+                font-size: 13px;
+                color: #555;
+                margin-bottom: 4px;
+            }
+            .sparkline span {
+                font-size: 16px;
+                letter-spacing: 1px;
+                color: #6a1b9a;
+            }
+            .trend {
+                width: 100%;
+                border-collapse: collapse;
+                font-size: 12px;
+                margin-top: 8px;
+            }
+            .trend th {
+                background: #f3e5f5;
+                padding: 5px;
+                text-align: right;
+            }
+            .trend td {
+                padding: 4px 5px;
+                text-align: right;
+                border-bottom: 1px solid #eee;
+            }
+            .trend th:first-child, .trend td:first-child {
+                text-align: left;
+            }
+            .trend td.negative {
+                color: #dc3545;
+            }
+        """
+
+VEHICLE_HEAD = (
+    '\n    <!DOCTYPE html>\n    <html>\n    <head>\n'
+    '        <meta charset="UTF-8">\n'
+    '        <meta name="viewport" content="width=device-width, initial-scale=1.0">\n'
+    '        <style>' + VEHICLE_CSS + '</style>\n    </head>\n    <body>\n        <div class="container">\n'
+)
+
+VEHICLE_TITLE = """            <div class="header">
+                <h1>{location}</h1>
+                <div class="date-range">{date}</div>
+            </div>
+
+"""
+
+VEHICLE_FOOTER = """
+
+            <div class="footer">
+                <p>Laporan dibuat otomatis pada {time}</p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+
+STAT_CARD = """            <div class="card">
+                <div class="card-header {section}">
+                    <h2 class="card-title">{title}</h2>
+                </div>
+                <div class="card-body">
+                    <div class="stats-row">
+                        <div class="stat-box">
+                            <div class="stat-value">{units}</div>
+                            <div class="stat-label">Unit Terjual</div>
+                        </div>
+                        <div class="stat-box">
+                            <div class="stat-value">{value}</div>
+                            <div class="stat-label">{value_label}</div>
+                        </div>
+                    </div>
+
+                    <div class="payment-row">
+                        <div class="payment-box">
+                            <div class="payment-count">{tunai_count} Unit</div>
+                            <div class="payment-value">{payment_prefix}{tunai_value}</div>
+                            <div class="payment-label">💰 {payment_label}Tunai</div>
+                        </div>
+                        <div class="payment-box">
+                            <div class="payment-count">{kredit_count} Unit</div>
+                            <div class="payment-value">{payment_prefix}{kredit_value}</div>
+                            <div class="payment-label">💳 {payment_label}Kredit</div>
+                        </div>
+                    </div>
+
+                    <div class="comparison-row">
+                        <div class="comparison-box">
+                            <div class="comparison-title">📈 vs Tahun Lalu</div>
+                            <div class="comparison-content">
+                                {yoy_units} Unit ({comparison_label}: {yoy_value})
+                            </div>
+                            <div class="comparison-change {yoy_class}">
+                                {yoy_change} ({yoy_pct})
+                            </div>
+                        </div>
+                        <div class="comparison-box">
+                            <div class="comparison-title">📅 {mom_title}</div>
+                            <div class="comparison-content">
+                                {mom_units} Unit ({comparison_label}: {mom_value})
+                            </div>
+                            <div class="comparison-change {mom_class}">
+                                {mom_change} ({mom_pct})
+                            </div>
+                        </div>
+                    </div>
+                </div>
+            </div>"""
+
+# Labels that differ between the sales (DO) cards and the margin cards
+CARD_LABELS = {
+    'sales': {'section': 'do-section', 'value_label': 'Total Harga Beli', 'payment_prefix': 'Margin: ',
+              'payment_label': '', 'comparison_label': 'Harga Beli'},
+    'margin': {'section': 'margin-section', 'value_label': 'Total Keuntungan', 'payment_prefix': '',
+               'payment_label': 'Keuntungan ', 'comparison_label': 'Keuntungan'},
+}
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def stat_card(kind, title, units, value, tunai_count, tunai_value, kredit_count, kredit_value,
+              yoy, mom, mom_title="vs Bulan Lalu"):
+    """
+    One summary card of the vehicle report.
+
+    All arguments are already formatted strings, so the rendered card is cached
+    on exactly the values it shows.
+
+    Args:
+        kind (str): 'sales' or 'margin', selects the labels from CARD_LABELS
+        title (str): Card title
+        units, value: Headline unit count and amount
+        tunai_count, tunai_value, kredit_count, kredit_value: Payment method split
+        yoy, mom (tuple): (units, value, change, pct, negative) for the two comparisons
+        mom_title (str): Title of the second comparison, e.g. 'vs Minggu Lalu' on the weekly card
+    """
+    yoy_units, yoy_value, yoy_change, yoy_pct, yoy_negative = yoy
+    mom_units, mom_value, mom_change, mom_pct, mom_negative = mom
+    return STAT_CARD.format(
+        title=title, units=units, value=value,
+        tunai_count=tunai_count, tunai_value=tunai_value,
+        kredit_count=kredit_count, kredit_value=kredit_value,
+        yoy_units=yoy_units, yoy_value=yoy_value, yoy_change=yoy_change, yoy_pct=yoy_pct,
+        yoy_class='negative' if yoy_negative else '',
+        mom_units=mom_units, mom_value=mom_value, mom_change=mom_change, mom_pct=mom_pct,
+        mom_class='negative' if mom_negative else '', mom_title=mom_title,
+        **CARD_LABELS[kind],
+    )
+
+
+TREND_SECTION = """
+
+            <div class="card">
+                <div class="card-header trend-section">
+                    <h2 class="card-title">📈 Tren {months} Bulan</h2>
+                </div>
+                <div class="card-body">
+                    <div class="sparkline">Unit <span>{units_spark}</span></div>
+                    <div class="sparkline">Tahun lalu <span>{last_year_spark}</span></div>
+                    <table class="trend">
+                        <thead>
+                            <tr>
+                                <th>Bulan</th>
+                                <th>Unit</th>
+                                <th>Unit TL</th>
+                                <th>Keuntungan</th>
+                                <th>Keuntungan TL</th>
+                            </tr>
+                        </thead>
+                        <tbody>{rows}
+                        </tbody>
+                    </table>
+                </div>
+            </div>"""
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def trend_row(label, units, last_year_units, margin, last_year_margin, units_down, margin_down):
+    """One month of the trend table; units/margin below last year are shown in red."""
+    return f"""
+                            <tr>
+                                <td>{label}</td>
+                                <td{' class="negative"' if units_down else ''}>{units}</td>
+                                <td>{last_year_units}</td>
+                                <td{' class="negative"' if margin_down else ''}>{margin}</td>
+                                <td>{last_year_margin}</td>
+                            </tr>"""
+
+
+def trend_section(months, units_spark, last_year_spark, rows):
+    """The trend card; rows are the already rendered trend_row() fragments."""
+    return TREND_SECTION.format(months=months, units_spark=units_spark, last_year_spark=last_year_spark,
+                                rows="".join(rows))
+
+
+YEARS_SECTION = """
+
+            <div class="card">
+                <div class="card-header trend-section">
+                    <h2 class="card-title">📊 Perbandingan {count} Tahun</h2>
+                </div>
+                <div class="card-body">
+                    <table class="trend">
+                        <thead>
+                            <tr>
+                                <th>Tahun</th>
+                                <th>Hari Ini</th>
+                                <th>MTD</th>
+                                <th>YTD</th>
+                            </tr>
+                        </thead>
+                        <tbody>{rows}
+                        </tbody>
+                    </table>
+                    <div class="sparkline">Unit / keuntungan sampai tanggal yang sama tiap tahun</div>
+                </div>
+            </div>"""
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def year_row(year, day, mtd, ytd):
+    """One year of the comparison table; day, mtd and ytd are (units, margin) pairs of strings."""
+    cells = "".join(f"""
+                                <td>{units} unit<br>{margin}</td>""" for units, margin in (day, mtd, ytd))
+    return f"""
+                            <tr>
+                                <td>{year}</td>{cells}
+                            </tr>"""
+
+
+def years_section(rows):
+    """The multi-year comparison card; rows are the already rendered year_row() fragments."""
+    return YEARS_SECTION.format(count=len(rows), rows="".join(rows))
+
+
+LEASING_SECTION = """
+
+            <div class="card">
+                <div class="card-header trend-section">
+                    <h2 class="card-title">🏦 Leasing Bulan Ini</h2>
+                </div>
+                <div class="card-body">
+                    <table class="trend">
+                        <thead>
+                            <tr>
+                                <th>Finance</th>
+                                <th>Unit</th>
+                                <th>Keuntungan</th>
+                            </tr>
+                        </thead>
+                        <tbody>{finance_rows}
+                        </tbody>
+                    </table>
+                    <table class="trend">
+                        <thead>
+                            <tr>
+                                <th>Tenor</th>
+                                <th>Unit</th>
+                                <th>Keuntungan</th>
+                            </tr>
+                        </thead>
+                        <tbody>{tenor_rows}
+                        </tbody>
+                    </table>
+                </div>
+            </div>"""
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def breakdown_row(label, units, margin):
+    """One finance company or tenor bucket of the leasing section."""
+    return f"""
+                            <tr>
+                                <td>{label}</td>
+                                <td>{units}</td>
+                                <td>{margin}</td>
+                            </tr>"""
+
+
+def leasing_section(finance_rows, tenor_rows):
+    """The leasing card; rows are the already rendered breakdown_row() fragments."""
+    return LEASING_SECTION.format(finance_rows="".join(finance_rows), tenor_rows="".join(tenor_rows))
+
+
+PIPELINE_SECTION = """
+
+            <div class="card">
+                <div class="card-header trend-section">
+                    <h2 class="card-title">📋 Pipeline SPK</h2>
+                </div>
+                <div class="card-body">
+                    <div class="stats-row">
+                        <div class="stat-box">
+                            <div class="stat-value">{today_spk}</div>
+                            <div class="stat-label">SPK Hari Ini</div>
+                        </div>
+                        <div class="stat-box">
+                            <div class="stat-value">{mtd_spk}</div>
+                            <div class="stat-label">SPK Bulan Ini</div>
+                        </div>
+                    </div>
+                    <div class="stats-row">
+                        <div class="stat-box">
+                            <div class="stat-value">{backlog}</div>
+                            <div class="stat-label">SPK Belum BAST</div>
+                        </div>
+                        <div class="stat-box">
+                            <div class="stat-value">{lead_time}</div>
+                            <div class="stat-label">Rata-rata SPK ke BAST</div>
+                        </div>
+                    </div>
+                    <table class="trend">
+                        <thead>
+                            <tr>
+                                <th>SPV</th>
+                                <th>SPK Hari Ini</th>
+                                <th>SPK MTD</th>
+                                <th>Belum BAST</th>
+                                <th>Lead Time</th>
+                            </tr>
+                        </thead>
+                        <tbody>{rows}
+                        </tbody>
+                    </table>
+                </div>
+            </div>"""
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def pipeline_row(name, today_spk, mtd_spk, backlog, lead_time):
+    """One SPV of the SPK pipeline section."""
+    return f"""
+                            <tr>
+                                <td>{name}</td>
+                                <td>{today_spk}</td>
+                                <td>{mtd_spk}</td>
+                                <td>{backlog}</td>
+                                <td>{lead_time}</td>
+                            </tr>"""
+
+
+def pipeline_section(today_spk, mtd_spk, backlog, lead_time, rows):
+    """The SPK pipeline card; rows are the already rendered pipeline_row() fragments."""
+    return PIPELINE_SECTION.format(today_spk=today_spk, mtd_spk=mtd_spk, backlog=backlog, lead_time=lead_time,
+                                   rows="".join(rows))
+
+
+def vehicle_report(location, date, time, cards, sections=()):
+    """Assemble the vehicle report from the static skeleton, rendered cards and optional extra sections."""
+    return "".join([VEHICLE_HEAD, VEHICLE_TITLE.format(location=location, date=date),
+                    "\n\n".join(cards), *sections, VEHICLE_FOOTER.format(time=time)])
+
+
+# SPV report (report_renderers.spv_html)
+
+SPV_CSS = """
+            body {
+                font-family: Arial, sans-serif;
+                margin: 10px;
+                background-color: #f8f9fa;
+            }
+            .header {
+                text-align: center;
+                color: #e70000;
+                margin-bottom: 15px;
+            }
+            .header h1 {
+                font-size: 18px;
+                margin: 0;
+                padding: 0;
+            }
+            .header .date-range {
+                font-size: 14px;
+                color: #666;
+                margin-top: 5px;
+            }
+            table {
+                width: 100%;
+                border-collapse: collapse;
+                margin: 0 auto;
+                background-color: white;
+                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
+                border-radius: 8px;
+                overflow: hidden;
+            }
+            th {
+                background-color: #e70000;
+                color: white;
+                padding: 10px 8px;
+                text-align: center;
+                font-size: 12px;
+                font-weight: bold;
+                border-right: 1px solid #c60000;
+            }
+            td {
+                padding: 8px 6px;
+                text-align: center;
+                border-bottom: 1px solid #e9ecef;
+                border-right: 1px solid #e9ecef;
+                font-size: 12px;
+            }
+            /* Alternating row colors */
+            tbody tr:nth-child(odd) {
+                background-color: #ffffff;
+            }
+            tbody tr:nth-child(even) {
+                background-color: #f8f9fa;
+            }
+            tbody tr:hover {
+                background-color: #e3f2fd !important;
+                transition: background-color 0.3s ease;
+            }
+            .spv-name {
+                text-align: left;
+                font-weight: bold;
+                color: #e70000;
+                min-width: 150px;
+                border-right: 3px solid #e70000 !important;
+                background-color: #fff5f5 !important;
+            }
+            /* Column group background colors - ODD ROWS (Light colors) */
+            tbody tr:nth-child(odd) .mtd-group {
+                background-color: #e8f5e8 !important; /* Light green */
+            }
+            tbody tr:nth-child(odd) .ytd-group {
+                background-color: #e3f2fd !important; /* Light blue */
+            }
+            tbody tr:nth-child(odd) .today-group {
+                background-color: #fff8e1 !important; /* Light yellow */
+            }
+            tbody tr:nth-child(odd) .spv-name {
+                background-color: #ffebee !important; /* Light red */
+            }
+            
+            /* Column group background colors - EVEN ROWS (Darker colors) */
+            tbody tr:nth-child(even) .mtd-group {
+                background-color: #c8e6c9 !important; /* Darker green */
+            }
+            tbody tr:nth-child(even) .ytd-group {
+                background-color: #bbdefb !important; /* Darker blue */
+            }
+            tbody tr:nth-child(even) .today-group {
+                background-color: #fff3c4 !important; /* Darker yellow */
+            }
+            tbody tr:nth-child(even) .spv-name {
+                background-color: #ffcdd2 !important; /* Darker red */
+            }
+            .today-change {
+                color: #2e7d32;
+                font-weight: bold;
+            }
+            /* Dividers between column groups */
+            .today-divider {
+                border-right: 3px solid #333 !important;
+            }
+            .mtd-divider {
+                border-right: 3px solid #333 !important;
+            }
+            .ytd-divider {
+                border-right: 3px solid #333 !important;
+            }
+            .header-today {
+                border-right: 3px solid #c60000 !important;
+                background-color: #c60000 !important;
+            }
+            .header-mtd {
+                border-right: 3px solid #c60000 !important;
+                background-color: #c60000 !important;
+            }
+            .header-ytd {
+                border-right: 3px solid #c60000 !important;
+                background-color: #c60000 !important;
+            }
+            /* Header group colors */
+            .header-mtd-sub {
+                background-color: #2e7d32 !important;
+            }
+            .header-ytd-sub {
+                background-color: #1565c0 !important;
+            }
+            .header-today-sub {
+                background-color: #f57c00 !important;
+            }
+        """
+
+LEADERBOARD_CSS = """
+            .leaderboard-title {
+                text-align: center;
+                color: #e70000;
+                font-size: 14px;
+                font-weight: bold;
+                margin: 18px 0 8px;
+            }
+            .leaderboard tr.spv-group td {
+                text-align: left;
+                font-weight: bold;
+                color: #e70000;
+                background-color: #ffebee !important;
+            }
+            .leaderboard td.sales-name {
+                text-align: left;
+                padding-left: 18px;
+            }
+        """
+
+SPV_HEAD = (
+    '\n    <!DOCTYPE html>\n    <html>\n    <head>\n'
+    '        <meta charset="UTF-8">\n'
+    '        <style>' + SPV_CSS + LEADERBOARD_CSS + '</style>\n    </head>\n    <body>\n'
+)
+
+SPV_TITLE = """        <div class="header">
+            <h1>SPV DO Report</h1>
+            <div class="date-range">{start} ~ {end}</div>
+        </div>
+"""
+
+SPV_TABLE_HEAD = """        <table>
+            <thead>
+                <tr>
+                    <th rowspan="2" class="spv-name">SPV</th>
+                    <th colspan="3" class="header-today">Today</th>
+                    <th colspan="3" class="header-mtd">MTD</th>
+                    <th colspan="3" class="header-ytd">YTD</th>
+                </tr>
+                <tr>
+                    <th class="header-today-sub">Madiun</th>
+                    <th class="header-today-sub">Magetan</th>
+                    <th class="header-today-sub today-divider">Total</th>
+                    <th class="header-mtd-sub">Madiun</th>
+                    <th class="header-mtd-sub">Magetan</th>
+                    <th class="header-mtd-sub mtd-divider">Total</th>
+                    <th class="header-ytd-sub">Madiun</th>
+                    <th class="header-ytd-sub">Magetan</th>
+                    <th class="header-ytd-sub">Total</th>
+                </tr>
+            </thead>
+            <tbody>
+    """
+
+SPV_TABLE_END = """
+            </tbody>
+        </table>"""
+
+SPV_DOC_END = """
+    </body>
+    </html>
+    """
+
+LEADERBOARD_HEAD = """
+        <div class="leaderboard-title">Sales Leaderboard</div>
+        <table class="leaderboard">
+            <thead>
+                <tr>
+                    <th>Sales</th>
+                    <th>Today</th>
+                    <th>MTD</th>
+                    <th>YTD</th>
+                    <th>Margin MTD</th>
+                    <th>Margin YTD</th>
+                </tr>
+            </thead>
+            <tbody>"""
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def spv_row(name, today_madiun, today_magetan, today_total, mtd_madiun, mtd_magetan, mtd_total,
+            ytd_madiun, ytd_magetan, ytd_total):
+    """One table row of the SPV report, cached on the name and its nine counts."""
+    # An f-string rather than str.format: this runs once per SPV and is about twice as fast
+    return f"""
+            <tr>
+                <td class="spv-name">{name}</td>
+                <td class="today-group">{today_madiun}</td>
+                <td class="today-group">{today_magetan}</td>
+                <td class="today-group today-divider">{today_total}</td>
+                <td class="mtd-group">{mtd_madiun}</td>
+                <td class="mtd-group">{mtd_magetan}</td>
+                <td class="mtd-group mtd-divider">{mtd_total}</td>
+                <td class="ytd-group">{ytd_madiun}</td>
+                <td class="ytd-group">{ytd_magetan}</td>
+                <td class="ytd-group">{ytd_total}</td>
+            </tr>
+        """
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def leaderboard_group(spv_name):
+    """SPV heading row above that SPV's salespeople in the leaderboard."""
+    return f"""
+                <tr class="spv-group">
+                    <td colspan="6">{spv_name}</td>
+                </tr>"""
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def leaderboard_row(name, today_do, mtd_do, ytd_do, mtd_margin, ytd_margin):
+    """One salesperson of the leaderboard; margins are already formatted."""
+    return f"""
+                <tr>
+                    <td class="sales-name">{name}</td>
+                    <td>{today_do}</td>
+                    <td>{mtd_do}</td>
+                    <td>{ytd_do}</td>
+                    <td>{mtd_margin}</td>
+                    <td>{ytd_margin}</td>
+                </tr>"""
+
+
+def leaderboard(rows):
+    """The sales leaderboard table from leaderboard_group()/leaderboard_row() fragments, or '' without rows."""
+    return "".join([LEADERBOARD_HEAD, *rows, SPV_TABLE_END]) if rows else ""
+
+
+def spv_report(start, end, rows, sales_board=""):
+    """Assemble the SPV report; rows are the already rendered spv_row() fragments."""
+    return "".join([SPV_HEAD, SPV_TITLE.format(start=start, end=end), SPV_TABLE_HEAD, *rows, SPV_TABLE_END,
+                    sales_board, SPV_DOC_END])
+
+
+# Personal SPV report (report_renderers.SpvPersonalizer)
+
+RANKING_CSS = """
+            .rank {
+                font-size: 14px;
+                color: #333;
+                text-align: center;
+                margin: 12px 0;
+            }
+            .ranking {
+                margin-top: 15px;
+            }
+            .ranking td.spv-name {
+                background-color: #ffffff !important;
+            }
+            .ranking tr.me td {
+                background-color: #fff3c4 !important;
+                font-weight: bold;
+            }
+        """
+
+SPV_PERSONAL_HEAD = (
+    '\n    <!DOCTYPE html>\n    <html>\n    <head>\n'
+    '        <meta charset="UTF-8">\n'
+    '        <style>' + SPV_CSS + LEADERBOARD_CSS + RANKING_CSS + '</style>\n    </head>\n    <body>\n'
+)
+
+SPV_PERSONAL_TITLE = """        <div class="header">
+            <h1>SPV DO Report: {name}</h1>
+            <div class="date-range">{start} ~ {end}</div>
+        </div>
+"""
+
+RANKING_HEAD = """
+            </tbody>
+        </table>
+        <div class="rank">Peringkat #{rank} dari {total} SPV (YTD)</div>
+        <table class="ranking">
+            <thead>
+                <tr>
+                    <th>#</th>
+                    <th class="spv-name">SPV</th>
+                    <th>Today</th>
+                    <th>MTD</th>
+                    <th>YTD</th>
+                </tr>
+            </thead>
+            <tbody>"""
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def ranking_row(rank, name, today_total, mtd_total, ytd_total, highlight=False):
+    """One row of the team ranking; the recipient's own row is highlighted."""
+    return f"""
+                <tr{' class="me"' if highlight else ''}>
+                    <td>{rank}</td>
+                    <td class="spv-name">{name}</td>
+                    <td>{today_total}</td>
+                    <td>{mtd_total}</td>
+                    <td>{ytd_total}</td>
+                </tr>"""
+
+
+def spv_personal_report(name, start, end, own_row, rank, ranking_rows, sales_board=""):
+    """Assemble one SPV's email: their own row, their rank, the team ranking and their salespeople."""
+    return "".join([SPV_PERSONAL_HEAD, SPV_PERSONAL_TITLE.format(name=name, start=start, end=end),
+                    SPV_TABLE_HEAD, own_row, RANKING_HEAD.format(rank=rank, total=len(ranking_rows)),
+                    *ranking_rows, SPV_TABLE_END, sales_board, SPV_DOC_END])
+
+
+def clear_fragment_cache():
+    """Drop all cached fragments, e.g. between benchmark runs."""
+    stat_card.cache_clear()
+    trend_row.cache_clear()
+    year_row.cache_clear()
+    breakdown_row.cache_clear()
+    pipeline_row.cache_clear()
+    spv_row.cache_clear()
+    leaderboard_group.cache_clear()
+    leaderboard_row.cache_clear()
+    ranking_row.cache_clear()
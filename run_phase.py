@@ -0,0 +1,57 @@
+#run_phase.py
+
+import os
+import time
+
+# Phases a report run moves through, in order
+PHASES = ("connect", "query", "render", "smtp")
+
+
+def set_phase(phase, detail=""):
+    """
+    Record the phase the current report run is in.
+
+    The scheduler points REPORT_PHASE_FILE at a per-job file; when a job overruns
+    its budget the scheduler reads the file back to log where the run was stuck.
+    Outside the scheduler this does nothing.
+
+    Args:
+        phase (str): One of PHASES
+        detail (str): Free text such as the database or email subject
+    """
+    path = os.getenv("REPORT_PHASE_FILE")
+    if not path:
+        return
+    # Fields are tab separated, so a tab inside the detail is written as a space
+    detail = str(detail).replace("\t", " ")
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"{phase}\t{detail}\t{time.time():.0f}")
+    except OSError:
+        # Phase tracking must never break the report itself
+        pass
+
+
+def read_phase(path):
+    """
+    Read the last phase written by set_phase().
+
+    Returns:
+        tuple: (phase, detail, seconds in phase) or None if nothing was recorded
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            # The timestamp is the last field; the detail may hold tabs from older writers
+            rest, since = f.read().rsplit("\t", 1)
+            phase, detail = rest.split("\t", 1)
+        return phase, detail, time.time() - float(since)
+    except (OSError, ValueError):
+        return None
+
+
+def clear_phase(path):
+    """Remove a phase file left by a previous run."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
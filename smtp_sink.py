@@ -0,0 +1,134 @@
+#smtp_sink.py
+#SMTP lokal untuk benchmark dan pengujian: python smtp_sink.py [--port 2525] [--save-dir outbox_sink]
+#Set SMTP_SERVER=127.0.0.1, SMTP_PORT=2525 dan SMTP_STARTTLS=0 di environment report
+
+import os
+import time
+import base64
+import argparse
+import threading
+import socketserver
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP dialogue: accepts any login and every message, delivers nowhere."""
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode("ascii"))
+
+    def handle(self):
+        sink = self.server
+        self.reply("220 m2-report smtp sink ready")
+        mail_from, rcpt_to = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+
+            if verb in ("EHLO", "HELO"):
+                self.wfile.write(b"250-m2-report smtp sink\r\n")
+                self.wfile.write(b"250-AUTH PLAIN LOGIN\r\n")
+                self.wfile.write(b"250-SIZE 35882577\r\n")
+                self.reply("250 8BITMIME")
+            elif verb == "AUTH":
+                if command.upper().startswith("AUTH LOGIN"):
+                    # Username and password prompts, contents are ignored
+                    self.reply("334 " + base64.b64encode(b"Username:").decode())
+                    self.rfile.readline()
+                    self.reply("334 " + base64.b64encode(b"Password:").decode())
+                    self.rfile.readline()
+                self.reply("235 2.7.0 Authentication successful")
+            elif verb == "MAIL":
+                mail_from, rcpt_to = command[10:].strip().split(" ")[0].strip("<>"), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                address = command[8:].strip().strip("<>")
+                if address in sink.reject_recipients:
+                    self.reply("550 5.1.1 Recipient rejected")
+                else:
+                    rcpt_to.append(address)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b".\r\n", b".\n"):
+                        break
+                    data.append(chunk[1:] if chunk.startswith(b"..") else chunk)
+                if sink.delay:
+                    time.sleep(sink.delay)
+                sink.store(mail_from, rcpt_to, b"".join(data))
+                self.reply("250 OK queued")
+            elif verb == "RSET":
+                mail_from, rcpt_to = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    Local SMTP stand-in that counts and optionally saves every message it receives.
+
+    Args:
+        port (int): Port to listen on, 0 picks a free one
+        save_dir (str, optional): Directory to write received messages to as .eml files
+        delay (float): Seconds to wait before accepting each message, to simulate a slow server
+        reject_recipients (iterable): Addresses to refuse at RCPT TO
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, save_dir=None, delay=0.0, reject_recipients=()):
+        super().__init__(("127.0.0.1", port), SMTPSinkHandler)
+        self.save_dir = save_dir
+        self.delay = delay
+        self.reject_recipients = set(reject_recipients)
+        self.messages = []
+        self._lock = threading.Lock()
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def store(self, mail_from, rcpt_to, data):
+        with self._lock:
+            self.messages.append({'from': mail_from, 'to': list(rcpt_to), 'bytes': len(data)})
+            count = len(self.messages)
+        if self.save_dir:
+            with open(os.path.join(self.save_dir, f"{count:06d}.eml"), "wb") as f:
+                f.write(data)
+
+    def start(self):
+        """Serve in a background thread and return self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Local SMTP sink for benchmarks and tests')
+    parser.add_argument('--port', type=int, default=2525, help='Port to listen on')
+    parser.add_argument('--save-dir', help='Write received messages to this directory')
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds to wait before accepting each message')
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.port, args.save_dir, args.delay)
+    print(f"SMTP sink listening on 127.0.0.1:{sink.port}")
+    try:
+        sink.serve_forever()
+    except KeyboardInterrupt:
+        sink.server_close()
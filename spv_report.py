@@ -1,11 +1,19 @@
 import os
 import sys
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import json
+from dataclasses import asdict
 from datetime import datetime
 from db_operations import get_spv_performance
 from dotenv import load_dotenv
+from metrics import track, flush_metrics
+from query_profiler import print_profile_summary
+from mail_transport import build_message, close_transport
+from outbox import dispatch, SENT, QUEUED
+from report_model import build_spv_report
+from staff_identity import load_identity_map
+import report_renderers
+from email_optimizer import optimize_html
+import report_history
 
 # Load environment variables
 load_dotenv()
@@ -27,294 +35,147 @@ def format_date_id(date_str):
     except:
         return date_str
 
-def format_spv_report(spv_data, start_date, end_date):
-    """Format SPV performance data into HTML report."""
-    # Format dates to Indonesian format
-    start_date_id = format_date_id(start_date)
-    end_date_id = format_date_id(end_date)
-    
-    html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <style>
-            body {{
-                font-family: Arial, sans-serif;
-                margin: 10px;
-                background-color: #f8f9fa;
-            }}
-            .header {{
-                text-align: center;
-                color: #e70000;
-                margin-bottom: 15px;
-            }}
-            .header h1 {{
-                font-size: 18px;
-                margin: 0;
-                padding: 0;
-            }}
-            .header .date-range {{
-                font-size: 14px;
-                color: #666;
-                margin-top: 5px;
-            }}
-            table {{
-                width: 100%;
-                border-collapse: collapse;
-                margin: 0 auto;
-                background-color: white;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-                border-radius: 8px;
-                overflow: hidden;
-            }}
-            th {{
-                background-color: #e70000;
-                color: white;
-                padding: 10px 8px;
-                text-align: center;
-                font-size: 12px;
-                font-weight: bold;
-                border-right: 1px solid #c60000;
-            }}
-            td {{
-                padding: 8px 6px;
-                text-align: center;
-                border-bottom: 1px solid #e9ecef;
-                border-right: 1px solid #e9ecef;
-                font-size: 12px;
-            }}
-            /* Alternating row colors */
-            tbody tr:nth-child(odd) {{
-                background-color: #ffffff;
-            }}
-            tbody tr:nth-child(even) {{
-                background-color: #f8f9fa;
-            }}
-            tbody tr:hover {{
-                background-color: #e3f2fd !important;
-                transition: background-color 0.3s ease;
-            }}
-            .spv-name {{
-                text-align: left;
-                font-weight: bold;
-                color: #e70000;
-                min-width: 150px;
-                border-right: 3px solid #e70000 !important;
-                background-color: #fff5f5 !important;
-            }}
-            /* Column group background colors - ODD ROWS (Light colors) */
-            tbody tr:nth-child(odd) .mtd-group {{
-                background-color: #e8f5e8 !important; /* Light green */
-            }}
-            tbody tr:nth-child(odd) .ytd-group {{
-                background-color: #e3f2fd !important; /* Light blue */
-            }}
-            tbody tr:nth-child(odd) .today-group {{
-                background-color: #fff8e1 !important; /* Light yellow */
-            }}
-            tbody tr:nth-child(odd) .spv-name {{
-                background-color: #ffebee !important; /* Light red */
-            }}
-            
-            /* Column group background colors - EVEN ROWS (Darker colors) */
-            tbody tr:nth-child(even) .mtd-group {{
-                background-color: #c8e6c9 !important; /* Darker green */
-            }}
-            tbody tr:nth-child(even) .ytd-group {{
-                background-color: #bbdefb !important; /* Darker blue */
-            }}
-            tbody tr:nth-child(even) .today-group {{
-                background-color: #fff3c4 !important; /* Darker yellow */
-            }}
-            tbody tr:nth-child(even) .spv-name {{
-                background-color: #ffcdd2 !important; /* Darker red */
-            }}
-            .today-change {{
-                color: #2e7d32;
-                font-weight: bold;
-            }}
-            /* Dividers between column groups */
-            .today-divider {{
-                border-right: 3px solid #333 !important;
-            }}
-            .mtd-divider {{
-                border-right: 3px solid #333 !important;
-            }}
-            .ytd-divider {{
-                border-right: 3px solid #333 !important;
-            }}
-            .header-today {{
-                border-right: 3px solid #c60000 !important;
-                background-color: #c60000 !important;
-            }}
-            .header-mtd {{
-                border-right: 3px solid #c60000 !important;
-                background-color: #c60000 !important;
-            }}
-            .header-ytd {{
-                border-right: 3px solid #c60000 !important;
-                background-color: #c60000 !important;
-            }}
-            /* Header group colors */
-            .header-mtd-sub {{
-                background-color: #2e7d32 !important;
-            }}
-            .header-ytd-sub {{
-                background-color: #1565c0 !important;
-            }}
-            .header-today-sub {{
-                background-color: #f57c00 !important;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>SPV DO Report</h1>
-            <div class="date-range">{start_date_id} ~ {end_date_id}</div>
-        </div>
-        <table>
-            <thead>
-                <tr>
-                    <th rowspan="2" class="spv-name">SPV</th>
-                    <th colspan="3" class="header-today">Today</th>
-                    <th colspan="3" class="header-mtd">MTD</th>
-                    <th colspan="3" class="header-ytd">YTD</th>
-                </tr>
-                <tr>
-                    <th class="header-today-sub">Madiun</th>
-                    <th class="header-today-sub">Magetan</th>
-                    <th class="header-today-sub today-divider">Total</th>
-                    <th class="header-mtd-sub">Madiun</th>
-                    <th class="header-mtd-sub">Magetan</th>
-                    <th class="header-mtd-sub mtd-divider">Total</th>
-                    <th class="header-ytd-sub">Madiun</th>
-                    <th class="header-ytd-sub">Magetan</th>
-                    <th class="header-ytd-sub">Total</th>
-                </tr>
-            </thead>
-            <tbody>
+def format_spv_report(spv_data, start_date, end_date, identities=None):
+    """Format SPV performance data into HTML report; SPVs are merged through the staff identity map."""
+    identities = identities or load_identity_map()
+    return report_renderers.spv_html(build_spv_report(spv_data, start_date, end_date, identities))
+
+def send_email(subject, body, recipients, plain_text=None, report=None):
     """
-    
-    # Combine SPVs with same name and sum their DO counts
-    # Use more robust name normalization to handle variations
-    combined_spvs = {}
-    for spv in spv_data['data']:
-        # Normalize SPV name: strip whitespace, convert to title case for consistency
-        original_name = spv['nama_spv']
-        normalized_name = original_name.strip().title() if original_name else "Unknown"
-        
-        # Hardcode fix for Tonny/Toni Saputra (same person)
-        if normalized_name in ["Tonny Saputra", "Toni Saputra"]:
-            normalized_name = "Tonny Saputra"
-        
-        # Determine which database this record came from
-        database_source = spv.get('database_source', 'unknown')
-        
-        # Use normalized name as key but keep original for display if it's the first occurrence
-        if normalized_name in combined_spvs:
-            # Sum the DO counts for SPVs with the same name
-            if database_source == 'honda_mis':
-                combined_spvs[normalized_name]['mtd_do_madiun'] += spv['mtd_do'] or 0
-                combined_spvs[normalized_name]['ytd_do_madiun'] += spv['ytd_do'] or 0
-                combined_spvs[normalized_name]['today_do_madiun'] += spv['today_do'] or 0
-            elif database_source == 'm2_magetan':
-                combined_spvs[normalized_name]['mtd_do_magetan'] += spv['mtd_do'] or 0
-                combined_spvs[normalized_name]['ytd_do_magetan'] += spv['ytd_do'] or 0
-                combined_spvs[normalized_name]['today_do_magetan'] += spv['today_do'] or 0
-        else:
-            # Initialize with separate counters for each database
-            if database_source == 'honda_mis':
-                combined_spvs[normalized_name] = {
-                    'nama_spv': normalized_name,
-                    'mtd_do_madiun': spv['mtd_do'] or 0,
-                    'mtd_do_magetan': 0,
-                    'ytd_do_madiun': spv['ytd_do'] or 0,
-                    'ytd_do_magetan': 0,
-                    'today_do_madiun': spv['today_do'] or 0,
-                    'today_do_magetan': 0
-                }
-            elif database_source == 'm2_magetan':
-                combined_spvs[normalized_name] = {
-                    'nama_spv': normalized_name,
-                    'mtd_do_madiun': 0,
-                    'mtd_do_magetan': spv['mtd_do'] or 0,
-                    'ytd_do_madiun': 0,
-                    'ytd_do_magetan': spv['ytd_do'] or 0,
-                    'today_do_madiun': 0,
-                    'today_do_magetan': spv['today_do'] or 0
-                }
-    
-    # Calculate totals for each SPV
-    for spv_name, spv_data in combined_spvs.items():
-        spv_data['mtd_do_total'] = spv_data['mtd_do_madiun'] + spv_data['mtd_do_magetan']
-        spv_data['ytd_do_total'] = spv_data['ytd_do_madiun'] + spv_data['ytd_do_magetan']
-        spv_data['today_do_total'] = spv_data['today_do_madiun'] + spv_data['today_do_magetan']
-    
-    # Sort by YTD total DO count (highest to lowest) for performance ranking
-    sorted_spvs = sorted(combined_spvs.values(), key=lambda x: x['ytd_do_total'], reverse=True)
-    
-    for spv in sorted_spvs:
-        html += f"""
-            <tr>
-                <td class="spv-name">{spv['nama_spv']}</td>
-                <td class="today-group">{spv['today_do_madiun']}</td>
-                <td class="today-group">{spv['today_do_magetan']}</td>
-                <td class="today-group today-divider">{spv['today_do_total']}</td>
-                <td class="mtd-group">{spv['mtd_do_madiun']}</td>
-                <td class="mtd-group">{spv['mtd_do_magetan']}</td>
-                <td class="mtd-group mtd-divider">{spv['mtd_do_total']}</td>
-                <td class="ytd-group">{spv['ytd_do_madiun']}</td>
-                <td class="ytd-group">{spv['ytd_do_magetan']}</td>
-                <td class="ytd-group">{spv['ytd_do_total']}</td>
-            </tr>
-        """
-    
-    html += """
-            </tbody>
-        </table>
-    </body>
-    </html>
+    Send email to specified recipients, or queue it when the outbox is enabled.
+
+    Returns:
+        str or None: outbox.SENT, PARTIAL or QUEUED (see outbox.dispatch()), None if sending failed
     """
-    return html
+    message = build_message(subject, body, recipients, plain_text=plain_text, headers={
+        "X-Priority": "1",  # High priority
+        "X-MSMail-Priority": "High",
+        "Importance": "High",
+    })
 
-def send_email(subject, body, recipients):
-    """Send email to specified recipients."""
-    smtp_server = os.getenv("SMTP_SERVER")
-    smtp_port = int(os.getenv("SMTP_PORT"))
-    sender_email = os.getenv("SENDER_EMAIL")
-    app_password = os.getenv("SENDER_PASSWORD")
+    try:
+        result = dispatch(message, report=report)
+        if result == SENT:
+            print(f"Email berhasil dikirim ke {', '.join(recipients)}")
+        return result
+    except Exception as e:
+        print(f"Error mengirim email: {e}")
+        return None
 
-    message = MIMEMultipart("alternative")
-    message["From"] = sender_email
-    message["Subject"] = subject
-    message["To"] = ", ".join(recipients)
-    message["X-Priority"] = "1"  # High priority
-    message["X-MSMail-Priority"] = "High"
-    message["Importance"] = "High"
-    
-    # Create plain text version
-    plain_text = f"""
-SPV DO Report
-{subject}
+def load_spv_recipients(identities=None):
+    """
+    Read the SPV name to email address map from SPV_RECIPIENTS_FILE (default spv_recipients.json).
+
+    The file is a JSON object such as {"Tonny Saputra": "tonny@example.com"}; a
+    value may also be a list of addresses. Names are mapped to the canonical
+    names of the staff identity map. Returns an empty dict when there is no
+    file, which turns personal emails off.
+    """
+    identities = identities or load_identity_map()
+    path = os.getenv("SPV_RECIPIENTS_FILE", "spv_recipients.json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            mapping = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return {identities.canonical_name(name): [addresses] if isinstance(addresses, str) else list(addresses)
+            for name, addresses in mapping.items()}
+
+def send_personal_reports(report, spv_recipients):
+    """
+    Send each SPV their own row and the team ranking, from the already built report.
+
+    No queries are run; all emails go out over the shared SMTP session (or the outbox).
 
-This is an automated report. Please view the HTML version for complete details.
+    Returns:
+        list: Names of the SPVs whose email was neither sent nor queued (partial sends included)
     """
+    personalizer = report_renderers.SpvPersonalizer(report)
+    subject_dates = f"{format_date_id(report.start_date)} ~ {format_date_id(report.end_date)}"
+    report_fingerprint = report_history.fingerprint(asdict(report))
+    sent = 0
+    failed = []
+    with track("render", detail="spv_personal", recipients=len(spv_recipients)) as record:
+        for name, addresses in spv_recipients.items():
+            if name not in personalizer:
+                print(f"SPV {name} tidak ada di laporan, email personal dilewati")
+                continue
+            report_key = f"spv|{report.start_date}|{report.end_date}|{name}"
+            if report_history.handled_in_slot(report_key):
+                continue
+            html_report = optimize_html(personalizer.html(name), f"spv_personal {name}")
+            if send_email(f"M2 | SPV DO Report {name} ({subject_dates})", html_report, addresses,
+                          plain_text=personalizer.text(name),
+                          report={'job': "spv_report", 'key': report_key, 'fingerprint': report_fingerprint}
+                          ) in (SENT, QUEUED):
+                sent += 1
+            else:
+                failed.append(name)
+        record['sent'] = sent
+        record['failed'] = len(failed)
+    print(f"{sent} email personal SPV terkirim")
+    if failed:
+        print(f"Email personal SPV gagal dikirim: {', '.join(failed)}")
+    return failed
+
+def send_spv_report(start_date, end_date, recipients, spv_recipients=None, identities=None):
+    """
+    Fetch SPV performance for both locations, render the report and email it.
     
-    # Attach both plain text and HTML versions
-    message.attach(MIMEText(plain_text, "plain"))
-    message.attach(MIMEText(body, "html"))
+    Args:
+        start_date (str): Start date in YYYY-MM-DD format
+        end_date (str): End date in YYYY-MM-DD format
+        recipients (list): Email addresses to send the report to
+        spv_recipients (dict, optional): SPV name to addresses for personal emails, see load_spv_recipients()
+        identities (IdentityMap, optional): Staff identity map; loaded from its files when not given
 
-    try:
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(sender_email, app_password)
-            server.send_message(message)
-        print(f"Email berhasil dikirim ke {', '.join(recipients)}")
-        return True
-    except Exception as e:
-        print(f"Error mengirim email: {e}")
-        return False
+    Returns:
+        tuple: (result of sending the team report, see send_email();
+                names of the SPVs whose personal email failed, see send_personal_reports())
+    """
+    # Get SPV performance data for both locations
+    madiun_data = get_spv_performance(start_date, end_date, "honda_mis")
+    magetan_data = get_spv_performance(start_date, end_date, "m2_magetan")
+    
+    # Add database source information to each record
+    for record in madiun_data['data']:
+        record['database_source'] = 'honda_mis'
+    
+    for record in magetan_data['data']:
+        record['database_source'] = 'm2_magetan'
+    
+    # Combine data from both locations
+    combined_data = {
+        'data': madiun_data['data'] + magetan_data['data']
+    }
+    
+    # Generate and send report; newly seen NIKs are remembered for the next run
+    identities = identities or load_identity_map()
+    report = build_spv_report(combined_data, start_date, end_date, identities)
+    identities.save()
+    with track("render", detail="spv_html", spv_rows=len(report.rows)) as record:
+        html_report = report_renderers.spv_html(report)
+        record['bytes'] = len(html_report.encode('utf-8'))
+    html_report = optimize_html(html_report, "spv_report")
+    report_renderers.export(report, f"spv_{start_date}_{end_date}")
+    # Format dates for email subject
+    start_date_id = format_date_id(start_date)
+    end_date_id = format_date_id(end_date)
+    # A scheduler retry does not send the team report again when an earlier attempt did
+    report_key = f"spv|{start_date}|{end_date}"
+    if report_history.handled_in_slot(report_key):
+        print("SPV DO report sudah dikirim pada percobaan sebelumnya di jadwal ini")
+        sent = SENT
+    else:
+        sent = send_email(
+            f"M2 | SPV DO Report ({start_date_id} ~ {end_date_id})",
+            html_report,
+            recipients,
+            plain_text=report_renderers.spv_text(report),
+            report={'job': "spv_report", 'key': report_key, 'fingerprint': report_history.fingerprint(asdict(report))}
+        )
+    failed_personal = send_personal_reports(report, spv_recipients) if spv_recipients else []
+    return sent, failed_personal
 
 def main():
     if len(sys.argv) == 2:
@@ -361,37 +222,26 @@ def main():
     recipients = [email.strip() for email in recipients_str.split(",") if email.strip()]
     
     try:
-        # Get SPV performance data for both locations
-        madiun_data = get_spv_performance(start_date, end_date, "honda_mis")
-        magetan_data = get_spv_performance(start_date, end_date, "m2_magetan")
-        
-        # Add database source information to each record
-        for record in madiun_data['data']:
-            record['database_source'] = 'honda_mis'
-        
-        for record in magetan_data['data']:
-            record['database_source'] = 'm2_magetan'
-        
-        # Combine data from both locations
-        combined_data = {
-            'data': madiun_data['data'] + magetan_data['data']
-        }
-        
-        # Generate and send report
-        html_report = format_spv_report(combined_data, start_date, end_date)
-        # Format dates for email subject
-        start_date_id = format_date_id(start_date)
-        end_date_id = format_date_id(end_date)
-        send_email(
-            f"M2 | SPV DO Report ({start_date_id} ~ {end_date_id})",
-            html_report,
-            recipients
-        )
-        print("SPV DO report sent successfully!")
+        identities = load_identity_map()
+        result, failed_personal = send_spv_report(start_date, end_date, recipients,
+                                                  load_spv_recipients(identities), identities)
+        if result == SENT:
+            print("SPV DO report sent successfully!")
+        elif result == QUEUED:
+            print("SPV DO report queued in the outbox")
+        else:
+            print("SPV DO report could not be sent to every recipient")
+        # Non-zero exit so the scheduler retries; emails already sent in this slot are skipped
+        if result not in (SENT, QUEUED) or failed_personal:
+            sys.exit(1)
         
     except Exception as e:
         print(f"Error generating SPV report: {e}")
         sys.exit(1)
+    finally:
+        close_transport()
+        print_profile_summary()
+        flush_metrics("spv_report")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
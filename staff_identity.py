@@ -0,0 +1,109 @@
+#staff_identity.py
+#Peta identitas SPV dan sales lintas database: (database, NIK) -> nama kanonik
+#Aturan alias di STAFF_ALIASES_FILE (default staff_aliases.json), contoh:
+#  {"Tonny Saputra": {"names": ["Toni Saputra"], "nik": {"m2_magetan": ["K0042"]}}}
+#Peta yang sudah terbentuk disimpan di STAFF_IDENTITY_FILE (default staff_identity.json)
+#  python staff_identity.py   # tampilkan peta
+
+import os
+import json
+from dotenv import load_dotenv
+from report_model import normalize_spv_name
+
+# Load environment variables
+load_dotenv()
+
+
+def aliases_file():
+    return os.getenv("STAFF_ALIASES_FILE", "staff_aliases.json")
+
+
+def identity_file():
+    return os.getenv("STAFF_IDENTITY_FILE", "staff_identity.json")
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+class IdentityMap:
+    """
+    Canonical name of every SPV and salesperson, keyed by (database, NIK).
+
+    A NIK is resolved once: an explicit NIK rule from the alias file wins,
+    then the identity recorded on an earlier run, then the name with the
+    alias file's spellings applied. The result is remembered, so a later
+    change of spelling in one database does not split the person. All
+    lookups are dict lookups, however many locations and staff there are.
+    """
+
+    def __init__(self, aliases=None, known=None):
+        """
+        Args:
+            aliases (dict): {canonical name: {'names': [spellings], 'nik': {database: [NIK, ...]}}}
+            known (dict): {'database|NIK': canonical name} from an earlier run
+        """
+        self._names = {}
+        self._rules = {}
+        for canonical, rule in (aliases or {}).items():
+            canonical = normalize_spv_name(canonical)
+            self._names[canonical] = canonical
+            for name in rule.get('names', ()):
+                self._names[normalize_spv_name(name)] = canonical
+            for database_name, niks in rule.get('nik', {}).items():
+                for nik in niks:
+                    self._rules[f"{database_name}|{nik}"] = canonical
+        # Spellings added to the alias file since also apply to identities already recorded
+        self._known = {key: self.canonical_name(name) for key, name in (known or {}).items()}
+        self.changed = False
+
+    def canonical_name(self, name):
+        """Normalized name with the alias spellings applied, for sources that carry no NIK."""
+        normalized = normalize_spv_name(name)
+        return self._names.get(normalized, normalized)
+
+    def resolve(self, database_name, nik, name):
+        """
+        Canonical name of the employee with this NIK in this database; name is used the first time.
+
+        A NIK without a name (no employee master row yet) is not recorded, so it
+        is resolved again once the master row exists.
+        """
+        if nik is None:
+            return self.canonical_name(name)
+        key = f"{database_name}|{nik}"
+        canonical = self._rules.get(key) or self._known.get(key)
+        if canonical is None:
+            canonical = self.canonical_name(name)
+            if name:
+                self._known[key] = canonical
+                self.changed = True
+        return canonical
+
+    def save(self, path=None):
+        """Write the recorded identities back to STAFF_IDENTITY_FILE if any were added."""
+        if not self.changed:
+            return
+        path = path or identity_file()
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(self._known.items())), f, indent=2, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+        self.changed = False
+
+    def items(self):
+        """(database|NIK, canonical name) pairs, alias file rules included."""
+        return sorted({**self._known, **self._rules}.items())
+
+
+def load_identity_map():
+    """IdentityMap built from STAFF_ALIASES_FILE and the identities stored in STAFF_IDENTITY_FILE."""
+    return IdentityMap(_read_json(aliases_file()), _read_json(identity_file()))
+
+
+if __name__ == "__main__":
+    for key, name in load_identity_map().items():
+        print(f"{key:<30} {name}")
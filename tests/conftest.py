@@ -0,0 +1,198 @@
+#tests/conftest.py
+#Fixture bersama: direktori kerja sementara, SMTP sink dan fixture database sintetis
+#  python -m pytest -q
+
+import os
+import sys
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_fixtures
+import db_operations
+import mail_transport
+from smtp_sink import SMTPSink
+
+# Report date every recorded fixture belongs to
+REPORT_DATE = date(2025, 6, 5)
+RECIPIENTS = ["owner@example.com", "manager@example.com"]
+
+# Synthetic master tables per database
+EMPLOYEES = {
+    'honda_mis': {'S1': "TONNY SAPUTRA", 'S2': "Budi Santoso", 'L1': "Ani", 'L2': "Cici"},
+    'm2_magetan': {'K9': "Toni Saputra", 'M1': "ani"},
+}
+MODELS = {
+    1: {'data_id': 1, 'nama_lengkap': "BEAT CBS", 'kode_warna_lengkap': "BEAT-HITAM", 'perk_notice': Decimal("150000")},
+    2: {'data_id': 2, 'nama_lengkap': "VARIO 125", 'kode_warna_lengkap': "VARIO-MERAH", 'perk_notice': Decimal("200000")},
+}
+FINANCE = {'ADIRA': "Adira Finance", 'FIF': "FIF Group"}
+DIMENSION_TABLES = {table for table, _, _ in db_operations.DIMENSIONS.values()}
+# (supervisor, sales) pairs with DOs per database
+SPV_SALES = {
+    'honda_mis': [('S1', 'L1', 12), ('S2', 'L2', 7)],
+    'm2_magetan': [('K9', 'M1', 5)],
+}
+
+
+class FakeDealerCursor:
+    """
+    Dictionary cursor answering the report queries with synthetic rows.
+
+    Only used while recording fixtures; the tests themselves replay them.
+    Queries are recognised by their table and GROUP BY; anything else is empty.
+    """
+
+    def __init__(self, database_name):
+        self.database = database_name
+        self.rows = []
+
+    def execute(self, query, params=()):
+        self.rows = self._answer(" ".join(query.split()), params)
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+    def _answer(self, query, params):
+        table = query.split()[-1]
+        if query.startswith("SELECT COUNT(*) AS n FROM"):
+            return [{'n': len(self._dimension(table))}]
+        if table in DIMENSION_TABLES:
+            return self._dimension(table)
+        if "GROUP BY DATE(bast.tgl_bast), spk.cara_bayar" in query:
+            return self._vehicle_rows(params[-2], params[-1])
+        if query.startswith("SELECT COUNT(*) as total_vehicles"):
+            return self._margin_summary(self._vehicle_rows(params[-2], params[-1]))
+        if "GROUP BY spk.supervisor, spk.sales" in query:
+            return [{'supervisor': spv, 'sales': sales, 'total_do': count, 'today_do': 1, 'mtd_do': count // 2,
+                     'ytd_do': count, 'today_margin': Decimal("1000000"), 'mtd_margin': Decimal(count) * 500000,
+                     'ytd_margin': Decimal(count) * 1000000}
+                    for spv, sales, count in SPV_SALES[self.database]]
+        return []
+
+    def _dimension(self, table):
+        if table == "tbl_data_induk_karyawan":
+            return [{'nik': nik, 'nama_karyawan': name} for nik, name in EMPLOYEES[self.database].items()]
+        if table == "tbl_data_induk_finance":
+            return [{'kode_finance': code, 'nama_finance': name} for code, name in FINANCE.items()]
+        if table == "vi_data_induk_barang_motor":
+            return list(MODELS.values())
+        return []
+
+    @staticmethod
+    def _margin_summary(rows):
+        def total(field, payment=None):
+            return sum(row[field] for row in rows if payment in (None, row['cara_bayar']))
+
+        return [{'total_vehicles': total('units'), 'total_harga_jual': total('harga_tebus') + total('margin'),
+                 'total_harga_tebus': total('harga_tebus'), 'total_margin': total('margin'),
+                 'tunai_count': total('units', "TUNAI"), 'kredit_count': total('units', "KREDIT"),
+                 'tunai_margin': total('margin', "TUNAI"), 'kredit_margin': total('margin', "KREDIT")}]
+
+    def _vehicle_rows(self, start, end):
+        # One cash and one credit sale per day; Magetan sells half as much
+        day, last = _as_date(start), _as_date(end)
+        scale = 2 if self.database == 'honda_mis' else 1
+        rows = []
+        while day <= last:
+            rows.append({'tgl': day, 'cara_bayar': "TUNAI", 'kendaraan_warna_id': 1, 'kode_finance': None,
+                         'tenor': None, 'units': scale, 'harga_tebus': Decimal(scale * 17000000),
+                         'margin': Decimal(scale * 900000)})
+            rows.append({'tgl': day, 'cara_bayar': "KREDIT", 'kendaraan_warna_id': 2, 'kode_finance': "ADIRA",
+                         'tenor': 24, 'units': scale, 'harga_tebus': Decimal(scale * 22000000),
+                         'margin': Decimal(scale * 1200000)})
+            day += timedelta(days=1)
+        return rows
+
+
+class FakeDealerConnection:
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self, *args, **kwargs):
+        return FakeDealerCursor(self.database)
+
+    def close(self):
+        pass
+
+
+def _as_date(value):
+    return value if isinstance(value, date) else datetime.strptime(str(value), '%Y-%m-%d').date()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in a temporary directory with every state, history and cache file inside it."""
+    monkeypatch.chdir(tmp_path)
+    for name, value in {
+        'REPORT_STATE_FILE': "report_state.json",
+        'REPORT_HISTORY_FILE': "report_history.jsonl",
+        'REPORT_UNCHANGED_MODE': "send",
+        'STAFF_IDENTITY_FILE': "staff_identity.json",
+        'STAFF_ALIASES_FILE': "staff_aliases.json",
+        'SPV_RECIPIENTS_FILE': "spv_recipients.json",
+        'SPK_CACHE_FILE': "spk_pipeline_cache.json",
+        'OUTBOX_ENABLED': "0",
+        'OUTBOX_DIR': "outbox",
+        'METRICS_FILE': "metrics.jsonl",
+        'REPORT_EXPORT_FORMATS': "",
+        'EMAIL_RECIPIENTS': ",".join(RECIPIENTS),
+    }.items():
+        monkeypatch.setenv(name, value)
+    for name in ('REPORT_SLOT_START', 'REPORT_PHASE_FILE', 'QUERY_PROFILE', 'DB_FIXTURE_MODE'):
+        monkeypatch.delenv(name, raising=False)
+    db_operations.clear_dimension_cache()
+    yield tmp_path
+    db_operations.clear_dimension_cache()
+
+
+@pytest.fixture
+def sink(workdir, monkeypatch):
+    """Local SMTP sink the reports are delivered to."""
+    server = SMTPSink().start()
+    monkeypatch.setenv("SMTP_SERVER", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(server.port))
+    monkeypatch.setenv("SMTP_STARTTLS", "0")
+    monkeypatch.setenv("SENDER_EMAIL", "reports@example.com")
+    monkeypatch.setenv("SENDER_PASSWORD", "secret")
+    yield server
+    mail_transport.close_transport()
+    server.stop()
+
+
+@pytest.fixture
+def replay(workdir, monkeypatch):
+    """
+    Record the synthetic dealer databases into fixtures, then switch to replay.
+
+    Recording goes through the real execute_query() with FakeDealerCursor in
+    place of MySQL, so the fixtures are keyed by the real query text.
+    """
+    import vehicle_reporting
+
+    # The recorded clock is per process; each test records its own
+    monkeypatch.setattr(db_fixtures, "_recorded_clock", {})
+    monkeypatch.setenv("DB_FIXTURE_DIR", str(workdir / "fixtures"))
+    monkeypatch.setenv("DB_FIXTURE_MODE", "record")
+    monkeypatch.setattr(db_operations.mysql.connector, "connect",
+                        lambda database=None, **kwargs: FakeDealerConnection(database))
+    for db_name, _ in db_operations.LOCATIONS:
+        vehicle_reporting.fetch_location_aggregates(db_name, REPORT_DATE)
+        db_operations.get_spv_performance(REPORT_DATE.replace(month=1, day=1).isoformat(),
+                                          REPORT_DATE.isoformat(), db_name)
+    monkeypatch.setattr(db_operations.mysql.connector, "connect", _no_database)
+    monkeypatch.setenv("DB_FIXTURE_MODE", "replay")
+    db_operations.clear_dimension_cache()
+    if os.path.exists("staff_identity.json"):
+        os.remove("staff_identity.json")
+    return workdir
+
+
+def _no_database(**kwargs):
+    raise AssertionError("replay must not connect to MySQL")
@@ -0,0 +1,71 @@
+#tests/test_margin_sql.py
+#Rumus margin per unit dievaluasi dengan SQLite pada satu baris SPK
+
+import sqlite3
+
+import pytest
+
+import vehicle_reporting
+from db_operations import MARGIN_UNIT_SQL, MARGIN_UNIT_SQL_NO_NOTICE
+
+ROW = {
+    'spk': {'harga_jual': 20000000, 'diskon': 500000, 'nota_kredit': 100000, 'komisi_makelar': 50000,
+            'um_t_leasing': 3000000, 'uang_muka': 2500000, 'komisi_makelar_leasing': 75000,
+            'promo_pusat': 200000, 'perk_adm_wil': 40000, 'saving': 30000},
+    'dor': {'harga_ppn': 17000000},
+    'pl': {'dp_gross': 400000, 'subs_ahm': 60000, 'main_dealer': 80000},
+    'mb': {'perk_notice': 150000},
+}
+
+
+def margin(sql):
+    conn = sqlite3.connect(":memory:")
+    for table, values in ROW.items():
+        conn.execute(f"CREATE TABLE {table} ({', '.join(values)})")
+        conn.execute(f"INSERT INTO {table} VALUES ({', '.join('?' * len(values))})", list(values.values()))
+    return conn.execute(f"SELECT {sql} FROM spk, dor, pl, mb").fetchone()[0]
+
+
+def expected(database_name):
+    spk, pl, notice = ROW['spk'], ROW['pl'], ROW['mb']['perk_notice']
+    madiun = database_name == "honda_mis"
+    return (spk['harga_jual'] - (
+        ROW['dor']['harga_ppn'] + spk['diskon'] + spk['nota_kredit'] + spk['komisi_makelar']
+        + pl['dp_gross'] - (pl['subs_ahm'] + pl['main_dealer'] if madiun else 0) - notice
+        + (spk['um_t_leasing'] - spk['uang_muka'] + spk['komisi_makelar_leasing'])
+        - spk['promo_pusat']
+    ) - (spk['perk_adm_wil'] if madiun else 0) + spk['saving'])
+
+
+@pytest.mark.parametrize("database_name", ["honda_mis", "default"])
+def test_margin_unit_sql_matches_the_formula(database_name):
+    assert margin(MARGIN_UNIT_SQL[database_name]) == expected(database_name)
+
+
+@pytest.mark.parametrize("database_name", ["honda_mis", "default"])
+def test_margin_without_notice_only_leaves_out_perk_notice(database_name):
+    # resolve_vehicle_rows() adds perk_notice per unit to the vehicle query's margin
+    assert margin(MARGIN_UNIT_SQL_NO_NOTICE[database_name]) + ROW['mb']['perk_notice'] == expected(database_name)
+
+
+def test_margin_summary_uses_the_shared_formula(workdir, monkeypatch):
+    queries = []
+
+    class Cursor:
+        def close(self):
+            pass
+
+    class Connection:
+        def cursor(self, **kwargs):
+            return Cursor()
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(vehicle_reporting, "connect_to_database", lambda database_name: Connection())
+    monkeypatch.setattr(vehicle_reporting, "execute_query",
+                        lambda cursor, query, *args, **kwargs: queries.append(query))
+    for database_name in ("honda_mis", "m2_magetan"):
+        vehicle_reporting.get_margin_summary("2025-06-01", "2025-06-05", database_name)
+    assert queries[0].count(MARGIN_UNIT_SQL["honda_mis"]) == 3
+    assert queries[1].count(MARGIN_UNIT_SQL["default"]) == 3
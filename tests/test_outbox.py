@@ -0,0 +1,96 @@
+#tests/test_outbox.py
+#Antrian outbox: pengiriman, retry, dead letter dan riwayat laporan
+
+import os
+import time
+
+import pytest
+
+import outbox
+import report_history
+from mail_transport import MailTransport, build_message
+
+REPORT = {'job': "vehicle_reporting", 'key': "honda_mis|2025-06-05", 'fingerprint': "abc"}
+
+
+@pytest.fixture
+def queue(sink, monkeypatch):
+    monkeypatch.setenv("OUTBOX_ENABLED", "1")
+    transport = MailTransport()
+    yield transport
+    transport.close()
+
+
+def _deliver(transport, **kwargs):
+    return outbox.deliver_pending(transport, rate_per_minute=6000, **kwargs)
+
+
+def _queue_report(recipients):
+    message = build_message("M2 | test", "<p>x</p>", recipients)
+    assert outbox.dispatch(message, report=REPORT) == outbox.QUEUED
+
+
+def _decisions():
+    return [entry['decision'] for entry in report_history.read_history() if entry['key'] == REPORT['key']]
+
+
+def test_permanent_refusal_of_some_recipients_is_partial(queue, sink):
+    sink.reject_recipients = {"b@example.com"}
+    _queue_report(["a@example.com", "b@example.com"])
+
+    assert _deliver(queue) == {'sent': 1, 'retry': 0, 'dead': 0}
+    assert _decisions() == ["queued", "partial"]
+    entry = report_history.read_history()[-1]
+    assert list(entry['recipient_status']) == ["b@example.com"]
+    assert report_history.last_delivered(REPORT['key']) is None
+
+
+def test_permanent_refusal_of_every_recipient_is_a_dead_letter(queue, sink):
+    sink.reject_recipients = {"a@example.com"}
+    _queue_report(["a@example.com"])
+
+    assert _deliver(queue) == {'sent': 0, 'retry': 0, 'dead': 1}
+    assert _decisions() == ["queued", "failed"]
+    assert outbox.status() == {'pending': 0, 'sent': 0, 'dead': 1}
+
+
+def test_failed_send_is_retried_with_backoff(queue, sink, monkeypatch):
+    _queue_report(["a@example.com"])
+    monkeypatch.setenv("SMTP_PORT", "1")
+    down = MailTransport()
+
+    assert _deliver(down) == {'sent': 0, 'retry': 1, 'dead': 0}
+    assert outbox.status()['pending'] == 1
+    # Not due yet: the first retry waits BASE_BACKOFF_SECONDS
+    assert _deliver(queue) == {'sent': 0, 'retry': 0, 'dead': 0}
+
+    monkeypatch.setattr(outbox.time, "time", lambda real=outbox.time.time: real() + outbox.BASE_BACKOFF_SECONDS)
+    assert _deliver(queue) == {'sent': 1, 'retry': 0, 'dead': 0}
+    assert len(sink.messages) == 1
+    assert _decisions() == ["queued", "sent"]
+
+
+def test_message_becomes_a_dead_letter_after_max_attempts_and_can_be_retried(queue, sink, monkeypatch):
+    _queue_report(["a@example.com"])
+    monkeypatch.setenv("SMTP_PORT", "1")
+    down = MailTransport()
+
+    assert _deliver(down, max_attempts=1) == {'sent': 0, 'retry': 0, 'dead': 1}
+    assert outbox.status() == {'pending': 0, 'sent': 0, 'dead': 1}
+    assert _decisions() == ["queued", "failed"]
+
+    assert outbox.retry_dead() == 1
+    assert _deliver(queue) == {'sent': 1, 'retry': 0, 'dead': 0}
+    assert report_history.last_delivered(REPORT['key']) is not None
+
+
+def test_claim_is_not_stale_right_after_a_long_wait_in_pending(queue, monkeypatch):
+    _queue_report(["a@example.com"])
+    pending = outbox.outbox_dir("pending")
+    meta_path = [os.path.join(pending, name) for name in os.listdir(pending) if name.endswith(".json")][0]
+    old = time.time() - outbox.STALE_CLAIM_SECONDS - 60
+    os.utime(meta_path, (old, old))
+
+    claimed = outbox._claim(meta_path)
+    outbox._release_stale_claims(pending)
+    assert os.path.exists(claimed)
@@ -0,0 +1,75 @@
+#tests/test_report_history.py
+#Laporan yang tidak berubah: send, skip, notice dan --force terhadap SMTP sink
+
+import email
+import time
+
+import report_history
+import vehicle_reporting
+from conftest import REPORT_DATE
+
+REPORT_KEY = f"honda_mis|{REPORT_DATE}"
+
+
+def _send_twice(monkeypatch, mode, force=False):
+    monkeypatch.setenv("GROUP_REPORT", "0")
+    assert vehicle_reporting.main(specific_date=REPORT_DATE) is True
+    monkeypatch.setenv("REPORT_UNCHANGED_MODE", mode)
+    assert vehicle_reporting.main(specific_date=REPORT_DATE, force=force) is True
+    return [entry['decision'] for entry in report_history.read_history() if entry['key'] == REPORT_KEY]
+
+
+def test_fingerprint_ignores_key_order():
+    assert report_history.fingerprint({'a': 1, 'b': [2]}) == report_history.fingerprint({'b': [2], 'a': 1})
+    assert report_history.fingerprint({'a': 1}) != report_history.fingerprint({'a': 2})
+
+
+def test_unknown_mode_falls_back_to_send(workdir, monkeypatch):
+    monkeypatch.setenv("REPORT_UNCHANGED_MODE", "SKIP")
+    assert report_history.unchanged_mode() == "skip"
+    monkeypatch.setenv("REPORT_UNCHANGED_MODE", "drop")
+    assert report_history.unchanged_mode() == "send"
+
+
+def test_send_mode_delivers_the_same_report_again(replay, sink, monkeypatch):
+    assert _send_twice(monkeypatch, "send") == ["sent", "sent"]
+    assert len(sink.messages) == 4
+
+
+def test_skip_mode_suppresses_an_unchanged_report(replay, sink, monkeypatch):
+    assert _send_twice(monkeypatch, "skip") == ["sent", "skipped"]
+    assert len(sink.messages) == 2
+    skipped = [entry for entry in report_history.read_history() if entry['key'] == REPORT_KEY][-1]
+    assert report_history.last_delivered(REPORT_KEY)['fingerprint'] == skipped['fingerprint']
+
+
+def test_notice_mode_sends_a_short_notice(replay, workdir, sink, monkeypatch):
+    sink.save_dir = str(workdir / "mail")
+    (workdir / "mail").mkdir()
+    assert _send_twice(monkeypatch, "notice") == ["sent", "notice"]
+
+    subjects = [email.message_from_bytes(path.read_bytes())["Subject"] for path in sorted((workdir / "mail").iterdir())]
+    assert len(subjects) == 4
+    assert subjects[-2:] == ["M2 | M2 Madiun today: tidak ada perubahan", "M2 | M2 Magetan today: tidak ada perubahan"]
+
+
+def test_force_sends_the_full_report_in_skip_mode(replay, sink, monkeypatch):
+    assert _send_twice(monkeypatch, "skip", force=True) == ["sent", "sent"]
+    assert len(sink.messages) == 4
+
+
+def test_changed_numbers_are_sent_in_skip_mode(workdir, monkeypatch):
+    monkeypatch.setenv("REPORT_UNCHANGED_MODE", "skip")
+    report_history.mark_delivered(REPORT_KEY, "old")
+    assert report_history.is_unchanged(REPORT_KEY, "old")
+    assert not report_history.is_unchanged(REPORT_KEY, "new")
+    assert not report_history.is_unchanged("m2_magetan|2025-06-05", "old")
+
+
+def test_retry_in_the_same_slot_is_not_sent_again(replay, sink, monkeypatch):
+    monkeypatch.setenv("GROUP_REPORT", "0")
+    monkeypatch.setenv("REPORT_SLOT_START", str(time.time() - 1))
+    assert vehicle_reporting.main(specific_date=REPORT_DATE) is True
+    assert report_history.handled_in_slot(REPORT_KEY)
+    assert vehicle_reporting.main(specific_date=REPORT_DATE) is True
+    assert len(sink.messages) == 2
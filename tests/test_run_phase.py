@@ -0,0 +1,22 @@
+#tests/test_run_phase.py
+#Penanda fase yang dibaca watchdog scheduler
+
+import run_phase
+
+
+def test_detail_with_tabs_round_trips(workdir, monkeypatch):
+    monkeypatch.setenv("REPORT_PHASE_FILE", "phase")
+    run_phase.set_phase("smtp", "M2 | Madiun\tDO: 4")
+
+    phase, detail, stuck_for = run_phase.read_phase("phase")
+    assert (phase, detail) == ("smtp", "M2 | Madiun DO: 4")
+    # The timestamp is stored in whole seconds
+    assert abs(stuck_for) < 5
+
+
+def test_tab_in_detail_written_by_an_older_run(workdir):
+    with open("phase", "w", encoding="utf-8") as f:
+        f.write("query\thonda_mis\tvehicle data\t1700000000")
+
+    phase, detail, _ = run_phase.read_phase("phase")
+    assert (phase, detail) == ("query", "honda_mis\tvehicle data")
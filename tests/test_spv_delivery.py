@@ -0,0 +1,67 @@
+#tests/test_spv_delivery.py
+#Laporan SPV dan email personal dari fixture replay sampai ke SMTP sink
+
+import json
+import sys
+
+import pytest
+
+import report_history
+import spv_report
+from conftest import REPORT_DATE, RECIPIENTS
+
+START, END = REPORT_DATE.replace(month=1, day=1).isoformat(), REPORT_DATE.isoformat()
+
+
+@pytest.fixture
+def spv_run(replay, sink, monkeypatch):
+    """Run spv_report.main() for the recorded range; returns its exit code."""
+    (replay / "staff_aliases.json").write_text(json.dumps({"Tonny Saputra": {"names": ["Toni Saputra"]}}))
+    monkeypatch.setattr(sys, "argv", ["spv_report.py", START, END])
+
+    def run():
+        try:
+            spv_report.main()
+        except SystemExit as e:
+            return e.code
+        return 0
+    return run
+
+
+def _personal(recipients):
+    with open("spv_recipients.json", "w", encoding="utf-8") as f:
+        json.dump(recipients, f)
+
+
+def test_team_report_merges_staff_across_databases(spv_run, sink):
+    assert spv_run() == 0
+
+    assert len(sink.messages) == 1
+    assert sorted(sink.messages[0]['to']) == sorted(RECIPIENTS)
+    identities = json.load(open("staff_identity.json", encoding="utf-8"))
+    assert identities["honda_mis|S1"] == identities["m2_magetan|K9"] == "Tonny Saputra"
+
+
+def test_personal_emails_go_to_each_spv(spv_run, sink):
+    _personal({"Tonny Saputra": "tonny@example.com", "Budi Santoso": ["budi@example.com"]})
+
+    assert spv_run() == 0
+    assert sorted(address for message in sink.messages for address in message['to']) == sorted(
+        RECIPIENTS + ["tonny@example.com", "budi@example.com"])
+
+
+def test_failed_personal_email_fails_the_run_and_is_resent_on_retry(spv_run, sink, monkeypatch):
+    _personal({"Tonny Saputra": "tonny@example.com", "Budi Santoso": "budi@example.com"})
+    monkeypatch.setenv("REPORT_SLOT_START", "0")
+    sink.reject_recipients = {"budi@example.com"}
+
+    assert spv_run() == 1
+    assert len(sink.messages) == 2
+
+    # The scheduler's retry in the same slot only sends what did not go out
+    sink.reject_recipients = set()
+    assert spv_run() == 0
+    assert len(sink.messages) == 3
+    assert sink.messages[-1]['to'] == ["budi@example.com"]
+    decisions = [entry['decision'] for entry in report_history.read_history() if entry['key'].endswith("Budi Santoso")]
+    assert decisions == ["failed", "sent"]
@@ -0,0 +1,63 @@
+#tests/test_staff_identity.py
+#Peta identitas staf: alias nama, aturan NIK dan identitas yang tersimpan antar run
+
+import json
+
+import staff_identity
+from staff_identity import IdentityMap, load_identity_map
+
+ALIASES = {"Tonny Saputra": {"names": ["Toni Saputra"], "nik": {"m2_magetan": ["K0042"]}}}
+
+
+def test_alias_spellings_map_to_the_canonical_name():
+    identities = IdentityMap(ALIASES)
+    assert identities.resolve("honda_mis", "S1", "TONNY SAPUTRA") == "Tonny Saputra"
+    assert identities.resolve("m2_magetan", "K9", " toni saputra ") == "Tonny Saputra"
+    assert identities.canonical_name("Budi Santoso") == "Budi Santoso"
+
+
+def test_nik_rule_wins_over_the_name():
+    identities = IdentityMap(ALIASES)
+    assert identities.resolve("m2_magetan", "K0042", "T. Saputra") == "Tonny Saputra"
+    # Rules are per database
+    assert identities.resolve("honda_mis", "K0042", "T. Saputra") == "T. Saputra"
+
+
+def test_resolved_nik_keeps_its_identity_after_a_respelling():
+    identities = IdentityMap()
+    assert identities.resolve("honda_mis", "S2", "Budi Santoso") == "Budi Santoso"
+    assert identities.resolve("honda_mis", "S2", "Budi Santosa") == "Budi Santoso"
+    assert identities.changed
+
+
+def test_identities_survive_a_save_and_reload(workdir):
+    identities = load_identity_map()
+    identities.resolve("honda_mis", "S2", "Budi Santoso")
+    identities.save()
+    assert not identities.changed
+    assert json.loads((workdir / "staff_identity.json").read_text()) == {"honda_mis|S2": "Budi Santoso"}
+
+    reloaded = load_identity_map()
+    assert reloaded.resolve("honda_mis", "S2", "BUDI SANTOSA") == "Budi Santoso"
+    reloaded.save()
+    assert not reloaded.changed
+
+
+def test_new_alias_applies_to_identities_already_recorded(workdir):
+    (workdir / "staff_identity.json").write_text(json.dumps({"m2_magetan|K9": "Toni Saputra"}))
+    (workdir / staff_identity.aliases_file()).write_text(json.dumps(ALIASES))
+    assert load_identity_map().resolve("m2_magetan", "K9", "Toni Saputra") == "Tonny Saputra"
+
+
+def test_missing_name_is_not_recorded():
+    identities = IdentityMap()
+    assert identities.resolve("honda_mis", "S9", None) == "Unknown"
+    assert not identities.changed
+    assert identities.resolve("honda_mis", "S9", "Dewi") == "Dewi"
+    assert identities.items() == [("honda_mis|S9", "Dewi")]
+
+
+def test_row_without_nik_is_matched_by_name_only():
+    identities = IdentityMap(ALIASES)
+    assert identities.resolve("honda_mis", None, "toni saputra") == "Tonny Saputra"
+    assert identities.items() == [("m2_magetan|K0042", "Tonny Saputra")]
@@ -0,0 +1,91 @@
+#tests/test_vehicle_delivery.py
+#Laporan kendaraan dari fixture replay sampai ke SMTP sink
+
+import email
+import json
+
+import report_history
+import vehicle_reporting
+from conftest import REPORT_DATE, RECIPIENTS
+
+
+def _history():
+    return report_history.read_history()
+
+
+def test_main_delivers_every_location_and_the_group(replay, sink):
+    assert vehicle_reporting.main(specific_date=REPORT_DATE) is True
+
+    assert len(sink.messages) == 3
+    assert all(sorted(message['to']) == sorted(RECIPIENTS) for message in sink.messages)
+    decisions = {entry['key']: entry['decision'] for entry in _history()}
+    assert decisions == {
+        f"honda_mis|{REPORT_DATE}": "sent",
+        f"m2_magetan|{REPORT_DATE}": "sent",
+        f"{vehicle_reporting.GROUP_DATABASE}|{REPORT_DATE}": "sent",
+    }
+    for key in decisions:
+        assert report_history.last_delivered(key) is not None
+
+
+def test_subject_carries_the_daily_cards(replay, workdir, sink, monkeypatch):
+    monkeypatch.setenv("GROUP_REPORT", "0")
+    sink.save_dir = str(workdir / "mail")
+    (workdir / "mail").mkdir()
+    vehicle_reporting.main(specific_date=REPORT_DATE)
+
+    subjects = [email.message_from_bytes(path.read_bytes())["Subject"] for path in sorted((workdir / "mail").iterdir())]
+    # honda_mis sells 2 cash and 2 credit units a day in the synthetic data
+    assert subjects[0] == "M2 | M2 Madiun today, DO: 4, Margin: Rp 4,200,000"
+    assert subjects[1] == "M2 | M2 Magetan today, DO: 2, Margin: Rp 2,100,000"
+
+
+def test_refused_recipients_fail_the_report(replay, sink, monkeypatch):
+    monkeypatch.setenv("GROUP_REPORT", "0")
+    sink.reject_recipients = set(RECIPIENTS)
+
+    assert vehicle_reporting.main(specific_date=REPORT_DATE) is False
+    assert sink.messages == []
+    assert {entry['decision'] for entry in _history()} == {"failed"}
+    assert report_history.last_delivered(f"honda_mis|{REPORT_DATE}") is None
+
+
+def test_partial_delivery_is_recorded_and_not_marked_delivered(replay, sink, monkeypatch):
+    monkeypatch.setenv("GROUP_REPORT", "0")
+    sink.reject_recipients = {RECIPIENTS[1]}
+
+    assert vehicle_reporting.main(specific_date=REPORT_DATE) is False
+    entries = _history()
+    assert {entry['decision'] for entry in entries} == {"partial"}
+    assert all(list(entry['recipient_status']) == [RECIPIENTS[1]] for entry in entries)
+    assert report_history.last_delivered(f"honda_mis|{REPORT_DATE}") is None
+
+
+def test_retry_in_the_same_slot_skips_reports_already_sent(replay, sink, monkeypatch):
+    monkeypatch.setenv("GROUP_REPORT", "0")
+    monkeypatch.setenv("REPORT_SLOT_START", "0")
+    vehicle_reporting.main(specific_date=REPORT_DATE)
+    vehicle_reporting.main(specific_date=REPORT_DATE)
+
+    assert len(sink.messages) == 2
+
+
+def test_queued_report_is_marked_delivered_by_the_sender(replay, sink, monkeypatch):
+    import outbox
+    from mail_transport import MailTransport
+
+    monkeypatch.setenv("GROUP_REPORT", "0")
+    monkeypatch.setenv("OUTBOX_ENABLED", "1")
+    assert vehicle_reporting.main(specific_date=REPORT_DATE) is True
+    key = f"honda_mis|{REPORT_DATE}"
+    assert sink.messages == []
+    assert report_history.last_delivered(key) is None
+
+    transport = MailTransport()
+    try:
+        assert outbox.deliver_pending(transport, rate_per_minute=6000) == {'sent': 2, 'retry': 0, 'dead': 0}
+    finally:
+        transport.close()
+    assert len(sink.messages) == 2
+    assert report_history.last_delivered(key) is not None
+    assert [entry['decision'] for entry in _history() if entry['key'] == key] == ["queued", "sent"]
@@ -2,38 +2,31 @@
 
 import os
 import time
-import smtplib
 import argparse
 import traceback
 import sys
+from dataclasses import asdict, replace
 import mysql.connector
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timezone, timedelta, date
-from db_operations import get_vehicle_data, connect_to_database
+from db_operations import (get_vehicle_data, slice_vehicle_data, get_spk_pipeline, connect_to_database,
+                           execute_query, unit_cost_joins, LOCATIONS, MARGIN_UNIT_SQL)
 from dotenv import load_dotenv
+from metrics import track, flush_metrics
+from query_profiler import print_profile_summary
+import db_fixtures
+import report_history
+from report_model import (build_vehicle_report, merge_vehicle_data, merge_margin_summaries, merge_trends,
+                          merge_year_comparisons, merge_spk_pipelines, format_currency, format_percentage, format_date)
+import report_renderers
+from staff_identity import load_identity_map
+from email_optimizer import optimize_html
+from mail_transport import build_message, close_transport
+from outbox import dispatch, SENT, QUEUED, PARTIAL
 
 # Load environment variables
 load_dotenv()
 
 
-def format_currency(amount):
-    """Format number to Indonesian Rupiah."""
-    return f"Rp {amount:,.0f}"
-
-def format_percentage(value):
-    """Format number to percentage with 2 decimal places."""
-    return f"{value:+.2f}%" if value != 0 else "0.00%"
-
-def format_date(date):
-    """Format date to Indonesian format."""
-    months = {
-        1: 'Januari', 2: 'Februari', 3: 'Maret', 4: 'April',
-        5: 'Mei', 6: 'Juni', 7: 'Juli', 8: 'Agustus',
-        9: 'September', 10: 'Oktober', 11: 'November', 12: 'Desember'
-    }
-    return f"{date.day} {months[date.month]} {date.year}"
-
 def parse_date(date_str):
     """
     Parse date string in DD-MM-YYYY format to YYYY-MM-DD format
@@ -76,150 +69,37 @@ def get_margin_summary(start_date, end_date, database_name="honda_mis"):
     """
     conn = connect_to_database(database_name)
     cursor = conn.cursor(dictionary=True)
+    cost_joins = unit_cost_joins(database_name)
     
-    # Choose the appropriate query based on the database
-    if database_name == "honda_mis":
-        # Original query for honda_mis
-        query = """
-        SELECT 
-            COUNT(*) as total_vehicles,
-            SUM(spk.harga_jual) as total_harga_jual,
-            SUM(IFNULL(dor.harga_ppn, 0)) as total_harga_tebus,
-            SUM(
-                spk.harga_jual - (
-                    IFNULL(dor.harga_ppn, 0) + 
-                    spk.diskon + 
-                    spk.nota_kredit + 
-                    spk.komisi_makelar +
-                    IFNULL(pl.dp_gross, 0) - 
-                    IFNULL(pl.subs_ahm, 0) - 
-                    IFNULL(pl.main_dealer, 0) - 
-                    IFNULL(mb.perk_notice, 0) +
-                    (spk.um_t_leasing - spk.uang_muka + spk.komisi_makelar_leasing) - 
-                    spk.promo_pusat
-                ) - spk.perk_adm_wil + spk.saving
-            ) AS total_margin,
-            SUM(CASE WHEN (spk.cara_bayar IS NULL OR spk.cara_bayar != 'KREDIT') THEN 1 ELSE 0 END) as tunai_count,
-            SUM(CASE WHEN spk.cara_bayar = 'KREDIT' THEN 1 ELSE 0 END) as kredit_count,
-            SUM(CASE WHEN (spk.cara_bayar IS NULL OR spk.cara_bayar != 'KREDIT') THEN 
-                spk.harga_jual - (
-                    IFNULL(dor.harga_ppn, 0) + 
-                    spk.diskon + 
-                    spk.nota_kredit + 
-                    spk.komisi_makelar +
-                    IFNULL(pl.dp_gross, 0) - 
-                    IFNULL(pl.subs_ahm, 0) - 
-                    IFNULL(pl.main_dealer, 0) - 
-                    IFNULL(mb.perk_notice, 0) +
-                    (spk.um_t_leasing - spk.uang_muka + spk.komisi_makelar_leasing) - 
-                    spk.promo_pusat
-                ) - spk.perk_adm_wil + spk.saving
-            ELSE 0 END) AS tunai_margin,
-            SUM(CASE WHEN spk.cara_bayar = 'KREDIT' THEN 
-                spk.harga_jual - (
-                    IFNULL(dor.harga_ppn, 0) + 
-                    spk.diskon + 
-                    spk.nota_kredit + 
-                    spk.komisi_makelar +
-                    IFNULL(pl.dp_gross, 0) - 
-                    IFNULL(pl.subs_ahm, 0) - 
-                    IFNULL(pl.main_dealer, 0) - 
-                    IFNULL(mb.perk_notice, 0) +
-                    (spk.um_t_leasing - spk.uang_muka + spk.komisi_makelar_leasing) - 
-                    spk.promo_pusat
-                ) - spk.perk_adm_wil + spk.saving
-            ELSE 0 END) AS kredit_margin
-        FROM tbl_spk AS spk 
-        INNER JOIN tbl_bast AS bast 
-            ON bast.kode_spk = spk.kode_spk 
-        INNER JOIN vi_data_induk_barang_motor AS mb 
-            ON spk.kendaraan_warna_id = mb.data_id 
-        INNER JOIN tbl_data_induk_pelanggan AS mp 
-            ON spk.kode_pelanggan_faktur = mp.pelanggan_id 
-        LEFT JOIN tbl_sub_barang_masuk AS sbm 
-            ON bast.no_rangka = sbm.no_rangka
-        LEFT JOIN tbl_barang_masuk AS bm 
-            ON sbm.kode_bm = bm.kode_bm
-        LEFT JOIN vi_do_lengkap AS dor 
-            ON bm.no_do = dor.no_do 
-            AND mb.kode_warna_lengkap = dor.kode_barang_lengkap
-        LEFT JOIN tbl_penagihan_leasing pl 
-            ON pl.kode_bast = bast.kode_bast
-        WHERE DATE(bast.tgl_bast) BETWEEN %s AND %s
-        """
-    else:
-        # Modified query for m2_magetan and any other database without subs_ahm, main_dealer, and perk_adm_wil
-        query = """
-        SELECT 
-            COUNT(*) as total_vehicles,
-            SUM(spk.harga_jual) as total_harga_jual,
-            SUM(IFNULL(dor.harga_ppn, 0)) as total_harga_tebus,
-            SUM(
-                spk.harga_jual - (
-                    IFNULL(dor.harga_ppn, 0) + 
-                    spk.diskon + 
-                    spk.nota_kredit + 
-                    spk.komisi_makelar +
-                    IFNULL(pl.dp_gross, 0) - 
-                    0 - /* Replace pl.subs_ahm with 0 */
-                    0 - /* Replace pl.main_dealer with 0 */
-                    IFNULL(mb.perk_notice, 0) +
-                    (spk.um_t_leasing - spk.uang_muka + spk.komisi_makelar_leasing) - 
-                    spk.promo_pusat
-                ) - 0 + spk.saving /* Replace spk.perk_adm_wil with 0 */
-            ) AS total_margin,
-            SUM(CASE WHEN (spk.cara_bayar IS NULL OR spk.cara_bayar != 'KREDIT') THEN 1 ELSE 0 END) as tunai_count,
-            SUM(CASE WHEN spk.cara_bayar = 'KREDIT' THEN 1 ELSE 0 END) as kredit_count,
-            SUM(CASE WHEN (spk.cara_bayar IS NULL OR spk.cara_bayar != 'KREDIT') THEN 
-                spk.harga_jual - (
-                    IFNULL(dor.harga_ppn, 0) + 
-                    spk.diskon + 
-                    spk.nota_kredit + 
-                    spk.komisi_makelar +
-                    IFNULL(pl.dp_gross, 0) - 
-                    0 - /* Replace pl.subs_ahm with 0 */
-                    0 - /* Replace pl.main_dealer with 0 */
-                    IFNULL(mb.perk_notice, 0) +
-                    (spk.um_t_leasing - spk.uang_muka + spk.komisi_makelar_leasing) - 
-                    spk.promo_pusat
-                ) - 0 + spk.saving /* Replace spk.perk_adm_wil with 0 */
-            ELSE 0 END) AS tunai_margin,
-            SUM(CASE WHEN spk.cara_bayar = 'KREDIT' THEN 
-                spk.harga_jual - (
-                    IFNULL(dor.harga_ppn, 0) + 
-                    spk.diskon + 
-                    spk.nota_kredit + 
-                    spk.komisi_makelar +
-                    IFNULL(pl.dp_gross, 0) - 
-                    0 - /* Replace pl.subs_ahm with 0 */
-                    0 - /* Replace pl.main_dealer with 0 */
-                    IFNULL(mb.perk_notice, 0) +
-                    (spk.um_t_leasing - spk.uang_muka + spk.komisi_makelar_leasing) - 
-                    spk.promo_pusat
-                ) - 0 + spk.saving /* Replace spk.perk_adm_wil with 0 */
-            ELSE 0 END) AS kredit_margin
-        FROM tbl_spk AS spk 
-        INNER JOIN tbl_bast AS bast 
-            ON bast.kode_spk = spk.kode_spk 
-        INNER JOIN vi_data_induk_barang_motor AS mb 
-            ON spk.kendaraan_warna_id = mb.data_id 
-        INNER JOIN tbl_data_induk_pelanggan AS mp 
-            ON spk.kode_pelanggan_faktur = mp.pelanggan_id 
-        LEFT JOIN tbl_sub_barang_masuk AS sbm 
-            ON bast.no_rangka = sbm.no_rangka
-        LEFT JOIN tbl_barang_masuk AS bm 
-            ON sbm.kode_bm = bm.kode_bm
-        LEFT JOIN vi_do_lengkap AS dor 
-            ON bm.no_do = dor.no_do 
-            AND mb.kode_warna_lengkap = dor.kode_barang_lengkap
-        LEFT JOIN tbl_penagihan_leasing pl 
-            ON pl.kode_bast = bast.kode_bast
-        WHERE DATE(bast.tgl_bast) BETWEEN %s AND %s
-        """
+    # Margin per unit from the shared template, so the three sums cannot drift apart
+    margin_sql = MARGIN_UNIT_SQL.get(database_name, MARGIN_UNIT_SQL["default"])
+    query = f"""
+    SELECT 
+        COUNT(*) as total_vehicles,
+        SUM(spk.harga_jual) as total_harga_jual,
+        SUM(IFNULL(dor.harga_ppn, 0)) as total_harga_tebus,
+        SUM({margin_sql}
+        ) AS total_margin,
+        SUM(CASE WHEN (spk.cara_bayar IS NULL OR spk.cara_bayar != 'KREDIT') THEN 1 ELSE 0 END) as tunai_count,
+        SUM(CASE WHEN spk.cara_bayar = 'KREDIT' THEN 1 ELSE 0 END) as kredit_count,
+        SUM(CASE WHEN (spk.cara_bayar IS NULL OR spk.cara_bayar != 'KREDIT') THEN {margin_sql}
+        ELSE 0 END) AS tunai_margin,
+        SUM(CASE WHEN spk.cara_bayar = 'KREDIT' THEN {margin_sql}
+        ELSE 0 END) AS kredit_margin
+    FROM tbl_spk AS spk 
+    INNER JOIN tbl_bast AS bast 
+        ON bast.kode_spk = spk.kode_spk 
+    LEFT JOIN vi_data_induk_barang_motor AS mb 
+        ON spk.kendaraan_warna_id = mb.data_id 
+    {cost_joins}
+    /* Range on the raw column so an index on tgl_bast can be used */
+    WHERE bast.tgl_bast >= %s AND bast.tgl_bast < DATE_ADD(%s, INTERVAL 1 DAY)
+    """
     
     try:
-        cursor.execute(query, (start_date, end_date))
-        result = cursor.fetchone()
+        # The range is bound three times: both derived tables of cost_joins, then the WHERE
+        result = execute_query(cursor, query, (start_date, end_date) * 3, database_name,
+                               f"margin summary {start_date}..{end_date}", fetch_one=True)
         
         if not result or result['total_vehicles'] == 0:
             return {
@@ -266,6 +146,181 @@ def get_margin_summary(start_date, end_date, database_name="honda_mis"):
         cursor.close()
         conn.close()
 
+def add_months(month_start, months):
+    """First day of the month `months` months after (or before, if negative) month_start."""
+    index = month_start.year * 12 + month_start.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def years_ago(day, years):
+    """The same date `years` years earlier; 29 February becomes 28 February in non-leap years."""
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+def trend_months():
+    """Months shown in the trend section, from TREND_MONTHS (default 12, at most 12, 0 turns it off)."""
+    return max(0, min(int(os.getenv("TREND_MONTHS", "12")), 12))
+
+def get_monthly_trend(report_date, database_name="honda_mis", months=12):
+    """
+    Units and margin per month for the last `months` months, with the same months a year earlier.
+
+    One GROUP BY YEAR, MONTH query covers both years. The report month runs up
+    to report_date and its last-year bucket up to the same day, like the
+    monthly cards.
+    
+    Args:
+        report_date (date): Last day of the trend
+        database_name (str): Database to connect to
+        months (int): Number of months, at most 12 so the two years do not overlap
+    
+    Returns:
+        list: {'year', 'month', 'units', 'margin', 'last_year_units', 'last_year_margin'} per month, oldest first
+    """
+    month_start = report_date.replace(day=1)
+    first_month = add_months(month_start, 1 - months)
+    last_year = years_ago(report_date, 1)
+    # Both years in one range; the rest of the report month last year is left out
+    bast_filter = ("bast.tgl_bast >= %s AND bast.tgl_bast < DATE_ADD(%s, INTERVAL 1 DAY)"
+                   " AND NOT (bast.tgl_bast >= DATE_ADD(%s, INTERVAL 1 DAY) AND bast.tgl_bast < %s)")
+    cost_joins = unit_cost_joins(database_name, bast_filter)
+    
+    query = f"""
+        SELECT 
+            YEAR(bast.tgl_bast) AS tahun,
+            MONTH(bast.tgl_bast) AS bulan,
+            COUNT(*) AS total_vehicles,
+            SUM({MARGIN_UNIT_SQL.get(database_name, MARGIN_UNIT_SQL["default"])}
+            ) AS total_margin
+        FROM tbl_spk AS spk 
+        INNER JOIN tbl_bast AS bast 
+            ON bast.kode_spk = spk.kode_spk 
+        LEFT JOIN vi_data_induk_barang_motor AS mb 
+            ON spk.kendaraan_warna_id = mb.data_id 
+        {cost_joins}
+        WHERE {bast_filter}
+        GROUP BY YEAR(bast.tgl_bast), MONTH(bast.tgl_bast)
+        """
+    params = (
+        add_months(first_month, -12).strftime('%Y-%m-%d'),
+        report_date.strftime('%Y-%m-%d'),
+        last_year.strftime('%Y-%m-%d'),
+        add_months(month_start, -11).strftime('%Y-%m-%d'),
+    ) * 3  # both derived tables of cost_joins, then the WHERE
+    
+    conn = connect_to_database(database_name)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        rows = execute_query(cursor, query, params, database_name,
+                             f"monthly trend {params[0]}..{params[1]}")
+    except mysql.connector.Error as err:
+        print(f"Database error in get_monthly_trend: {err}")
+        return []
+    finally:
+        cursor.close()
+        conn.close()
+    
+    buckets = {(row['tahun'], row['bulan']): row for row in rows}
+    empty = {'total_vehicles': 0, 'total_margin': 0}
+    trend = []
+    for i in range(months):
+        month = add_months(first_month, i)
+        current = buckets.get((month.year, month.month), empty)
+        previous = buckets.get((month.year - 1, month.month), empty)
+        trend.append({
+            'year': month.year,
+            'month': month.month,
+            'units': current['total_vehicles'],
+            'margin': float(current['total_margin'] or 0),
+            'last_year_units': previous['total_vehicles'],
+            'last_year_margin': float(previous['total_margin'] or 0),
+        })
+    return trend
+
+def comparison_years():
+    """Earlier years in the comparison table, from COMPARISON_YEARS (default 3, 0 turns it off)."""
+    return max(0, int(os.getenv("COMPARISON_YEARS", "3")))
+
+def get_year_comparison(report_date, database_name="honda_mis", years=3):
+    """
+    Same-day, month-to-date and year-to-date units and margin for this year and `years` earlier years.
+
+    One query covers the year-to-date window of every year, each ending on
+    that year's report day, grouped by YEAR. The MTD and same-day figures are
+    conditional sums inside those windows, so no window is read twice.
+    
+    Args:
+        report_date (date): Report day of the current year
+        database_name (str): Database to connect to
+        years (int): Number of earlier years
+    
+    Returns:
+        list: {'year', 'day_units', 'day_margin', 'mtd_units', 'mtd_margin', 'ytd_units', 'ytd_margin'}
+              per year, current year first
+    """
+    ends = [years_ago(report_date, back) for back in range(years + 1)]
+    margin_sql = MARGIN_UNIT_SQL.get(database_name, MARGIN_UNIT_SQL["default"])
+    windows = " OR ".join(["(bast.tgl_bast >= %s AND bast.tgl_bast < DATE_ADD(%s, INTERVAL 1 DAY))"] * len(ends))
+    days = ", ".join(["%s"] * len(ends))
+    cost_joins = unit_cost_joins(database_name, f"({windows})")
+    
+    query = f"""
+        SELECT 
+            YEAR(bast.tgl_bast) AS tahun,
+            SUM(CASE WHEN DATE(bast.tgl_bast) IN ({days}) THEN 1 ELSE 0 END) AS day_units,
+            SUM(CASE WHEN DATE(bast.tgl_bast) IN ({days}) THEN {margin_sql}
+                ELSE 0 END) AS day_margin,
+            SUM(CASE WHEN MONTH(bast.tgl_bast) = %s THEN 1 ELSE 0 END) AS mtd_units,
+            SUM(CASE WHEN MONTH(bast.tgl_bast) = %s THEN {margin_sql}
+                ELSE 0 END) AS mtd_margin,
+            COUNT(*) AS ytd_units,
+            SUM({margin_sql}
+            ) AS ytd_margin
+        FROM tbl_spk AS spk 
+        INNER JOIN tbl_bast AS bast 
+            ON bast.kode_spk = spk.kode_spk 
+        LEFT JOIN vi_data_induk_barang_motor AS mb 
+            ON spk.kendaraan_warna_id = mb.data_id 
+        {cost_joins}
+        /* 1 January to the report day of every year; each window ends in the report month */
+        WHERE {windows}
+        GROUP BY YEAR(bast.tgl_bast)
+        """
+    day_params = [end.strftime('%Y-%m-%d') for end in ends]
+    window_params = ()
+    for end in ends:
+        window_params += (end.replace(month=1, day=1).strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))
+    # Windows bound three times: both derived tables of cost_joins, then the WHERE
+    params = (*day_params, *day_params, report_date.month, report_date.month) + window_params * 3
+    
+    conn = connect_to_database(database_name)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        rows = execute_query(cursor, query, params, database_name,
+                             f"year comparison {ends[-1].year}..{report_date.isoformat()}")
+    except mysql.connector.Error as err:
+        print(f"Database error in get_year_comparison: {err}")
+        return []
+    finally:
+        cursor.close()
+        conn.close()
+    
+    by_year = {row['tahun']: row for row in rows}
+    comparison = []
+    for end in ends:
+        row = by_year.get(end.year, {})
+        comparison.append({
+            'year': end.year,
+            'day_units': int(row.get('day_units') or 0),
+            'day_margin': float(row.get('day_margin') or 0),
+            'mtd_units': int(row.get('mtd_units') or 0),
+            'mtd_margin': float(row.get('mtd_margin') or 0),
+            'ytd_units': int(row.get('ytd_units') or 0),
+            'ytd_margin': float(row.get('ytd_margin') or 0),
+        })
+    return comparison
+
 def calculate_margin_changes(current_margin, last_period_margin):
     """Calculate margin changes between current and last period."""
     if not current_margin or not last_period_margin:
@@ -363,15 +418,16 @@ def calculate_mom_changes(current_data, last_month_data):
 def create_html_report(daily_data, weekly_data, monthly_data, 
                       daily_yoy, weekly_yoy, monthly_yoy, location_name, report_date=None, 
                       daily_mom=None, monthly_mom=None, daily_margin=None, monthly_margin=None,
-                      daily_margin_yoy=None, daily_margin_mom=None, monthly_margin_yoy=None, monthly_margin_mom=None):
+                      daily_margin_yoy=None, daily_margin_mom=None, monthly_margin_yoy=None, monthly_margin_mom=None,
+                      trend=None):
     """Create HTML formatted report showing daily and monthly data with YoY comparison and payment methods.
     
     Args:
         daily_data: Data for the specific day
-        weekly_data: Data for the week (not used)
+        weekly_data: Data for the week to date (get_vehicle_data() shape), adds the weekly card
         monthly_data: Data for the month
         daily_yoy: Year-over-year comparison for the day
-        weekly_yoy: Year-over-year comparison for the week (not used)
+        weekly_yoy: Comparison with the same week last year
         monthly_yoy: Year-over-year comparison for the month
         location_name: Name of the location (e.g., "M2 Madiun" or "M2 Magetan")
         report_date: Specific date for the report (default: current date)
@@ -383,480 +439,243 @@ def create_html_report(daily_data, weekly_data, monthly_data,
         daily_margin_mom: Day-over-month comparison for the day's margin
         monthly_margin_yoy: Year-over-year comparison for the month's margin
         monthly_margin_mom: Month-over-month comparison for the month's margin
+        trend: Monthly buckets from get_monthly_trend(), shown as the trend section
     """
     # Use the specified report date or today's date
-    today = report_date if report_date else datetime.now().date()
-    month_start = today.replace(day=1)
-    last_year = today.replace(year=today.year - 1)
-    last_year_month_start = month_start.replace(year=month_start.year - 1)
-    
-    # Calculate last month's same date
-    last_month = today.replace(day=1) - timedelta(days=1)
-    last_month = last_month.replace(day=min(today.day, last_month.day))
-    
-    current_time = datetime.now().strftime("%H:%M:%S")
-    
-    html = f"""
-    <!DOCTYPE html>
+    today = report_date if report_date else db_fixtures.now().date()
+    report = build_vehicle_report(
+        None, location_name, today, db_fixtures.now(),
+        daily_data, monthly_data, daily_yoy, monthly_yoy, daily_mom, monthly_mom,
+        daily_margin, monthly_margin, daily_margin_yoy, daily_margin_mom, monthly_margin_yoy, monthly_margin_mom,
+        trend=trend, weekly_data=weekly_data, weekly_yoy=weekly_yoy,
+    )
+    return report_renderers.vehicle_html(report)
+
+def send_email(subject, body, recipients, plain_text=None, report=None):
+    """
+    Send email to specified recipients, or queue it when the outbox is enabled.
+
+    Returns:
+        str or None: outbox.SENT, PARTIAL or QUEUED (see outbox.dispatch()), None if sending failed
+    """
+    message = build_message(subject, body, recipients, plain_text=plain_text)
+
+    try:
+        result = dispatch(message, report=report)
+        if result == SENT:
+            print(f"Email berhasil dikirim ke {', '.join(recipients)}")
+        return result
+    except Exception as e:
+        print(f"Error mengirim email: {e}")
+        return None
+
+def create_no_change_notice(location_name, report_date, last_delivered):
+    """Short email sent instead of the full report when the numbers have not changed."""
+    sent_at = datetime.fromtimestamp(last_delivered).strftime('%H:%M')
+    return f"""
     <html>
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <style>
-            @media only screen and (max-width: 600px) {{
-                .container {{
-                    width: 100% !important;
-                    padding: 8px !important;
-                }}
-                .card {{
-                    margin: 6px 0 !important;
-                }}
-                .stats-row {{
-                    grid-template-columns: 1fr !important;
-                    gap: 8px !important;
-                }}
-                .comparison-row {{
-                    grid-template-columns: 1fr !important;
-                    gap: 6px !important;
-                }}
-                .payment-row {{
-                    grid-template-columns: 1fr 1fr !important;
-                    gap: 8px !important;
-                }}
-            }}
-            body {{
-                margin: 0;
-                padding: 0;
-                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Helvetica, Arial, sans-serif;
-                background-color: #f5f5f5;
-                color: #333;
-                line-height: 1.3;
-            }}
-            .container {{
-                max-width: 650px;
-                margin: 0 auto;
-                padding: 10px;
-                background-color: #ffffff;
-            }}
-            .header {{
-                text-align: center;
-                padding: 15px 0;
-                background: linear-gradient(135deg, #e70000, #c60000);
-                color: white;
-                border-radius: 10px 10px 0 0;
-                box-shadow: 0 3px 6px rgba(0,0,0,0.15);
-            }}
-            .header h1 {{
-                margin: 0;
-                font-size: 22px;
-                font-weight: 700;
-            }}
-            .date-range {{
-                font-size: 14px;
-                color: #ffffff;
-                opacity: 0.95;
-                margin-top: 5px;
-            }}
-            .card {{
-                background: white;
-                border-radius: 10px;
-                box-shadow: 0 3px 8px rgba(0,0,0,0.1);
-                margin: 10px 0;
-                overflow: hidden;
-                border: 1px solid #ddd;
-            }}
-            .card-header.do-section {{
-                background: linear-gradient(135deg, #1976d2, #1565c0);
-                color: white;
-                padding: 12px 15px;
-            }}
-            .card-header.margin-section {{
-                background: linear-gradient(135deg, #388e3c, #2e7d32);
-                color: white;
-                padding: 12px 15px;
-            }}
-            .card-title {{
-                margin: 0;
-                font-size: 18px;
-                font-weight: 600;
-            }}
-            .card-body {{
-                padding: 15px;
-            }}
-            .stats-row {{
-                display: table;
-                width: 100%;
-                margin-bottom: 15px;
-            }}
-            .stat-box {{
-                display: table-cell;
-                width: 50%;
-                text-align: center;
-                padding: 15px 10px;
-                background: linear-gradient(135deg, #f8f9fa, #e9ecef);
-                border-radius: 8px;
-                border: 1px solid #dee2e6;
-                vertical-align: top;
-            }}
-            .stat-box:first-child {{
-                margin-right: 6px;
-            }}
-            .stat-box:last-child {{
-                margin-left: 6px;
-            }}
-            .stat-value {{
-                font-size: 20px;
-                font-weight: bold;
-                color: #333;
-                margin-bottom: 5px;
-            }}
-            .stat-label {{
-                font-size: 14px;
-                color: #666;
-                font-weight: 500;
-            }}
-            .payment-row {{
-                display: table;
-                width: 100%;
-                margin-bottom: 15px;
-            }}
-            .payment-box {{
-                display: table-cell;
-                width: 50%;
-                text-align: center;
-                padding: 12px;
-                background: #fff;
-                border-radius: 8px;
-                border: 2px solid #e9ecef;
-                vertical-align: top;
-            }}
-            .payment-box:first-child {{
-                margin-right: 6px;
-            }}
-            .payment-box:last-child {{
-                margin-left: 6px;
-            }}
-            .payment-count {{
-                font-size: 18px;
-                font-weight: bold;
-                color: #333;
-                margin-bottom: 4px;
-            }}
-            .payment-value {{
-                font-size: 14px;
-                color: #333;
-                font-weight: 500;
-                margin-bottom: 4px;
-            }}
-            .payment-label {{
-                font-size: 13px;
-                color: #666;
-                font-weight: 500;
-            }}
-            .comparison-row {{
-                display: table;
-                width: 100%;
-                margin-top: 15px;
-            }}
-            .comparison-box {{
-                display: table-cell;
-                width: 50%;
-                background: #f8f9fa;
-                padding: 12px;
-                border-radius: 8px;
-                border: 1px solid #e9ecef;
-                vertical-align: top;
-                text-align: center;
-            }}
-            .comparison-box:first-child {{
-                margin-right: 6px;
-            }}
-            .comparison-box:last-child {{
-                margin-left: 6px;
-            }}
-            .comparison-title {{
-                font-size: 14px;
-                color: #333;
-                margin-bottom: 6px;
-                font-weight: 600;
-            }}
-            .comparison-content {{
-                font-size: 12px;
-                color: #666;
-                margin-bottom: 4px;
-            }}
-            .comparison-change {{
-                font-size: 13px;
-                color: #28a745;
-                font-weight: 600;
-            }}
-            .comparison-change.negative {{
-                color: #dc3545;
-            }}
-            .footer {{
-                text-align: center;
-                padding: 12px;
-                color: #666;
-                font-size: 12px;
-                border-top: 1px solid #ddd;
-                background: #f8f9fa;
-                border-radius: 0 0 10px 10px;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>{location_name}</h1>
-                <div class="date-range">{format_date(today)}</div>
-            </div>
-            
-            <div class="card">
-                <div class="card-header do-section">
-                    <h2 class="card-title">📊 Penjualan Hari Ini</h2>
-                </div>
-                <div class="card-body">
-                    <div class="stats-row">
-                        <div class="stat-box">
-                            <div class="stat-value">{daily_data['summary']['total_units']}</div>
-                            <div class="stat-label">Unit Terjual</div>
-                        </div>
-                        <div class="stat-box">
-                            <div class="stat-value">{format_currency(daily_data['summary']['total_value'])}</div>
-                            <div class="stat-label">Total Harga Beli</div>
-                        </div>
-                    </div>
-                    
-                    <div class="payment-row">
-                        <div class="payment-box">
-                            <div class="payment-count">{daily_data['summary']['payment_methods']['tunai']['count']} Unit</div>
-                            <div class="payment-value">Margin: {format_currency(daily_data['summary']['payment_methods']['tunai']['margin'])}</div>
-                            <div class="payment-label">💰 Tunai</div>
-                        </div>
-                        <div class="payment-box">
-                            <div class="payment-count">{daily_data['summary']['payment_methods']['kredit']['count']} Unit</div>
-                            <div class="payment-value">Margin: {format_currency(daily_data['summary']['payment_methods']['kredit']['margin'])}</div>
-                            <div class="payment-label">💳 Kredit</div>
-                        </div>
-                    </div>
-                    
-                    <div class="comparison-row">
-                        <div class="comparison-box">
-                            <div class="comparison-title">📈 vs Tahun Lalu</div>
-                            <div class="comparison-content">
-                                {daily_yoy['last_year_units']} Unit (Harga Beli: {format_currency(daily_yoy['last_year_value'])})
-                            </div>
-                            <div class="comparison-change {'' if daily_yoy['unit_change'] >= 0 else 'negative'}">
-                                {daily_yoy['unit_change']:+d} Unit ({format_percentage(daily_yoy['unit_change_pct'])})
-                            </div>
-                        </div>
-                        <div class="comparison-box">
-                            <div class="comparison-title">📅 vs Bulan Lalu</div>
-                            <div class="comparison-content">
-                                {daily_mom['last_month_units']} Unit (Harga Beli: {format_currency(daily_mom['last_month_value'])})
-                            </div>
-                            <div class="comparison-change {'' if daily_mom['unit_change'] >= 0 else 'negative'}">
-                                {daily_mom['unit_change']:+d} Unit ({format_percentage(daily_mom['unit_change_pct'])})
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-            
-            <div class="card">
-                <div class="card-header do-section">
-                    <h2 class="card-title">📊 Penjualan Bulan Ini</h2>
-                </div>
-                <div class="card-body">
-                    <div class="stats-row">
-                        <div class="stat-box">
-                            <div class="stat-value">{monthly_data['summary']['total_units']}</div>
-                            <div class="stat-label">Unit Terjual</div>
-                        </div>
-                        <div class="stat-box">
-                            <div class="stat-value">{format_currency(monthly_data['summary']['total_value'])}</div>
-                            <div class="stat-label">Total Harga Beli</div>
-                        </div>
-                    </div>
-                    
-                    <div class="payment-row">
-                        <div class="payment-box">
-                            <div class="payment-count">{monthly_data['summary']['payment_methods']['tunai']['count']} Unit</div>
-                            <div class="payment-value">Margin: {format_currency(monthly_data['summary']['payment_methods']['tunai']['margin'])}</div>
-                            <div class="payment-label">💰 Tunai</div>
-                        </div>
-                        <div class="payment-box">
-                            <div class="payment-count">{monthly_data['summary']['payment_methods']['kredit']['count']} Unit</div>
-                            <div class="payment-value">Margin: {format_currency(monthly_data['summary']['payment_methods']['kredit']['margin'])}</div>
-                            <div class="payment-label">💳 Kredit</div>
-                        </div>
-                    </div>
-                    
-                    <div class="comparison-row">
-                        <div class="comparison-box">
-                            <div class="comparison-title">📈 vs Tahun Lalu</div>
-                            <div class="comparison-content">
-                                {monthly_yoy['last_year_units']} Unit (Harga Beli: {format_currency(monthly_yoy['last_year_value'])})
-                            </div>
-                            <div class="comparison-change {'' if monthly_yoy['unit_change'] >= 0 else 'negative'}">
-                                {monthly_yoy['unit_change']:+d} Unit ({format_percentage(monthly_yoy['unit_change_pct'])})
-                            </div>
-                        </div>
-                        <div class="comparison-box">
-                            <div class="comparison-title">📅 vs Bulan Lalu</div>
-                            <div class="comparison-content">
-                                {monthly_mom['last_month_units']} Unit (Harga Beli: {format_currency(monthly_mom['last_month_value'])})
-                            </div>
-                            <div class="comparison-change {'' if monthly_mom['unit_change'] >= 0 else 'negative'}">
-                                {monthly_mom['unit_change']:+d} Unit ({format_percentage(monthly_mom['unit_change_pct'])})
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-            
-            {f'''
-            <div class="card">
-                <div class="card-header margin-section">
-                    <h2 class="card-title">💰 Keuntungan Hari Ini</h2>
-                </div>
-                <div class="card-body">
-                    <div class="stats-row">
-                        <div class="stat-box">
-                            <div class="stat-value">{daily_margin['total_vehicles']}</div>
-                            <div class="stat-label">Unit Terjual</div>
-                        </div>
-                        <div class="stat-box">
-                            <div class="stat-value">{format_currency(daily_margin['total_margin'])}</div>
-                            <div class="stat-label">Total Keuntungan</div>
-                        </div>
-                    </div>
-                    
-                    <div class="payment-row">
-                        <div class="payment-box">
-                            <div class="payment-count">{daily_margin['tunai_count']} Unit</div>
-                            <div class="payment-value">{format_currency(daily_margin['tunai_margin'])}</div>
-                            <div class="payment-label">💰 Keuntungan Tunai</div>
-                        </div>
-                        <div class="payment-box">
-                            <div class="payment-count">{daily_margin['kredit_count']} Unit</div>
-                            <div class="payment-value">{format_currency(daily_margin['kredit_margin'])}</div>
-                            <div class="payment-label">💳 Keuntungan Kredit</div>
-                        </div>
-                    </div>
-                    
-                    <div class="comparison-row">
-                        <div class="comparison-box">
-                            <div class="comparison-title">📈 vs Tahun Lalu</div>
-                            <div class="comparison-content">
-                                {daily_margin_yoy['last_period_vehicles']} Unit (Keuntungan: {format_currency(daily_margin_yoy['last_period_margin'])})
-                            </div>
-                            <div class="comparison-change {'' if daily_margin_yoy['margin_change'] >= 0 else 'negative'}">
-                                {format_currency(daily_margin_yoy['margin_change'])} ({format_percentage(daily_margin_yoy['margin_change_pct'])})
-                            </div>
-                        </div>
-                        <div class="comparison-box">
-                            <div class="comparison-title">📅 vs Bulan Lalu</div>
-                            <div class="comparison-content">
-                                {daily_margin_mom['last_period_vehicles']} Unit (Keuntungan: {format_currency(daily_margin_mom['last_period_margin'])})
-                            </div>
-                            <div class="comparison-change {'' if daily_margin_mom['margin_change'] >= 0 else 'negative'}">
-                                {format_currency(daily_margin_mom['margin_change'])} ({format_percentage(daily_margin_mom['margin_change_pct'])})
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-            
-            <div class="card">
-                <div class="card-header margin-section">
-                    <h2 class="card-title">💰 Keuntungan Bulan Ini</h2>
-                </div>
-                <div class="card-body">
-                    <div class="stats-row">
-                        <div class="stat-box">
-                            <div class="stat-value">{monthly_margin['total_vehicles']}</div>
-                            <div class="stat-label">Unit Terjual</div>
-                        </div>
-                        <div class="stat-box">
-                            <div class="stat-value">{format_currency(monthly_margin['total_margin'])}</div>
-                            <div class="stat-label">Total Keuntungan</div>
-                        </div>
-                    </div>
-                    
-                    <div class="payment-row">
-                        <div class="payment-box">
-                            <div class="payment-count">{monthly_margin['tunai_count']} Unit</div>
-                            <div class="payment-value">{format_currency(monthly_margin['tunai_margin'])}</div>
-                            <div class="payment-label">💰 Keuntungan Tunai</div>
-                        </div>
-                        <div class="payment-box">
-                            <div class="payment-count">{monthly_margin['kredit_count']} Unit</div>
-                            <div class="payment-value">{format_currency(monthly_margin['kredit_margin'])}</div>
-                            <div class="payment-label">💳 Keuntungan Kredit</div>
-                        </div>
-                    </div>
-                    
-                    <div class="comparison-row">
-                        <div class="comparison-box">
-                            <div class="comparison-title">📈 vs Tahun Lalu</div>
-                            <div class="comparison-content">
-                                {monthly_margin_yoy['last_period_vehicles']} Unit (Keuntungan: {format_currency(monthly_margin_yoy['last_period_margin'])})
-                            </div>
-                            <div class="comparison-change {'' if monthly_margin_yoy['margin_change'] >= 0 else 'negative'}">
-                                {format_currency(monthly_margin_yoy['margin_change'])} ({format_percentage(monthly_margin_yoy['margin_change_pct'])})
-                            </div>
-                        </div>
-                        <div class="comparison-box">
-                            <div class="comparison-title">📅 vs Bulan Lalu</div>
-                            <div class="comparison-content">
-                                {monthly_margin_mom['last_period_vehicles']} Unit (Keuntungan: {format_currency(monthly_margin_mom['last_period_margin'])})
-                            </div>
-                            <div class="comparison-change {'' if monthly_margin_mom['margin_change'] >= 0 else 'negative'}">
-                                {format_currency(monthly_margin_mom['margin_change'])} ({format_percentage(monthly_margin_mom['margin_change_pct'])})
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-            ''' if daily_margin and monthly_margin else ''}
-            
-            <div class="footer">
-                <p>Laporan dibuat otomatis pada {current_time}</p>
-            </div>
-        </div>
+    <body style="font-family: Arial, sans-serif; color: #333;">
+        <p>Tidak ada perubahan data penjualan {location_name} untuk tanggal {format_date(report_date)}
+        sejak laporan yang dikirim pukul {sent_at}.</p>
     </body>
     </html>
     """
-    
-    return html
 
-def send_email(subject, body, recipients):
-    """Send email to specified recipients."""
-    smtp_server = os.getenv("SMTP_SERVER")
-    smtp_port = int(os.getenv("SMTP_PORT"))
-    sender_email = os.getenv("SENDER_EMAIL")
-    app_password = os.getenv("SENDER_PASSWORD")
+# Aggregates fetched per location; the group report merges these instead of querying again
+SALES_KEYS = (
+    'daily', 'daily_last_year', 'daily_last_month',
+    'monthly', 'monthly_last_month', 'monthly_last_year',
+)
+# Sliced from the monthly windows, no queries of their own
+WEEKLY_KEYS = ('weekly', 'weekly_last_week', 'weekly_last_year')
+MARGIN_KEYS = (
+    'daily_margin', 'daily_margin_last_year', 'daily_margin_last_month',
+    'monthly_margin', 'monthly_margin_last_month', 'monthly_margin_last_year',
+)
+AGGREGATE_KEYS = SALES_KEYS + WEEKLY_KEYS + MARGIN_KEYS
 
-    message = MIMEMultipart("alternative")
-    message["From"] = sender_email
-    message["Subject"] = subject
-    message["To"] = ", ".join(recipients)
-    
-    message.attach(MIMEText(body, "html"))
+WEEK_STARTS = {'monday': 0, 'sunday': 6}
 
-    try:
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(sender_email, app_password)
-            server.send_message(message)
-        print(f"Email berhasil dikirim ke {', '.join(recipients)}")
+GROUP_DATABASE = "group"
+GROUP_LOCATION = "M2 Group"
+
+def week_start(day):
+    """First day of the week containing day; WEEK_START selects monday (default) or sunday."""
+    first_weekday = WEEK_STARTS.get(os.getenv("WEEK_START", "monday").lower(), 0)
+    return day - timedelta(days=(day.weekday() - first_weekday) % 7)
+
+def fetch_location_aggregates(db_name, today):
+    """
+    Fetch every sales and margin aggregate one location report needs.
+
+    The month-to-date windows are widened to also cover this week, last week
+    and the same week last year (52 weeks back, so weekdays line up); the
+    weekly figures are then sliced from their per-day rows.
+
+    Returns:
+        dict: get_vehicle_data() / get_margin_summary() results keyed by AGGREGATE_KEYS,
+              plus 'trend', 'years' and the SPK 'pipeline' with its SPVs resolved to people
+    """
+    empty = {'summary': {'total_units': 0, 'total_value': 0}}
+    last_year = years_ago(today, 1)
+    last_month = today.replace(day=1) - timedelta(days=1)
+    last_month = last_month.replace(day=min(today.day, last_month.day))
+    month_start = today.replace(day=1)
+    last_month_start = last_month.replace(day=1)
+    last_year_month_start = years_ago(month_start, 1)
+
+    this_week = week_start(today)
+    last_week, last_week_end = this_week - timedelta(weeks=1), today - timedelta(weeks=1)
+    last_year_week, last_year_week_end = this_week - timedelta(weeks=52), today - timedelta(weeks=52)
+
+    # (start, end) of each period, in SALES_KEYS / MARGIN_KEYS order
+    periods = [
+        (today, today),                          # today
+        (last_year, last_year),                  # same date last year
+        (last_month, last_month),                # same date last month
+        (month_start, today),                    # this month to date
+        (last_month_start, last_month),          # last month to the same day
+        (last_year_month_start, last_year),      # this month last year to the same day
+    ]
+    # Sales windows actually queried: the monthly ones also span the weeks
+    windows = list(periods)
+    windows[3] = (min(month_start, last_week), today)
+    windows[5] = (min(last_year_month_start, last_year_week), max(last_year, last_year_week_end))
+
+    fetched = {}
+    for key, (start, end) in zip(SALES_KEYS, windows):
+        fetched[key] = get_vehicle_data(
+            start_date=start.strftime('%Y-%m-%d'),
+            end_date=end.strftime('%Y-%m-%d'),
+            database_name=db_name
+        ) or empty
+
+    aggregates = dict(fetched)
+    aggregates['monthly'] = slice_vehicle_data(fetched['monthly'], month_start, today)
+    aggregates['monthly_last_year'] = slice_vehicle_data(fetched['monthly_last_year'], last_year_month_start, last_year)
+    aggregates['weekly'] = slice_vehicle_data(fetched['monthly'], this_week, today)
+    aggregates['weekly_last_week'] = slice_vehicle_data(fetched['monthly'], last_week, last_week_end)
+    aggregates['weekly_last_year'] = slice_vehicle_data(fetched['monthly_last_year'], last_year_week, last_year_week_end)
+
+    for key, (start, end) in zip(MARGIN_KEYS, periods):
+        aggregates[key] = get_margin_summary(start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'), db_name)
+    months = trend_months()
+    aggregates['trend'] = get_monthly_trend(today, db_name, months) if months else []
+    years = comparison_years()
+    aggregates['years'] = get_year_comparison(today, db_name, years) if years else []
+    # SPV NIKs are resolved to people here, so the group report merges already resolved rows
+    pipeline = get_spk_pipeline(today, db_name)
+    if pipeline:
+        identities = load_identity_map()
+        pipeline = merge_spk_pipelines([pipeline], identities)
+        identities.save()
+    aggregates['pipeline'] = pipeline
+    return aggregates
+
+def merge_location_aggregates(location_aggregates):
+    """Sum the aggregates of several locations, period by period, without any query."""
+    merged = {
+        key: (merge_margin_summaries if 'margin' in key else merge_vehicle_data)(
+            [aggregates[key] for aggregates in location_aggregates])
+        for key in AGGREGATE_KEYS
+    }
+    merged['trend'] = merge_trends([aggregates.get('trend', []) for aggregates in location_aggregates])
+    merged['years'] = merge_year_comparisons([aggregates.get('years', []) for aggregates in location_aggregates])
+    pipelines = [aggregates['pipeline'] for aggregates in location_aggregates if aggregates.get('pipeline')]
+    merged['pipeline'] = merge_spk_pipelines(pipelines, load_identity_map()) if pipelines else None
+    return merged
+
+def build_report_from_aggregates(db_name, location_name, today, aggregates):
+    """Compute the YoY/MoM comparisons and build the report model."""
+    a = aggregates
+    return build_vehicle_report(
+        db_name, location_name, today, db_fixtures.now(),
+        a['daily'], a['monthly'],
+        calculate_yoy_changes(a['daily'], a['daily_last_year']),
+        calculate_yoy_changes(a['monthly'], a['monthly_last_year']),
+        calculate_mom_changes(a['daily'], a['daily_last_month']),
+        calculate_mom_changes(a['monthly'], a['monthly_last_month']),
+        a['daily_margin'], a['monthly_margin'],
+        calculate_margin_changes(a['daily_margin'], a['daily_margin_last_year']),
+        calculate_margin_changes(a['daily_margin'], a['daily_margin_last_month']),
+        calculate_margin_changes(a['monthly_margin'], a['monthly_margin_last_year']),
+        calculate_margin_changes(a['monthly_margin'], a['monthly_margin_last_month']),
+        trend=a.get('trend'),
+        weekly_data=a.get('weekly'),
+        weekly_yoy=calculate_yoy_changes(a.get('weekly'), a.get('weekly_last_year')),
+        weekly_wow=calculate_mom_changes(a.get('weekly'), a.get('weekly_last_week')),
+        years=a.get('years'),
+        pipeline=a.get('pipeline'),
+    )
+
+def deliver_vehicle_report(report, recipients, force=False):
+    """
+    Render and send one vehicle report, or skip it when nothing changed.
+
+    Args:
+        report (VehicleReport): Model built by build_report_from_aggregates()
+        recipients (list): Email addresses
+        force (bool): Send the full report even if it matches the last delivered one
+
+    Returns:
+        bool: True if the report was sent, queued, skipped or replaced by a notice;
+        False if sending failed for any recipient
+    """
+    db_name, location_name, today = report.database, report.location, report.report_date
+
+    # Skip the render and send when the numbers match the last delivered report
+    report_key = f"{db_name}|{today.isoformat()}"
+    if report_history.handled_in_slot(report_key):
+        print(f"Laporan {location_name} sudah dikirim pada percobaan sebelumnya di jadwal ini")
         return True
-    except Exception as e:
-        print(f"Error mengirim email: {e}")
-        return False
+    report_fingerprint = report_history.fingerprint(asdict(replace(report, generated_at=None)))
+    unchanged_mode = report_history.unchanged_mode()
+    if not force and unchanged_mode != "send" and report_history.is_unchanged(report_key, report_fingerprint):
+        decision = "skipped"
+        if unchanged_mode == "notice":
+            last = report_history.last_delivered(report_key)
+            sent = send_email(
+                f"M2 | {location_name} today: tidak ada perubahan",
+                create_no_change_notice(location_name, today, last['delivered']),
+                recipients
+            )
+            decision = "notice" if sent in (SENT, QUEUED) else "failed"
+        report_history.record_decision("vehicle_reporting", report_key, report_fingerprint,
+                                       decision, location=location_name)
+        print(f"Laporan {location_name} tidak berubah sejak pengiriman terakhir ({decision})")
+        return decision != "failed"
+
+    with track("render", detail="vehicle_html") as record:
+        html_report = report_renderers.vehicle_html(report)
+        record['bytes'] = len(html_report.encode('utf-8'))
+    html_report = optimize_html(html_report, f"vehicle_reporting {db_name}")
+    report_renderers.export(report, f"{db_name}_{today.isoformat()}")
+    daily_sales, daily_margin = report.card('sales', 'daily'), report.card('margin', 'daily')
+    # The outcome goes to report_history from outbox.dispatch(), or from the outbox sender
+    # once a queued report has actually gone out
+    result = send_email(
+        f"M2 | {location_name} today, DO: {daily_sales.units}, Margin: {format_currency(daily_margin.amount if daily_margin else 0)}",
+        html_report,
+        recipients,
+        plain_text=report_renderers.vehicle_text(report),
+        report={'job': "vehicle_reporting", 'key': report_key, 'fingerprint': report_fingerprint,
+                'location': location_name},
+    )
+    if result == SENT:
+        print(f"Laporan {location_name} untuk tanggal {format_date(today)} berhasil dikirim")
+    elif result == QUEUED:
+        print(f"Laporan {location_name} untuk tanggal {format_date(today)} masuk antrian outbox")
+    elif result == PARTIAL:
+        print(f"Laporan {location_name} untuk tanggal {format_date(today)} tidak terkirim ke semua penerima")
+    else:
+        print(f"Laporan {location_name} untuk tanggal {format_date(today)} gagal dikirim")
+    return result in (SENT, QUEUED)
+
+def get_recipients():
+    recipients_str = os.getenv("EMAIL_RECIPIENTS", "")
+    return [email.strip() for email in recipients_str.split(",") if email.strip()]
 
-def process_location_data(db_name, location_name, specific_date=None):
+def process_location_data(db_name, location_name, specific_date=None, force=False, collected=None):
     """
     Process data for a specific location (database) and generate a report.
     
@@ -864,174 +683,82 @@ def process_location_data(db_name, location_name, specific_date=None):
         db_name (str): Database name to use
         location_name (str): Name of the location for the report title
         specific_date (date, optional): Specific date for the report. Defaults to None (current date).
+        force (bool): Send the full report even if it matches the last delivered one
+        collected (dict, optional): Receives the fetched aggregates under db_name, for the group report
     """
-    # Get recipients from environment variables
-    recipients_str = os.getenv("EMAIL_RECIPIENTS", "")
-    recipients = [email.strip() for email in recipients_str.split(",") if email.strip()]
-    
     try:
         # Use the provided date or today's date
-        today = specific_date if specific_date else datetime.now().date()
+        today = specific_date if specific_date else db_fixtures.now().date()
         print(f"Mengambil data untuk {location_name} tanggal {format_date(today)}")
         
-        # Get today's data and last year comparison
-        daily_data = get_vehicle_data(
-            start_date=today.strftime('%Y-%m-%d'),
-            end_date=today.strftime('%Y-%m-%d'),
-            database_name=db_name
-        ) or {'summary': {'total_units': 0, 'total_value': 0}}
-
-        last_year = today.replace(year=today.year - 1)
-        daily_last_year = get_vehicle_data(
-            start_date=last_year.strftime('%Y-%m-%d'),
-            end_date=last_year.strftime('%Y-%m-%d'),
-            database_name=db_name
-        ) or {'summary': {'total_units': 0, 'total_value': 0}}
-        print(f"Data harian {location_name} berhasil diambil")
-        
-        # Get last month's same date data
-        last_month = today.replace(day=1) - timedelta(days=1)
-        last_month = last_month.replace(day=min(today.day, last_month.day))
-        daily_last_month = get_vehicle_data(
-            start_date=last_month.strftime('%Y-%m-%d'),
-            end_date=last_month.strftime('%Y-%m-%d'),
-            database_name=db_name
-        ) or {'summary': {'total_units': 0, 'total_value': 0}}
-        
-        # Get this month's data and last month YTD comparison
-        month_start = today.replace(day=1)
-        monthly_data = get_vehicle_data(
-            start_date=month_start.strftime('%Y-%m-%d'),
-            end_date=today.strftime('%Y-%m-%d'),
-            database_name=db_name
-        ) or {'summary': {'total_units': 0, 'total_value': 0}}
-        
-        # Get last month's YTD data
-        last_month_start = last_month.replace(day=1)
-        last_month_end = last_month
-        monthly_last_month = get_vehicle_data(
-            start_date=last_month_start.strftime('%Y-%m-%d'),
-            end_date=last_month_end.strftime('%Y-%m-%d'),
-            database_name=db_name
-        ) or {'summary': {'total_units': 0, 'total_value': 0}}
-        
-        # Get last year's monthly data
-        last_year_month_start = month_start.replace(year=month_start.year - 1)
-        monthly_last_year = get_vehicle_data(
-            start_date=last_year_month_start.strftime('%Y-%m-%d'),
-            end_date=last_year.strftime('%Y-%m-%d'),
-            database_name=db_name
-        ) or {'summary': {'total_units': 0, 'total_value': 0}}
-        
-        # Get margin data for today
-        daily_margin = get_margin_summary(
-            today.strftime('%Y-%m-%d'),
-            today.strftime('%Y-%m-%d'),
-            db_name
-        )
-        
-        # Get margin data for last year same date
-        daily_margin_last_year = get_margin_summary(
-            last_year.strftime('%Y-%m-%d'),
-            last_year.strftime('%Y-%m-%d'),
-            db_name
-        )
-        
-        # Get margin data for last month same date
-        daily_margin_last_month = get_margin_summary(
-            last_month.strftime('%Y-%m-%d'),
-            last_month.strftime('%Y-%m-%d'),
-            db_name
-        )
-        
-        # Get margin data for this month
-        monthly_margin = get_margin_summary(
-            month_start.strftime('%Y-%m-%d'),
-            today.strftime('%Y-%m-%d'),
-            db_name
-        )
-        
-        # Get margin data for last month YTD
-        monthly_margin_last_month = get_margin_summary(
-            last_month_start.strftime('%Y-%m-%d'),
-            last_month_end.strftime('%Y-%m-%d'),
-            db_name
-        )
+        aggregates = fetch_location_aggregates(db_name, today)
+        print(f"Data penjualan dan margin {location_name} berhasil diambil")
+        if collected is not None:
+            collected[db_name] = aggregates
         
-        # Get margin data for last year monthly
-        monthly_margin_last_year = get_margin_summary(
-            last_year_month_start.strftime('%Y-%m-%d'),
-            last_year.strftime('%Y-%m-%d'),
-            db_name
-        )
-        
-        print(f"Data margin {location_name} berhasil diambil")
-        
-        if all([daily_data, daily_last_year, daily_last_month, monthly_data, monthly_last_month, monthly_last_year]):
-            
-            # Calculate all comparisons
-            daily_yoy = calculate_yoy_changes(daily_data, daily_last_year)
-            daily_mom = calculate_mom_changes(daily_data, daily_last_month)
-            monthly_yoy = calculate_yoy_changes(monthly_data, monthly_last_year)
-            monthly_mom = calculate_mom_changes(monthly_data, monthly_last_month)
-            
-            # Calculate margin comparisons
-            daily_margin_yoy = calculate_margin_changes(daily_margin, daily_margin_last_year)
-            daily_margin_mom = calculate_margin_changes(daily_margin, daily_margin_last_month)
-            monthly_margin_yoy = calculate_margin_changes(monthly_margin, monthly_margin_last_year)
-            monthly_margin_mom = calculate_margin_changes(monthly_margin, monthly_margin_last_month)
-            
-            html_report = create_html_report(
-                daily_data, 
-                None,  # weekly data not used
-                monthly_data,
-                daily_yoy,
-                None,  # weekly yoy not used
-                monthly_yoy,
-                location_name,
-                report_date=today,
-                daily_mom=daily_mom,
-                monthly_mom=monthly_mom,
-                daily_margin=daily_margin,
-                monthly_margin=monthly_margin,
-                daily_margin_yoy=daily_margin_yoy,
-                daily_margin_mom=daily_margin_mom,
-                monthly_margin_yoy=monthly_margin_yoy,
-                monthly_margin_mom=monthly_margin_mom
-            )
-            send_email(
-                f"M2 | {location_name} today, DO: {daily_data['summary']['total_units']}, Margin: {format_currency(daily_margin['total_margin'])}",
-                html_report,
-                recipients
-            )
-            print(f"Laporan {location_name} untuk tanggal {format_date(today)} berhasil dikirim")
-            return True
-        else:
-            print(f"Tidak ada data untuk {location_name} untuk ditampilkan")
-            return False
+        # One model per location; every output format is rendered from it
+        report = build_report_from_aggregates(db_name, location_name, today, aggregates)
+        return deliver_vehicle_report(report, get_recipients(), force)
     
     except Exception as e:
         print(f"Terjadi kesalahan pada {location_name}: {e}")
         print(traceback.format_exc())
         return False
 
-def main(specific_date=None):
+def process_group_report(collected, specific_date=None, force=False):
+    """
+    Send the M2 Group report: the sum of all locations, built from their already fetched aggregates.
+
+    Adds no database queries. Skipped when a location failed before its data was fetched.
+    """
+    if len(collected) != len(LOCATIONS):
+        missing = [location_name for db_name, location_name in LOCATIONS if db_name not in collected]
+        print(f"Laporan {GROUP_LOCATION} dilewati, data tidak lengkap: {', '.join(missing)}")
+        return False
+    try:
+        today = specific_date if specific_date else db_fixtures.now().date()
+        aggregates = merge_location_aggregates([collected[db_name] for db_name, _ in LOCATIONS])
+        report = build_report_from_aggregates(GROUP_DATABASE, GROUP_LOCATION, today, aggregates)
+        return deliver_vehicle_report(report, get_recipients(), force)
+    except Exception as e:
+        print(f"Terjadi kesalahan pada {GROUP_LOCATION}: {e}")
+        print(traceback.format_exc())
+        return False
+
+def main(specific_date=None, force=False):
     """
     Generate and send sales reports for both databases for a specific date or today if no date is provided.
+
+    With GROUP_REPORT=1 (default) an M2 Group report summing both locations is sent after them.
     
     Args:
         specific_date (date, optional): Specific date for the report. Defaults to None (current date).
+        force (bool): Send full reports even when nothing changed since the last delivery
+
+    Returns:
+        bool: True if every report was delivered (sent, queued, skipped or replaced by a notice)
     """
-    # Process data for M2 Madiun
-    process_location_data("honda_mis", "M2 Madiun", specific_date)
-    
-    # Process data for M2 Magetan
-    process_location_data("m2_magetan", "M2 Magetan", specific_date)
+    collected = {}
+    delivered = True
+    try:
+        # Process data for M2 Madiun and M2 Magetan
+        for db_name, location_name in LOCATIONS:
+            with track("location", db_name, location_name):
+                delivered &= process_location_data(db_name, location_name, specific_date, force, collected)
+        if os.getenv("GROUP_REPORT", "1") != "0":
+            with track("location", GROUP_DATABASE, GROUP_LOCATION):
+                delivered &= process_group_report(collected, specific_date, force)
+        return delivered
+    finally:
+        close_transport()
+        print_profile_summary()
+        flush_metrics("vehicle_reporting")
 
 if __name__ == "__main__":
     # Use argparse for command line arguments
     parser = argparse.ArgumentParser(description='Generate and send vehicle sales report')
     parser.add_argument('date', nargs='?', help='Report date in DDMMYYYY format (e.g., 24022025)')
+    parser.add_argument('--force', action='store_true', help='Send the full report even if nothing changed')
     args = parser.parse_args()
     
     try:
@@ -1042,11 +769,15 @@ if __name__ == "__main__":
             year = int(args.date[4:8])
             target_date = date(year, month, day)
             print(f"Mengirim laporan untuk tanggal {day} {['Januari', 'Februari', 'Maret', 'April', 'Mei', 'Juni', 'Juli', 'Agustus', 'September', 'Oktober', 'November', 'Desember'][month-1]} {year}...")
-            main(specific_date=target_date)
+            delivered = main(specific_date=target_date, force=args.force)
         else:
             # Use current date if no date provided
             print("Mengirim laporan untuk hari ini...")
-            main()
+            delivered = main(force=args.force)
+        if not delivered:
+            # Non-zero exit so the scheduler sees the failed delivery
+            print("Selesai, tetapi ada laporan yang gagal dikirim")
+            sys.exit(1)
         print("Selesai!")
     except Exception as e:
         print(f"Error: {e}")